@@ -1,14 +1,14 @@
 from django.contrib import admin
 from django.utils import timezone
 from .models import Agent, Upload
-from .services import process_upload   # 🔥 THIS IMPORT
+from common.jobs import enqueue
 
 
 class AgentAdminModel(admin.ModelAdmin):
     readonly_fields = ('agent_code',)
-    list_display = ['agent_code', 'agent_name', 'agent_surname', 'branch', 'date_joining']
+    list_display = ['agent_code', 'agent_name', 'agent_surname', 'branch', 'date_joining', 'email']
     list_filter = ['agent_code', 'agent_surname', 'branch']
-    search_fields = ['agent_code', 'agent_surname', 'branch']
+    search_fields = ['agent_code', 'agent_surname', 'branch', 'email']
 
     
 
@@ -49,16 +49,17 @@ class UploadAdmin(admin.ModelAdmin):
             upload.approved_at = timezone.now()
             upload.save()
 
-            errors = process_upload(upload)
+            job = enqueue("agents.upload", upload.pk)
 
-            if errors:
+            # only reached with JOBS_RUN_INLINE; otherwise a worker picks it up
+            if job.errors:
                 self.message_user(
                     request,
-                    f"Upload {upload.id} imported with errors:\n" + "\n".join(errors),
+                    f"Upload {upload.id} imported with errors:\n" + "\n".join(job.errors),
                     level="warning"
                 )
 
-        self.message_user(request, "Uploads approved and processed.")
+        self.message_user(request, "Uploads approved and queued for processing.")
 
     @admin.action(description="Reject selected uploads")
     def reject_uploads(self, request, queryset):
@@ -0,0 +1,9 @@
+# agents/jobs.py
+from common.jobs import job_handler, run_upload
+from .models import Upload
+from .services import process_upload
+
+
+@job_handler("agents.upload")
+def process_upload_job(job):
+    return run_upload(job, Upload, process_upload)
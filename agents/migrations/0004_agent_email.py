@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_alter_upload_approved_by_alter_upload_uploaded_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='email',
+            field=models.EmailField(blank=True, max_length=254, null=True),
+        ),
+    ]
@@ -4,6 +4,7 @@ from datetime import date
 from django.db import models, transaction
 from django.utils import timezone
 from .validators import validate_date_joining
+from common.sequences import allocate
 
 
 
@@ -28,20 +29,37 @@ class Agent(models.Model):
 
     date_joining = models.DateField(validators=[validate_date_joining])
 
-    def save(self, *args, **kwargs):
-        if not self.agent_code:
-            last_agent = Agent.objects.order_by('-agent_code').first()
+    # commission statements are emailed here (commissions.emails)
+    email = models.EmailField(max_length=254, null=True, blank=True)
 
-            if last_agent:
-                last_number = int(last_agent.agent_code[1:])  # remove 'A'
-                new_number = last_number + 1
-            else:
-                new_number = 1
+    CODE_SEQUENCE = "agents.agent_code"
 
-            self.agent_code = f"A{new_number:04d}"  # A0001 format
+    @staticmethod
+    def _last_code_number():
+        last_code = Agent.objects.order_by('-agent_code').values_list('agent_code', flat=True).first()
+        return int(last_code[1:]) if last_code else 0  # remove 'A'
 
+    @classmethod
+    def reserve_codes(cls, count):
+        """Reserve `count` agent codes in one round trip (bulk imports)."""
+        numbers = allocate(cls.CODE_SEQUENCE, count, seed=cls._last_code_number)
+        return [f"A{n:04d}" for n in numbers]  # A0001 format
+
+    def save(self, *args, **kwargs):
+        if not self.agent_code:
+            self.agent_code = self.reserve_codes(1)[0]
+
+        renamed = not self._state.adding
+        moved = renamed and Agent.objects.filter(pk=self.pk).exclude(branch=self.branch).exists()
         super().save(*args, **kwargs)
 
+        if moved:  # commission rates depend on the branch: journal the agent's policies
+            from policies.changes import notify_policies_changed
+            notify_policies_changed(self.policies.values_list("pk", flat=True))
+        if renamed:  # names appear on cached commission statements
+            from common.versions import bump, scope
+            bump([scope("agent", self.pk)])
+
     def __str__(self):
         return f"{self.agent_name} {self.agent_surname}"
 
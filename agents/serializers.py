@@ -6,7 +6,7 @@ from .models import Agent, Upload
 class AgentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Agent
-        fields = ['agent_name', 'agent_surname', 'branch', 'date_joining']
+        fields = ['agent_name', 'agent_surname', 'branch', 'date_joining', 'email']
         read_only_fields = ['agent_code']
 
 class UploadSerializer(serializers.ModelSerializer):
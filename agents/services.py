@@ -1,59 +1,65 @@
-import os
-import csv
-import openpyxl
+from common.readers import batched, read_upload_rows
 from .models import Agent
 
-def process_upload(upload):
+BATCH_SIZE = 1000  # rows held in memory at a time
+
+COLUMNS = ("agent_name", "agent_surname", "branch", "date_joining")
+
+def process_upload(upload, progress=None):
     """
     Process an uploaded file (Excel or CSV) and create agents.
+    `progress(rows_done, rows_failed)` is called after each batch.
     Returns a list of errors per row.
     """
     errors = []
-    filename = upload.file.path
-    ext = os.path.splitext(filename)[1].lower()  # get file extension
 
     # Track duplicates within the file
     seen = set()
 
-    if ext in ['.xlsx', '.xls']:
-        # Excel file
-        wb = openpyxl.load_workbook(filename)
-        ws = wb.active
-        rows = list(ws.iter_rows(min_row=2, values_only=True))  # skip header
-    elif ext == '.csv':
-        # CSV file
-        with open(filename, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            rows = list(reader)[1:]  # skip header
-    else:
-        raise ValueError("Unsupported file format. Use Excel or CSV.")
-
-    for i, row in enumerate(rows, start=2):
-        try:
-            if not row or len(row) < 4:
-                raise ValueError("Not enough columns")
-            
-            agent_name, agent_surname, branch, date_joining = row[:4]
-
-            # Detect duplicates in the same file
-            key = (agent_name, agent_surname, branch)
-            if key in seen:
-                raise ValueError("Duplicate agent in file")
-            seen.add(key)
-
-            # Check duplicates in DB
-            if Agent.objects.filter(agent_name=agent_name, agent_surname=agent_surname, branch=branch).exists():
-                raise ValueError("Duplicate agent in database")
-
-            # create agent
-            Agent.objects.create(
-                agent_name=agent_name,
-                agent_surname=agent_surname,
-                branch=branch,
-                date_joining=date_joining
-            )
-
-        except Exception as e:
-            errors.append(f"Row {i}: {str(e)}")
-
-    return errors
+    rows = read_upload_rows(upload.file.path, COLUMNS)
+
+    rows_done = 0
+    for batch in batched(rows, BATCH_SIZE):
+        pending = []  # (row number, unsaved Agent)
+
+        for i, row in batch:
+            try:
+                if not row or len(row) < 4:
+                    raise ValueError("Not enough columns")
+
+                agent_name, agent_surname, branch, date_joining = row[:4]
+
+                # Detect duplicates in the same file
+                key = (agent_name, agent_surname, branch)
+                if key in seen:
+                    raise ValueError("Duplicate agent in file")
+                seen.add(key)
+
+                # Check duplicates in DB
+                if Agent.objects.filter(agent_name=agent_name, agent_surname=agent_surname, branch=branch).exists():
+                    raise ValueError("Duplicate agent in database")
+
+                pending.append((i, Agent(
+                    agent_name=agent_name,
+                    agent_surname=agent_surname,
+                    branch=branch,
+                    date_joining=date_joining
+                )))
+
+            except Exception as e:
+                errors.append((i, str(e)))
+
+        # create agents with codes reserved in one round trip per batch
+        codes = Agent.reserve_codes(len(pending))
+        for (i, agent), code in zip(pending, codes):
+            try:
+                agent.agent_code = code
+                agent.save()
+            except Exception as e:
+                errors.append((i, str(e)))
+
+        rows_done += len(batch)
+        if progress:
+            progress(rows_done, len(errors))
+
+    return [f"Row {i}: {message}" for i, message in sorted(errors)]
@@ -1,6 +1,7 @@
 
 # agents/urls.py
 from django.urls import path, include
+from common.views import JobProgressAPIView
 from rest_framework.routers import DefaultRouter
 
 from .views import (UploadListAllAPIView, UploadListCreateAPIView,
@@ -24,6 +25,8 @@ urlpatterns = [
     path('uploads/', UploadListCreateAPIView.as_view(), name='upload-list-create'),
     path('uploads/<int:pk>/', UploadRetrieveUpdateDestroyAPIView.as_view(), name='upload-detail'),
     path('uploads/<int:pk>/approve/', ApproveUploadAPIView.as_view()),
+    path('uploads/<int:pk>/progress/', JobProgressAPIView.as_view(kind='agents.upload'),
+         name='agents-upload-progress'),
     path('uploads/files/', UploadListAllAPIView.as_view(), name='uploads-all'),
 
     path('export/', AgentExportCSVAPIView.as_view(), name='agents-export'),
@@ -2,6 +2,7 @@
 # agents/views.py
 from django.utils import timezone
 from django.http import HttpResponse
+from django.urls import reverse
 from rest_framework import viewsets, status, filters, permissions, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -12,7 +13,8 @@ from rest_framework.views import APIView
 from .models import Agent, Upload
 from .serializers import AgentSerializer, UploadSerializer, UploadDecisionSerializer
 from .permissions import IsSuperuser
-from .services import process_upload
+from common.jobs import enqueue
+from common.models import JobStatus
 from .resources import AgentResource
 from django.http import HttpResponse
 import csv
@@ -49,29 +51,32 @@ class UploadListCreateAPIView(generics.ListCreateAPIView):
         # 1️⃣ Save the uploaded file first
         upload = serializer.save(uploaded_by=self.request.user)
 
-        # 2️⃣ Process the uploaded file for duplicates / creation
-        errors = process_upload(upload)
-
-        # 3️⃣ Optional: mark upload as rejected if there are errors
-        if errors:
-            upload.is_rejected = True
-            upload.reject_reason = "; ".join(errors)
-            upload.save()
-
-
-        # Store errors in the serializer context so the response can include them
-        self.upload_errors = errors
+        # 2️⃣ Queue the file for processing (duplicates / creation);
+        #    rows with errors mark the upload as rejected
+        self.upload_job = enqueue("agents.upload", upload.pk, reject_on_errors=True)
 
     def create(self, request, *args, **kwargs):
         # Call the default create
         response = super().create(request, *args, **kwargs)
 
-        # Add process_upload errors to response if any
-        errors = getattr(self, 'upload_errors', [])
-        if errors:
+        job = self.upload_job
+        response.data['job_id'] = job.pk
+        response.data['progress_url'] = request.build_absolute_uri(
+            reverse('agents-upload-progress', args=[response.data['id']])
+        )
+
+        # Jobs run inline (JOBS_RUN_INLINE) have already finished
+        if job.status == JobStatus.QUEUED:
+            response.data['status'] = 'queued'
+            response.data['message'] = 'File uploaded and queued for processing.'
+        elif job.status == JobStatus.FAILED:
+            response.data['status'] = 'failed'
+            response.data['message'] = 'The file could not be processed.'
+            response.data['errors'] = job.errors
+        elif job.errors:
             response.data['status'] = 'partial_failure'
             response.data['message'] = 'Some rows were not imported due to errors.'
-            response.data['errors'] = errors
+            response.data['errors'] = job.errors
         else:
             response.data['status'] = 'success'
             response.data['message'] = 'File uploaded successfully.'
@@ -1,14 +1,20 @@
 
 # billing/admin.py
 from datetime import date
-from io import BytesIO, StringIO
-import csv
+from decimal import Decimal
+from itertools import chain
 
 from django.contrib import admin
 from django.http import HttpResponse
 from django.utils.html import format_html
 
 from billing.models import BillingRecord
+from billing.services import billing_statement
+from common import statement_cache
+from common.exports import STREAM_CHUNK_SIZE, streaming_csv_response
+from common.statements import render_statement
+
+STATEMENT_EXPORTS = ("json", "csv", "pdf")
 
 
 @admin.register(BillingRecord)
@@ -45,7 +51,7 @@ class BillingRecordAdmin(admin.ModelAdmin):
     )
 
     # Useful admin actions
-    actions = ["export_selected_to_csv", "export_selected_to_pdf"]
+    actions = ["export_selected_to_csv", "export_selected_to_pdf", "prewarm_statements"]
 
     # ---- display helpers (avoid nested attribute errors) ----
     def contract_id(self, obj: BillingRecord):
@@ -91,63 +97,61 @@ class BillingRecordAdmin(admin.ModelAdmin):
     contract_premium.short_description = "Contract Premium"
 
     # ---- CSV/PDF exports as admin actions ----
-    def _rows_from_queryset(self, queryset):
+    def _iter_rows_from_queryset(self, queryset):
         """
-        Build export rows matching your statement layout.
+        Yield export rows matching your statement layout, reading the
+        records through a server-side cursor.
         """
-        rows = []
-        total = 0.0
-
-        for br in queryset.select_related("policy", "policy__client", "policy__paypoint"):
+        records = (queryset
+                   .select_related("policy", "policy__client", "policy__paypoint")
+                   .iterator(chunk_size=STREAM_CHUNK_SIZE))
+        for br in records:
             p = br.policy
             if not p:
                 # Skip records missing policy
                 continue
 
-            status_label = p.overall_policy_status or ""
-            premium = float(p.contract_premium or 0.0)
-            total += premium
-
-            rows.append({
+            yield {
                 "contract_id": p.contract_id,
                 "client_name": str(p.client) if p.client_id else "",
-                "status": status_label,
-                "contract_premium": premium,
+                "status": p.overall_policy_status or "",
+                "contract_premium": p.contract_premium or Decimal("0.00"),
                 "billing_month": br.billing_month,
                 "paypoint": str(p.paypoint) if p.paypoint_id else "",
-            })
+            }
 
-        return rows, total
+    def _rows_from_queryset(self, queryset):
+        """
+        Build export rows matching your statement layout.
+        """
+        rows = list(self._iter_rows_from_queryset(queryset))
+        return rows, sum((r["contract_premium"] for r in rows), Decimal("0.00"))
 
     def export_selected_to_csv(self, request, queryset):
         """
-        Admin action: Export selected BillingRecord rows to CSV.
+        Admin action: Export selected BillingRecord rows to CSV, streamed.
         """
-        rows, total = self._rows_from_queryset(queryset)
+        rows = self._iter_rows_from_queryset(queryset)
+        first = next(rows, None)
         # If multiple paypoints/months are mixed, just pick first labels for header
-        paypoint_label = rows[0]["paypoint"] if rows else "(mixed)"
-        month_label = rows[0]["billing_month"].strftime("%b-%y") if rows and rows[0]["billing_month"] else ""
-
-        buf = StringIO()
-        w = csv.writer(buf)
-
-        w.writerow(["Pay point name", paypoint_label])
-        w.writerow(["billing Month", month_label])
-        w.writerow([])
-        w.writerow(["List of clients"])
-        w.writerow(["Contract_id", "Client_name", "Status", "Contract Premium"])
-        for r in rows:
-            w.writerow([r["contract_id"], r["client_name"], r["status"], r["contract_premium"]])
-        w.writerow([])
-        w.writerow(["Total", "", "", total])
-
-        csv_data = buf.getvalue()
-        buf.close()
+        paypoint_label = first["paypoint"] if first else "(mixed)"
+        month_label = first["billing_month"].strftime("%b-%y") if first and first["billing_month"] else ""
+
+        def lines():
+            yield ["Pay point name", paypoint_label]
+            yield ["billing Month", month_label]
+            yield []
+            yield ["List of clients"]
+            yield ["Contract_id", "Client_name", "Status", "Contract Premium"]
+            total = Decimal("0.00")
+            for r in chain([first] if first else [], rows):
+                total += r["contract_premium"]
+                yield [r["contract_id"], r["client_name"], r["status"], r["contract_premium"]]
+            yield []
+            yield ["Total", "", "", total]
 
         filename = f"billing_{paypoint_label}_{month_label}.csv".replace(" ", "_").lower()
-        response = HttpResponse(csv_data, content_type="text/csv")
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-        return response
+        return streaming_csv_response(lines(), filename)
 
     export_selected_to_csv.short_description = "Export selected to CSV"
 
@@ -155,58 +159,15 @@ class BillingRecordAdmin(admin.ModelAdmin):
         """
         Admin action: Export selected BillingRecord rows to PDF (reportlab).
         """
-        try:
-            from reportlab.lib import colors
-            from reportlab.lib.pagesizes import A4
-            from reportlab.lib.styles import getSampleStyleSheet
-            from reportlab.lib.units import mm
-            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        except Exception:
-            self.message_user(request, "PDF export requires 'reportlab'. Install: pip install reportlab", level="error")
-            return None
-
         rows, total = self._rows_from_queryset(queryset)
         paypoint_label = rows[0]["paypoint"] if rows else "(mixed)"
         month_label = rows[0]["billing_month"].strftime("%b-%y") if rows and rows[0]["billing_month"] else ""
 
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(
-            buffer, pagesize=A4,
-            leftMargin=16 * mm, rightMargin=16 * mm, topMargin=16 * mm, bottomMargin=16 * mm
-        )
-        styles = getSampleStyleSheet()
-        elems = []
-
-        title = Paragraph("<b>Billing Statement</b>", styles["Title"])
-        header1 = Paragraph(f"<b>Pay point name:</b> {paypoint_label}", styles["Normal"])
-        header2 = Paragraph(f"<b>Billing Month:</b> {month_label}", styles["Normal"])
-
-        elems.extend([title, Spacer(1, 6), header1, header2, Spacer(1, 10)])
-
-        data = [["Contract_id", "Client_name", "Status", "Contract Premium"]]
-        for r in rows:
-            data.append([r["contract_id"], r["client_name"], r["status"], r["contract_premium"]])
-        data.append(["", "", "", ""])
-        data.append(["Total", "", "", f"{total}"])
-
-        table = Table(data, hAlign="LEFT")
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#DFF0D8")),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("ALIGN", (3, 1), (3, -1), "RIGHT"),
-            ("BACKGROUND", (0, -1), (-1, -1), colors.HexColor("#F5F5F5")),
-        ]))
-
-        elems.append(Paragraph("<b>List of clients</b>", styles["Heading3"]))
-        elems.append(Spacer(1, 4))
-        elems.append(table)
-
-        doc.build(elems)
-
-        pdf_bytes = buffer.getvalue()
-        buffer.close()
+        try:
+            pdf_bytes = render_statement(billing_statement(paypoint_label, month_label, rows, total))
+        except ImportError:
+            self.message_user(request, "PDF export requires 'reportlab'. Install: pip install reportlab", level="error")
+            return None
 
         filename = f"billing_{paypoint_label}_{month_label}.pdf".replace(" ", "_").lower()
         response = HttpResponse(pdf_bytes, content_type="application/pdf")
@@ -214,3 +175,39 @@ class BillingRecordAdmin(admin.ModelAdmin):
         return response
 
     export_selected_to_pdf.short_description = "Export selected to PDF"
+
+    def prewarm_statements(self, request, queryset):
+        """
+        Admin action: build and cache the JSON/CSV/PDF statements of each
+        (paypoint, month) among the selected records, as served by
+        /billing-records/statement/?paypoint_id=...
+        """
+        from billing.views import BillingRecordViewSet
+        from policies.models import Policy
+
+        pairs = (queryset.order_by()
+                 .values_list("policy__paypoint_id", "billing_month")
+                 .distinct())
+        view = BillingRecordViewSet()
+        built = cached = 0
+        for paypoint_id, billing_month in pairs:
+            if paypoint_id is None:
+                continue
+            policies_qs = (Policy.objects.select_related("client", "paypoint")
+                           .filter(paypoint_id=paypoint_id).order_by("contract_id"))
+            for export in STATEMENT_EXPORTS:
+                entry = view.statement_cache_entry(
+                    policies_qs, [paypoint_id], f"id:{paypoint_id}", billing_month, export)
+                if statement_cache.warm(*entry):
+                    built += 1
+                else:
+                    cached += 1
+
+        counts = statement_cache.stats(["billing"])["billing"]
+        self.message_user(
+            request,
+            f"Statements pre-warmed: {built} built, {cached} already cached "
+            f"(cache hits {counts['hit']}, misses {counts['miss']}).",
+        )
+
+    prewarm_statements.short_description = "Pre-warm statement cache for selected paypoints/months"
@@ -0,0 +1,35 @@
+# billing/jobs.py
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from common.jobs import job_handler, job_month, report_progress
+from common.models import Job
+from .services import ZIP_FORMATS, write_statements_zip
+
+
+def statements_zip_name(job):
+    return f"statements/billing_statements_{job_month(job):%b-%y}_{job.pk}.zip".lower()
+
+
+@job_handler("billing.statements_zip")
+def statements_zip_job(job):
+    """
+    Write job.object_id's month (YYYYMM) statements ZIP to default_storage,
+    for payload formats and paypoint_ids (all paypoints when empty). The
+    stored name is kept in payload["file"]; progress counts paypoints.
+    """
+    with tempfile.TemporaryFile() as archive:
+        write_statements_zip(
+            archive, job_month(job),
+            formats=job.payload.get("formats", list(ZIP_FORMATS)),
+            paypoint_ids=job.payload.get("paypoint_ids"),
+            workers=job.payload.get("workers", settings.STATEMENT_ZIP_WORKERS),
+            progress=lambda done, total: report_progress(job, done, 0, total),
+        )
+        archive.seek(0)
+        job.payload["file"] = default_storage.save(statements_zip_name(job), File(archive))
+    Job.objects.filter(pk=job.pk).update(payload=job.payload)
+    return []
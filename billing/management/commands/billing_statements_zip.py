@@ -0,0 +1,44 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.services import ZIP_FORMATS, write_statements_zip
+
+
+class Command(BaseCommand):
+    help = "Write a ZIP of every paypoint's billing statement for a month, with a manifest."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Billing month as YYYY-MM (default: this month).")
+        parser.add_argument("--output", help="ZIP path (default: billing_statements_<mon-yy>.zip).")
+        parser.add_argument("--format", nargs="+", choices=ZIP_FORMATS, default=list(ZIP_FORMATS),
+                            dest="formats", help="Statement formats (default: csv pdf).")
+        parser.add_argument("--paypoint", type=int, action="append", dest="paypoints",
+                            help="Only this paypoint id (repeatable).")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Processes rendering PDFs (default 1).")
+
+    def handle(self, *args, **options):
+        month = date.today().replace(day=1)
+        if options["month"]:
+            try:
+                year, mon = map(int, options["month"].split("-")[:2])
+                month = date(year, mon, 1)
+            except ValueError:
+                raise CommandError("Invalid --month. Use YYYY-MM.")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        output = options["output"] or f"billing_statements_{month:%b-%y}.zip".lower()
+        started = time.perf_counter()
+        with open(output, "wb") as f:
+            manifest = write_statements_zip(f, month, formats=options["formats"],
+                                            paypoint_ids=options["paypoints"], workers=options["workers"])
+
+        with_rows = [m for m in manifest if m["clients"]]
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output}: {len(with_rows)} of {len(manifest)} paypoints with statements, "
+            f"{sum(m['clients'] for m in manifest)} clients, "
+            f"total {sum(m['total'] for m in manifest):.2f}, in {time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,49 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.services import GENERATE_CHUNK_SIZE, generate_billing
+from paypoints.models import Paypoint
+
+
+class Command(BaseCommand):
+    help = "Create BillingRecord rows for every billable policy in a month, per paypoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Billing month as YYYY-MM (default: this month).")
+        parser.add_argument("--paypoint", type=int, action="append", dest="paypoints",
+                            help="Only this paypoint id (repeatable).")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Worker processes; paypoints are split across them (default 1).")
+        parser.add_argument("--chunk-size", type=int, default=GENERATE_CHUNK_SIZE,
+                            help=f"Rows per INSERT (default {GENERATE_CHUNK_SIZE}).")
+
+    def handle(self, *args, **options):
+        month = date.today().replace(day=1)
+        if options["month"]:
+            try:
+                year, mon = map(int, options["month"].split("-")[:2])
+                month = date(year, mon, 1)
+            except ValueError:
+                raise CommandError("Invalid --month. Use YYYY-MM.")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        names = dict(Paypoint.objects.values_list("pk", "paypoint_name"))
+
+        def report(result):
+            self.stdout.write(
+                f"  {names.get(result['paypoint_id'], result['paypoint_id'])}: "
+                f"{result['created']} created / {result['billable']} billable "
+                f"in {result['seconds']:.3f}s"
+            )
+
+        result = generate_billing(
+            month, paypoint_ids=options["paypoints"], workers=options["workers"],
+            chunk_size=options["chunk_size"], on_paypoint=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Billing {result['month']:%Y-%m}: {result['created']} records created for "
+            f"{result['billable']} billable policies across {result['paypoints']} paypoints "
+            f"in {result['seconds']:.2f}s."
+        ))
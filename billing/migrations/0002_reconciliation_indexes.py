@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0001_initial'),
+        ('policies', '0007_policysnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='billingrecord',
+            index=models.Index(fields=['billing_month'], name='billing_bil_billing_a488cd_idx'),
+        ),
+    ]
@@ -17,6 +17,7 @@ class BillingRecord(models.Model):
 
     class Meta:
         unique_together = ("policy", "billing_month")
+        indexes = [models.Index(fields=["billing_month"])]  # per-month scans across policies
         ordering = ["policy__contract_id"]
 
     def __str__(self):
@@ -11,3 +11,8 @@ class BillingRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = BillingRecord
         fields = ["id", "billing_month", "contract_id", "client_name", "policy_status"]
+
+
+class ActiveBillingRecordSerializer(BillingRecordSerializer):
+    # The queryset only holds 'Active' policies; not recomputed per record
+    policy_status = serializers.CharField(source="overall_status", read_only=True)
@@ -0,0 +1,479 @@
+# billing/services.py
+import csv
+import io
+import time as time_module
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import connections
+from django.db.models import Count, DecimalField, Exists, F, Func, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Sign
+from django.utils import timezone
+
+from common.exports import STREAM_CHUNK_SIZE
+from common.statements import Statement, iter_rendered_statements
+from common.readers import batched
+from common.workers import init_worker
+
+
+def approved_claim_dates(policies):
+    """
+    {policy_id: date} of each policy's first approved claim, in one query.
+    Mirrors Policy.claim_effective_date.
+    """
+    Claim = apps.get_model("claims", "Claim")
+    dates = {}
+    rows = (Claim.objects
+            .filter(policy__in=policies.values("pk"), status="APPROVED")
+            .order_by("policy_id", "pk")
+            .values_list("policy_id", "approved_at"))
+    for policy_id, approved_at in rows:
+        if policy_id not in dates:
+            dates[policy_id] = timezone.localdate(approved_at) if approved_at else None
+    return dates
+
+
+def cancellation_effective_dates(policies):
+    """
+    {policy_id: effective_date} of the policies' cancellation requests
+    (any status), in one query. Mirrors Policy.cancellation_effective_date.
+    """
+    CancellationRequest = apps.get_model("cancellations", "CancellationRequest")
+    return dict(
+        CancellationRequest.objects
+        .filter(policy__in=policies.values("pk"))
+        .values_list("policy_id", "effective_date")
+    )
+
+
+def status_in_month(policy, month_start: date, month_end: date,
+                    claim_effective=None, cancel_effective=None):
+    """
+    Return 'Active' or 'proposal accepted' for the target month; None to exclude.
+    Rules:
+      - Exclude if claim/cancellation effective on/before month_end.
+      - Exclude if policy starts after month_end.
+      - If it's the inception month and <1 period paid and no arrears, mark 'proposal accepted'.
+      - Otherwise mark 'Active'.
+    The claim and cancellation dates are passed in (see statement_rows) so
+    no queries are made per policy.
+    """
+    if claim_effective and claim_effective <= month_end:
+        return None
+
+    if cancel_effective and cancel_effective <= month_end:
+        return None
+
+    if policy.start_date and policy.start_date > month_end:
+        return None
+
+    # inception month?
+    if policy.start_date:
+        start_m = date(policy.start_date.year, policy.start_date.month, 1)
+        if start_m == month_start:
+            try:
+                if (policy.months_paid or 0) < 1 and (policy.months_in_arrears or 0) <= 0:
+                    return "proposal accepted"
+            except Exception:
+                return "proposal accepted"
+
+    return "Active"
+
+
+def statement_rows(policies, month_start: date, month_end: date):
+    """
+    Yield (policy, row) for each policy billable in the month, row being the
+    statement line dict. Runs a fixed number of queries whatever the number
+    of policies: one each for claim dates, cancellation dates and policies,
+    the latter read through a server-side cursor in chunks.
+    """
+    claim_dates = approved_claim_dates(policies)
+    cancel_dates = cancellation_effective_dates(policies)
+
+    for p in policies.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        status_label = status_in_month(
+            p, month_start, month_end,
+            claim_effective=claim_dates.get(p.pk),
+            cancel_effective=cancel_dates.get(p.pk),
+        )
+        if status_label not in ("Active", "proposal accepted"):
+            continue
+
+        yield p, {
+            "contract_id": p.contract_id,
+            "client_name": str(p.client) if p.client_id else "",
+            "status": status_label,
+            "contract_premium": p.contract_premium or Decimal("0.00"),
+        }
+
+
+def statement_csv_lines(paypoint_label, month_label, rows):
+    """
+    Statement CSV lines for statement rows (dicts as above). `rows` may be
+    a generator; the total is accumulated and written last.
+    """
+    yield ["Pay point name", paypoint_label]
+    yield ["billing Month", month_label]
+    yield []
+    yield ["List of clients"]
+    yield ["Contract_id", "Client_name", "Status", "Contract Premium"]
+    total = Decimal("0.00")
+    for r in rows:
+        total += r["contract_premium"]
+        yield [r["contract_id"], r["client_name"], r["status"], r["contract_premium"]]
+    yield []
+    yield ["Total", "", "", total]
+
+
+def billing_statement(paypoint_label, month_label, rows, total):
+    """common.statements.Statement for the PDF of statement rows (dicts as above)."""
+    return Statement(
+        layout="billing",
+        header=[("Pay point name", paypoint_label), ("Billing Month", month_label)],
+        rows=[[r["contract_id"], r["client_name"], r["status"], r["contract_premium"]] for r in rows],
+        totals={3: total},
+    )
+
+
+# -------------------------------------------------
+# Monthly billing run
+# -------------------------------------------------
+GENERATE_CHUNK_SIZE = 2000  # BillingRecord rows per INSERT
+
+
+def month_bounds(month_start: date):
+    """Return (start, end) for the month."""
+    if month_start.month == 12:
+        next_month_start = date(month_start.year + 1, 1, 1)
+    else:
+        next_month_start = date(month_start.year, month_start.month + 1, 1)
+    return month_start, next_month_start - timedelta(days=1)
+
+
+def billable_policies(month_start: date):
+    """
+    Policies billable in the month, as one queryset: the statement rules of
+    status_in_month ('Active' or 'proposal accepted') expressed in SQL.
+    """
+    Claim = apps.get_model("claims", "Claim")
+    Policy = apps.get_model("policies", "Policy")
+    month_start, month_end = month_bounds(month_start)
+    # the claim's local date <= month_end, as claim_effective_date takes it
+    next_month = timezone.make_aware(datetime.combine(month_end + timedelta(days=1), time.min))
+
+    first_claim_at = (Claim.objects
+                      .filter(policy=OuterRef("pk"), status="APPROVED")
+                      .order_by("pk")
+                      .values("approved_at")[:1])
+    return (Policy.objects
+            .filter(start_date__lte=month_end)
+            .annotate(first_claim_at=Subquery(first_claim_at))
+            .filter(Q(first_claim_at__isnull=True) | Q(first_claim_at__gte=next_month))
+            .exclude(cancellation_request__effective_date__lte=month_end))
+
+
+def generate_paypoint_billing(paypoint_id, month_start: date, chunk_size=GENERATE_CHUNK_SIZE):
+    """
+    Create the month's BillingRecord rows for one paypoint's billable
+    policies. Existing rows are left alone (ignore_conflicts), so re-running
+    a month is safe. Returns a dict with counts and timing.
+    """
+    BillingRecord = apps.get_model("billing", "BillingRecord")
+    started = time_module.perf_counter()
+    existing = BillingRecord.objects.filter(billing_month=month_start, policy__paypoint_id=paypoint_id)
+    before = existing.count()
+
+    policy_ids = (billable_policies(month_start)
+                  .filter(paypoint_id=paypoint_id)
+                  .order_by("pk")
+                  .values_list("pk", flat=True)
+                  .iterator(chunk_size=chunk_size))
+    billable = 0
+    for chunk in batched(policy_ids, chunk_size):
+        billable += len(chunk)
+        BillingRecord.objects.bulk_create(
+            [BillingRecord(policy_id=pk, billing_month=month_start) for pk in chunk],
+            ignore_conflicts=True,
+        )
+
+    return {
+        "paypoint_id": paypoint_id,
+        "billable": billable,
+        "created": existing.count() - before,
+        "seconds": time_module.perf_counter() - started,
+    }
+
+
+def generate_billing(month_start: date, paypoint_ids=None, workers=1,
+                     chunk_size=GENERATE_CHUNK_SIZE, on_paypoint=None):
+    """
+    Generate BillingRecord rows for every billable policy in the month,
+    paypoint by paypoint. With workers > 1 the paypoints are spread over a
+    process pool. `on_paypoint(result)` is called as each paypoint finishes.
+    """
+    Paypoint = apps.get_model("paypoints", "Paypoint")
+    started = time_module.perf_counter()
+    month_start = date(month_start.year, month_start.month, 1)
+
+    paypoints = Paypoint.objects.order_by("pk")
+    if paypoint_ids:
+        paypoints = paypoints.filter(pk__in=paypoint_ids)
+    paypoint_ids = list(paypoints.values_list("pk", flat=True))
+
+    results = []
+
+    def finished(result):
+        results.append(result)
+        if on_paypoint:
+            on_paypoint(result)
+
+    if workers > 1 and len(paypoint_ids) > 1:
+        # forked workers must open their own database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            futures = [pool.submit(generate_paypoint_billing, pk, month_start, chunk_size)
+                       for pk in paypoint_ids]
+            for future in as_completed(futures):
+                finished(future.result())
+    else:
+        for pk in paypoint_ids:
+            finished(generate_paypoint_billing(pk, month_start, chunk_size))
+
+    return {
+        "month": month_start,
+        "paypoints": len(results),
+        "billable": sum(r["billable"] for r in results),
+        "created": sum(r["created"] for r in results),
+        "seconds": time_module.perf_counter() - started,
+    }
+
+
+# -------------------------------------------------
+# Month-end ZIP of every paypoint's statement
+# -------------------------------------------------
+ZIP_FORMATS = ("csv", "pdf")
+
+
+def statement_filename(paypoint, month_label, ext):
+    return f"billing_{paypoint.paypoint_code}_{month_label}.{ext}".replace(" ", "_").lower()
+
+
+def write_statements_zip(fileobj, month_start: date, formats=ZIP_FORMATS, paypoint_ids=None, workers=1,
+                         progress=None):
+    """
+    Write a ZIP holding each paypoint's billing statement for the month, as
+    CSV and/or PDF, plus a manifest.csv of clients and totals per paypoint.
+
+    Statement rows are read here, paypoint by paypoint. CSVs are streamed
+    straight into the archive. PDFs are rendered in a pool of `workers`
+    processes (common.statements.iter_rendered_statements) and written as
+    each one finishes, so only a few are held in memory at a time.
+    Paypoints with no billable policies get no files, only a manifest line.
+    `progress(paypoints_done, paypoints_total)` is called as each paypoint's
+    rows have been read. Returns the manifest rows.
+    """
+    Paypoint = apps.get_model("paypoints", "Paypoint")
+    Policy = apps.get_model("policies", "Policy")
+    month_start, month_end = month_bounds(month_start)
+    month_label = month_start.strftime("%b-%y")
+
+    paypoints = Paypoint.objects.order_by("paypoint_name", "pk")
+    if paypoint_ids:
+        paypoints = paypoints.filter(pk__in=paypoint_ids)
+
+    manifest = []
+    paypoints_total = paypoints.count() if progress else 0
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as archive:
+
+        def statements():
+            for paypoint in paypoints.iterator():
+                policies = (Policy.objects.select_related("client", "paypoint")
+                            .filter(paypoint=paypoint).order_by("contract_id"))
+                rows = [row for _, row in statement_rows(policies, month_start, month_end)]
+                total = sum((r["contract_premium"] for r in rows), Decimal("0.00"))
+                files = [statement_filename(paypoint, month_label, ext) for ext in formats] if rows else []
+                manifest.append({"paypoint_code": paypoint.paypoint_code, "paypoint_name": paypoint.paypoint_name,
+                                 "clients": len(rows), "total": total, "files": files})
+                if progress:
+                    progress(len(manifest), paypoints_total)
+                if not rows:
+                    continue
+                if "csv" in formats:
+                    with archive.open(statement_filename(paypoint, month_label, "csv"), "w") as raw:
+                        out = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+                        csv.writer(out).writerows(statement_csv_lines(paypoint.paypoint_name, month_label, rows))
+                        out.flush()
+                        out.detach()
+                if "pdf" in formats:
+                    pdf_name = statement_filename(paypoint, month_label, "pdf")
+                    yield pdf_name, billing_statement(paypoint.paypoint_name, month_label, rows, total)
+
+        for name, pdf in iter_rendered_statements(statements(), workers=workers):
+            archive.writestr(name, pdf, compress_type=zipfile.ZIP_STORED)  # PDFs are already compressed
+
+        with archive.open("manifest.csv", "w") as raw:
+            out = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+            writer = csv.writer(out)
+            writer.writerow(["Billing Month", month_label])
+            writer.writerow(["Paypoint code", "Paypoint name", "Clients", "Total premium", "Files"])
+            for m in manifest:
+                writer.writerow([m["paypoint_code"], m["paypoint_name"], m["clients"], m["total"], " ".join(m["files"])])
+            writer.writerow(["Total", "", sum(m["clients"] for m in manifest), sum((m["total"] for m in manifest), Decimal("0.00")), ""])
+            out.flush()
+            out.detach()
+    return manifest
+
+
+# -------------------------------------------------
+# Billing vs collections reconciliation
+# -------------------------------------------------
+ZERO = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _month_datetimes(month_start: date):
+    """[start, end) of the month as aware datetimes in the current time zone."""
+    _, month_end = month_bounds(month_start)
+    return (timezone.make_aware(datetime.combine(month_start, time.min)),
+            timezone.make_aware(datetime.combine(month_end + timedelta(days=1), time.min)))
+
+
+def _months(month_from: date, month_to: date):
+    month = month_from
+    while month <= month_to:
+        yield month
+        month = month_bounds(month)[1] + timedelta(days=1)
+
+
+def _billed_with_receipts(month_start: date):
+    """
+    The month's BillingRecords annotated with `premium` (the billed amount,
+    as on the statement) and `received` (the policy's receipts dated in the
+    month). The receipt sum is a range lookup on (policy, date_received).
+    """
+    BillingRecord = apps.get_model("billing", "BillingRecord")
+    PremiumReceipt = apps.get_model("receipts", "PremiumReceipt")
+    start, end = _month_datetimes(month_start)
+
+    received = (PremiumReceipt.objects
+                .filter(policy=OuterRef("policy_id"), date_received__gte=start, date_received__lt=end)
+                .order_by()
+                .annotate(total=Func(F("amount_received"), function="SUM"))  # no GROUP BY
+                .values("total"))
+    return (BillingRecord.objects
+            .filter(billing_month=month_start)
+            .annotate(premium=Coalesce(F("policy__contract_premium"), ZERO),
+                      received=Coalesce(Subquery(received), ZERO)))
+
+
+def _unbilled_receipts(month_start: date):
+    """Receipts dated in the month for policies that were not billed for it."""
+    BillingRecord = apps.get_model("billing", "BillingRecord")
+    PremiumReceipt = apps.get_model("receipts", "PremiumReceipt")
+    start, end = _month_datetimes(month_start)
+
+    billed = BillingRecord.objects.filter(policy=OuterRef("policy_id"), billing_month=month_start)
+    return (PremiumReceipt.objects
+            .filter(date_received__gte=start, date_received__lt=end)
+            .filter(~Exists(billed)))
+
+
+def reconciliation(month_from: date, month_to: date, paypoint_ids=None):
+    """
+    Billed versus receipted, per paypoint and month, from two grouped
+    queries per month (plus one for paypoint names):
+
+      billed_count / billed_amount   BillingRecords and their premiums
+      receipted_amount               receipts dated in the month for those policies
+      short_paid_* / over_paid_*     billed policies receipted below / above premium
+      unbilled_receipts_*            receipts in the month for policies not billed then
+
+    Rows are sorted by paypoint name, then month.
+    """
+    Paypoint = apps.get_model("paypoints", "Paypoint")
+    groups = {}
+
+    def group(paypoint_id, month):
+        return groups.setdefault((paypoint_id, month), {
+            "paypoint_id": paypoint_id,
+            "billing_month": month,
+            "billed_count": 0, "billed_amount": Decimal("0.00"),
+            "receipted_amount": Decimal("0.00"),
+            "short_paid_count": 0, "short_paid_amount": Decimal("0.00"),
+            "over_paid_count": 0, "over_paid_amount": Decimal("0.00"),
+            "unbilled_receipts_count": 0, "unbilled_receipts_amount": Decimal("0.00"),
+        })
+
+    for month in _months(month_from, month_to):
+        billed, unbilled = _billed_with_receipts(month), _unbilled_receipts(month)
+        if paypoint_ids is not None:
+            billed = billed.filter(policy__paypoint_id__in=paypoint_ids)
+            unbilled = unbilled.filter(policy__paypoint_id__in=paypoint_ids)
+
+        # one row per paypoint and payment state (-1 short, 0 exact, 1 over),
+        # so each record's receipt sum is compared only once
+        for row in (billed.order_by()
+                    .annotate(state=Sign(F("received") - F("premium")))
+                    .values("policy__paypoint_id", "state")
+                    .annotate(count=Count("pk"), billed=Sum("premium"), received=Sum("received"))):
+            g = group(row["policy__paypoint_id"], month)
+            g["billed_count"] += row["count"]
+            g["billed_amount"] += row["billed"]
+            g["receipted_amount"] += row["received"]
+            if row["state"]:
+                state = "short_paid" if row["state"] < 0 else "over_paid"
+                g[f"{state}_count"] = row["count"]
+                g[f"{state}_amount"] = abs(row["received"] - row["billed"])
+
+        for row in (unbilled.order_by()
+                    .values("policy__paypoint_id")
+                    .annotate(count=Count("pk"), amount=Sum("amount_received"))):
+            g = group(row["policy__paypoint_id"], month)
+            g["unbilled_receipts_count"], g["unbilled_receipts_amount"] = row["count"], row["amount"]
+
+    names = dict(Paypoint.objects.filter(pk__in={pk for pk, _ in groups})
+                 .values_list("pk", "paypoint_name"))
+    rows = []
+    for g in groups.values():
+        g["paypoint_name"] = names.get(g["paypoint_id"], "")
+        g["difference"] = g["receipted_amount"] + g["unbilled_receipts_amount"] - g["billed_amount"]
+        rows.append(g)
+    rows.sort(key=lambda g: (g["paypoint_name"].casefold(), g["paypoint_id"] or 0, g["billing_month"]))
+    return rows
+
+
+def reconciliation_details(paypoint_id, month_start: date):
+    """
+    The policies behind one paypoint/month's reconciliation figures:
+    (mismatched, unbilled) lists of dicts, short/over-paid billed policies
+    and receipts for policies that were not billed.
+    """
+    mismatched = (_billed_with_receipts(month_start)
+                  .filter(policy__paypoint_id=paypoint_id)
+                  .exclude(received=F("premium"))
+                  .order_by("policy__contract_id")
+                  .values("policy__contract_id", "policy__client__client_name",
+                          "policy__client__client_surname", "premium", "received"))
+    unbilled = (_unbilled_receipts(month_start)
+                .filter(policy__paypoint_id=paypoint_id)
+                .order_by("date_received", "pk")
+                .values("receipt_number", "policy__contract_id", "amount_received", "date_received"))
+
+    return (
+        [{
+            "contract_id": r["policy__contract_id"],
+            "client_name": f"{r['policy__client__client_name']} {r['policy__client__client_surname']}".strip(),
+            "billed": r["premium"],
+            "received": r["received"],
+            "difference": r["received"] - r["premium"],
+            "status": "short paid" if r["received"] < r["premium"] else "over paid",
+        } for r in mismatched],
+        [{
+            "receipt_number": r["receipt_number"],
+            "contract_id": r["policy__contract_id"],
+            "amount": r["amount_received"],
+            "date_received": r["date_received"],
+        } for r in unbilled],
+    )
@@ -1,3 +1,447 @@
-from django.test import TestCase
+from datetime import date
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from access.models import Administrator
+from agents.models import Agent
+from clients.models import Client
+from paypoints.models import Paypoint
+from policies.models import Policy
+
+
+class StatementFixtures:
+    """A paypoint whose policies can be multiplied for query-count tests."""
+
+    def setUp(self):
+        cache.clear()  # statement responses are cached across requests
+        self.user = Administrator.objects.create_user(email="billing@test.com", password="pass123")
+        self.agent = Agent.objects.create(agent_name="Tendai", agent_surname="Moyo",
+                                          branch="HARARE", date_joining=date(2020, 1, 1))
+        self.paypoint = Paypoint.objects.create(paypoint_code="ppsbill", paypoint_name="Billing Co",
+                                                date_joined=date(2020, 1, 1))
+        self.count = 0
+
+    def make_policies(self, n, start=date(2024, 1, 1)):
+        policies = []
+        for _ in range(n):
+            self.count += 1
+            client = Client.objects.create(
+                client_name=f"Client{self.count}", client_surname="Bill",
+                id_number=f"{self.count:02d}-{self.count:06d}A{self.count % 100:02d}",
+                dob=date(1990, 1, 1), email=f"bill{self.count}@test.com", phone_number="0771234567",
+            )
+            policies.append(Policy.objects.create(
+                product_name="FUNERAL", proposal_sign_date=date(2023, 12, 1), start_date=start,
+                agent=self.agent, paypoint=self.paypoint, client=client, frequency="M", cover=1000,
+                current_month=date(2024, 7, 1),
+            ))
+        return policies
+
+    def approve_claim(self, policy):
+        from django.utils import timezone
+        from claims.models import Claim, ClaimStatus
+
+        claim = Claim.objects.create(policy=policy, account_number="1", claim_form="c.png",
+                                     status=ClaimStatus.APPROVED)
+        Claim.objects.filter(pk=claim.pk).update(
+            approved_at=timezone.make_aware(timezone.datetime(2024, 6, 15)))
+
+
+class BillingStatementTest(StatementFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def _statement(self, month="2024-07"):
+        return self.client.get("/billing/billing-records/statement/",
+                               {"paypoint_id": self.paypoint.pk, "month": month})
+
+    def test_claims_and_cancellations_exclude_policies(self):
+        from cancellations.models import CancellationRequest
+
+        active, dead, cancelled, later_cancel = self.make_policies(4)
+        self.approve_claim(dead)
+        CancellationRequest.objects.create(policy=cancelled, requested_by=self.user,
+                                           effective_date=date(2024, 7, 1))
+        CancellationRequest.objects.create(policy=later_cancel, requested_by=self.user,
+                                           effective_date=date(2024, 9, 1))
+
+        response = self._statement()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["contract_id"] for r in response.data["clients"]],
+                         [active.contract_id, later_cancel.contract_id])
+        self.assertEqual(response.data["paypoint"], "Billing Co")
+
+    def test_csv_export_is_streamed_with_total_last(self):
+        import csv
+
+        policies = self.make_policies(3)
+        response = self.client.get("/billing/billing-records/statement/",
+                                   {"paypoint_id": self.paypoint.pk, "month": "2024-07", "export": "csv"})
+        self.assertTrue(response.streaming)
+        lines = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+
+        self.assertEqual(lines[0], ["Pay point name", "Billing Co"])
+        self.assertEqual(lines[1], ["billing Month", "Jul-24"])
+        self.assertEqual([line[0] for line in lines[5:8]], [p.contract_id for p in policies])
+        self.assertEqual(lines[-1], ["Total", "", "", str(3 * policies[0].contract_premium)])
+
+    def test_query_count_does_not_grow_with_policies(self):
+        def run():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self._statement()
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries), response.data["count"]
+
+        self.make_policies(3)
+        small, _ = run()
+
+        self.approve_claim(self.make_policies(27)[0])
+        large, count = run()
+
+        self.assertEqual(count, 29)
+        self.assertEqual(small, large)
+
+
+class StatementCacheTest(StatementFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.policies = self.make_policies(3)
+
+    def _get(self, **params):
+        return self.client.get("/billing/billing-records/statement/",
+                               {"paypoint_id": self.paypoint.pk, "month": "2024-07", **params})
+
+    def _stats(self):
+        from common import statement_cache
+        return statement_cache.stats(["billing"])["billing"]
+
+    def test_repeat_request_is_served_from_cache(self):
+        first = self._get()
+        with CaptureQueriesContext(connection) as ctx:
+            second = self._get()
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(self._stats()["hit"], 1)
+        self.assertEqual(self._stats()["miss"], 1)
+        # paypoint lookup + data versions; the rest is session/auth
+        statement_queries = [q["sql"] for q in ctx.captured_queries
+                             if not any(t in q["sql"] for t in ("django_session", "access_administrator", "SAVEPOINT"))]
+        self.assertEqual(len(statement_queries), 2)
+
+    def test_csv_is_cached_once_streamed(self):
+        first = b"".join(self._get(export="csv").streaming_content)
+        second = self._get(export="csv")
+
+        self.assertEqual(second.content, first)
+        self.assertEqual(second["Content-Type"], "text/csv")
+        self.assertEqual(self._stats()["hit"], 1)
+
+    def test_claim_and_receipt_changes_invalidate(self):
+        from decimal import Decimal
+        from receipts.models import PremiumReceipt
+
+        self.assertEqual(self._get().data["count"], 3)
+
+        self.approve_claim(self.policies[0])
+        self.assertEqual(self._get().data["count"], 2)
+
+        PremiumReceipt.objects.create(policy=self.policies[1], amount_received=Decimal("7.00"))
+        self._get()
+        self.assertEqual(self._stats()["hit"], 0)
+        self.assertEqual(self._stats()["miss"], 3)
+
+    def test_other_paypoint_changes_keep_entry(self):
+        other = Paypoint.objects.create(paypoint_code="ppsother", paypoint_name="Other Co",
+                                        date_joined=date(2020, 1, 1))
+        self._get()
+        Policy.objects.create(
+            product_name="FUNERAL", proposal_sign_date=date(2023, 12, 1), start_date=date(2024, 1, 1),
+            agent=self.agent, paypoint=other, client=self.policies[0].client, frequency="M", cover=1000,
+            current_month=date(2024, 7, 1),
+        )
+        self._get()
+        self.assertEqual(self._stats()["hit"], 1)
+
+    def test_admin_prewarm_fills_cache(self):
+        from billing.models import BillingRecord
+
+        for policy in self.policies:
+            BillingRecord.objects.create(policy=policy, billing_month=date(2024, 7, 1))
+        admin_user = Administrator.objects.create_superuser(email="admin@test.com", password="pass123")
+        self.client.force_login(admin_user)
+
+        response = self.client.post("/admin/billing/billingrecord/", {
+            "action": "prewarm_statements",
+            "_selected_action": list(BillingRecord.objects.values_list("pk", flat=True)),
+        }, follow=True)
+        self.assertContains(response, "3 built, 0 already cached")
+
+        self.assertEqual(self._get(export="pdf").status_code, 200)
+        self.assertEqual(self._get().data["count"], 3)
+        self.assertEqual(self._stats()["hit"], 2)
+
+
+class StatementsZipTest(StatementFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.policies = self.make_policies(3)
+        self.empty = Paypoint.objects.create(paypoint_code="ppsempty", paypoint_name="Empty Co",
+                                             date_joined=date(2020, 1, 1))
+
+    def _archive(self, response):
+        import io
+        import zipfile
+        return zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+
+    @override_settings(STATEMENT_ZIP_WORKERS=2)
+    def test_zip_holds_each_statement_and_manifest(self):
+        import shutil
+        import tempfile
+        from common.jobs import work
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=media):
+            queued = self.client.post("/billing/billing-records/statements-zip/?month=2024-07")
+            self.assertEqual((queued.status_code, queued.data["status"]), (202, "queued"))
+            pending = self.client.get(queued.data["download_url"])
+            self.assertEqual((pending.status_code, pending.data["status"]), (200, "queued"))
+
+            self.assertEqual(work("test-worker", once=True), 1)
+            response = self.client.get(queued.data["download_url"])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "application/zip")
+            self.assertIn("billing_statements_jul-24.zip", response["Content-Disposition"])
+            archive = self._archive(response)
+
+        self.assertEqual(sorted(archive.namelist()),
+                         ["billing_ppsbill_jul-24.csv", "billing_ppsbill_jul-24.pdf", "manifest.csv"])
+        statement = self.client.get("/billing/billing-records/statement/",
+                                    {"paypoint_id": self.paypoint.pk, "month": "2024-07", "export": "csv"})
+        self.assertEqual(archive.read("billing_ppsbill_jul-24.csv"), b"".join(statement.streaming_content))
+        self.assertTrue(archive.read("billing_ppsbill_jul-24.pdf").startswith(b"%PDF"))
+
+        manifest = archive.read("manifest.csv").decode().splitlines()
+        premium = 3 * self.policies[0].contract_premium
+        self.assertEqual(manifest[2:], [
+            f"ppsbill,Billing Co,3,{premium},billing_ppsbill_jul-24.csv billing_ppsbill_jul-24.pdf",
+            "ppsempty,Empty Co,0,0.00,",
+            f"Total,,3,{premium},",
+        ])
+
+    def test_command_writes_csv_only(self):
+        import os
+        import tempfile
+        import zipfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "statements.zip")
+            out = StringIO()
+            call_command("billing_statements_zip", "--month", "2024-07", "--format", "csv",
+                         "--output", path, stdout=out)
+            with zipfile.ZipFile(path) as archive:
+                self.assertEqual(sorted(archive.namelist()), ["billing_ppsbill_jul-24.csv", "manifest.csv"])
+        self.assertIn("1 of 2 paypoints with statements, 3 clients", out.getvalue())
+
+    def test_invalid_format_is_400(self):
+        response = self.client.get("/billing/billing-records/statements-zip/",
+                                   {"month": "2024-07", "export": "xlsx"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReconciliationTest(StatementFixtures, TestCase):
+
+    def setUp(self):
+        from decimal import Decimal
+        from billing.models import BillingRecord
+
+        super().setUp()
+        self.client.force_login(self.user)
+        self.exact, self.short, self.over, self.unbilled = self.make_policies(4)
+        self.premium = self.exact.contract_premium
+        july = date(2024, 7, 1)
+        for policy in (self.exact, self.short, self.over):
+            BillingRecord.objects.create(policy=policy, billing_month=july)
+
+        self.receipt(self.exact, self.premium)
+        self.receipt(self.short, self.premium / 2)
+        self.receipt(self.over, self.premium * 2)
+        self.receipt(self.unbilled, Decimal("3.00"))
+        self.receipt(self.exact, self.premium, day=date(2024, 8, 2))  # next month, not billed
+
+    def receipt(self, policy, amount, day=date(2024, 7, 10)):
+        from django.utils import timezone
+        from receipts.models import PremiumReceipt
+
+        receipt = PremiumReceipt.objects.create(policy=policy, amount_received=amount)
+        PremiumReceipt.objects.filter(pk=receipt.pk).update(
+            date_received=timezone.make_aware(timezone.datetime(day.year, day.month, day.day, 9)))
+
+    def test_monthly_figures_and_details(self):
+        from decimal import Decimal
+
+        response = self.client.get("/billing/billing-records/reconciliation/",
+                                   {"month": "2024-07", "paypoint_id": self.paypoint.pk})
+        self.assertEqual(response.status_code, 200)
+        [row] = response.data["results"]
+        p = self.premium
+        self.assertEqual(row["paypoint_name"], "Billing Co")
+        self.assertEqual((row["billed_count"], row["billed_amount"]), (3, 3 * p))
+        self.assertEqual(row["receipted_amount"], p + p / 2 + 2 * p)
+        self.assertEqual((row["short_paid_count"], row["short_paid_amount"]), (1, p / 2))
+        self.assertEqual((row["over_paid_count"], row["over_paid_amount"]), (1, p))
+        self.assertEqual((row["unbilled_receipts_count"], row["unbilled_receipts_amount"]), (1, Decimal("3.00")))
+
+        self.assertEqual([(m["contract_id"], m["status"]) for m in response.data["mismatched_policies"]],
+                         sorted([(self.short.contract_id, "short paid"), (self.over.contract_id, "over paid")]))
+        self.assertEqual([u["contract_id"] for u in response.data["unbilled_receipts"]],
+                         [self.unbilled.contract_id])
+
+    def test_overview_query_count_is_fixed(self):
+        from billing.models import BillingRecord
+
+        def run():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get("/billing/billing-records/reconciliation/",
+                                           {"from": "2024-07", "to": "2024-08"})
+            self.assertEqual(response.status_code, 200)
+            return response.data, len(ctx.captured_queries)
+
+        data, small = run()
+        # August: the exact payer's receipt is unbilled
+        self.assertEqual([(r["billing_month"], r["unbilled_receipts_count"]) for r in data["results"]],
+                         [(date(2024, 7, 1), 1), (date(2024, 8, 1), 1)])
+
+        other = Paypoint.objects.create(paypoint_code="ppsrec", paypoint_name="Another Co",
+                                        date_joined=date(2020, 1, 1))
+        self.paypoint = other
+        for policy in self.make_policies(5):
+            BillingRecord.objects.create(policy=policy, billing_month=date(2024, 8, 1))
+            self.receipt(policy, policy.contract_premium, day=date(2024, 8, 5))
+        data, large = run()
+
+        self.assertEqual(data["results"][0]["paypoint_name"], "Another Co")
+        self.assertEqual(data["results"][0]["billed_count"], 5)
+        self.assertEqual(small, large)
+
+    def test_csv_export(self):
+        response = self.client.get("/billing/billing-records/reconciliation/",
+                                   {"month": "2024-07", "export": "csv"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "Billing reconciliation,Jul-24")
+        self.assertTrue(lines[3].startswith("Billing Co,2024-07-01,3,"))
+
+
+class GenerateBillingTest(StatementFixtures, TestCase):
+
+    def test_generated_records_match_statement_and_rerun_is_noop(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from billing.models import BillingRecord
+        from billing.services import month_bounds, statement_rows
+        from cancellations.models import CancellationRequest
+
+        active, dead, cancelled, later_cancel = self.make_policies(4)
+        self.make_policies(1, start=date(2024, 9, 1))  # not started yet
+        self.approve_claim(dead)
+        CancellationRequest.objects.create(policy=cancelled, requested_by=self.user,
+                                           effective_date=date(2024, 7, 1))
+        CancellationRequest.objects.create(policy=later_cancel, requested_by=self.user,
+                                           effective_date=date(2024, 9, 1))
+
+        out = StringIO()
+        call_command("generate_billing", "--month", "2024-07", stdout=out)
+        self.assertIn("Billing Co: 2 created / 2 billable", out.getvalue())
+
+        month = date(2024, 7, 1)
+        expected = {p.pk for p, _ in statement_rows(Policy.objects.all(), *month_bounds(month))}
+        self.assertEqual(set(BillingRecord.objects.filter(billing_month=month)
+                             .values_list("policy_id", flat=True)), expected)
+        self.assertEqual(expected, {active.pk, later_cancel.pk})
+
+        out = StringIO()
+        call_command("generate_billing", "--month", "2024-07", stdout=out)
+        self.assertIn("Billing Co: 0 created / 2 billable", out.getvalue())
+        self.assertEqual(BillingRecord.objects.count(), 2)
+
+    @override_settings(TIME_ZONE="Africa/Harare")
+    def test_claim_month_is_taken_in_local_time(self):
+        from datetime import datetime, timezone as dt_timezone
+        from billing.services import billable_policies, month_bounds, statement_rows
+        from claims.models import Claim
+
+        policy = self.make_policies(1)[0]
+        self.approve_claim(policy)
+        # 22:30 UTC on 31 July is already 1 August in Harare
+        Claim.objects.filter(policy=policy).update(
+            approved_at=datetime(2024, 7, 31, 22, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(Policy.objects.get(pk=policy.pk).claim_effective_date, date(2024, 8, 1))
+
+        for month, billed in ((date(2024, 7, 1), True), (date(2024, 8, 1), False)):
+            rows = [p.pk for p, _ in statement_rows(Policy.objects.all(), *month_bounds(month))]
+            self.assertEqual(rows, [policy.pk] if billed else [], month)
+            self.assertEqual(billable_policies(month).filter(pk=policy.pk).exists(), billed, month)
+
+
+class ActivePoliciesEndpointTest(StatementFixtures, TestCase):
+
+    def setUp(self):
+        from decimal import Decimal
+        from billing.models import BillingRecord
+        from policies.snapshots import refresh_policy_snapshots
+
+        super().setUp()
+        self.client.force_login(self.user)
+
+        policies = self.make_policies(5)
+        self.active = policies[:3]
+        paid = [p.pk for p in self.active]
+        Policy.objects.filter(pk__in=paid).update(total_premium_received=Decimal("7.00"))
+        refresh_policy_snapshots(paid)
+
+        for policy in policies:
+            for month in (date(2024, 6, 1), date(2024, 7, 1)):
+                BillingRecord.objects.create(policy=policy, billing_month=month)
+
+    def test_keyset_pages_cover_active_records_once(self):
+        url = "/billing/billing-records/active-policies/?page_size=4"
+        seen, query_counts = [], []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            query_counts.append(len(ctx.captured_queries))
+            seen.extend((r["contract_id"], r["billing_month"]) for r in response.data["results"])
+            self.assertTrue(all(r["policy_status"] == "Active" for r in response.data["results"]))
+            url = response.data["next"]
+
+        expected = sorted((p.contract_id, month) for p in self.active
+                          for month in ("2024-06-01", "2024-07-01"))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(query_counts), 2)
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_policy_without_snapshot_is_listed(self):
+        from policies.models import PolicySnapshot
+
+        PolicySnapshot.objects.filter(policy=self.active[0]).delete()  # e.g. never refreshed
+
+        response = self.client.get("/billing/billing-records/active-policies/?page_size=10")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(r["contract_id"] == self.active[0].contract_id for r in response.data["results"]), 2)
+        self.assertEqual(len(response.data["results"]), 6)
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get("/billing/billing-records/active-policies/?cursor=nope")
+        self.assertEqual(response.status_code, 404)
@@ -1,18 +1,30 @@
 
 # billing/views.py
-from datetime import date, timedelta
-from io import BytesIO, StringIO
-import csv
+from datetime import date
+from decimal import Decimal
 
-from django.http import HttpResponse
-from django.utils.dateparse import parse_date
+from django.core.files.storage import default_storage
+from django.db.models import Value
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from billing.models import BillingRecord
+from common import statement_cache, versions
+from common.exports import streaming_csv_response
+from common.dates import parse_month
+from common.jobs import enqueue, job_month, month_job_id
+from common.models import Job, JobStatus
+from common.pagination import KeysetPagination
+from common.serializers import JobProgressSerializer
+from common.statements import render_statement
+from paypoints.models import Paypoint
 from policies.models import Policy
-from .serializers import BillingRecordSerializer  # minimal serializer you already have
+from .services import (ZIP_FORMATS, billing_statement, month_bounds, reconciliation,
+                       reconciliation_details, statement_csv_lines, statement_rows)
+from .serializers import ActiveBillingRecordSerializer, BillingRecordSerializer  # minimal serializer you already have
 
 
 class BillingRecordViewSet(viewsets.ReadOnlyModelViewSet):
@@ -21,6 +33,8 @@ class BillingRecordViewSet(viewsets.ReadOnlyModelViewSet):
       - /api/billing-records/                    -> list all billing records
       - /api/billing-records/active-policies/   -> billing rows whose policy is Overall 'Active'
       - /api/billing-records/statement/         -> billing statement per paypoint & month (JSON/CSV/PDF via ?export=)
+      - /api/billing-records/reconciliation/    -> billed vs receipted per paypoint & month (JSON/CSV)
+      - /api/billing-records/statements-zip/    -> every paypoint's statement for a month, as one ZIP
     """
     serializer_class = BillingRecordSerializer
 
@@ -35,21 +49,24 @@ class BillingRecordViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=["get"], url_path="active-policies")
     def active_policies(self, request):
         """
-        Return billing records where linked policy.overall_policy_status == 'Active'
-        """
-        all_records = list(self.get_queryset())
-        filtered = [
-            br for br in all_records
-            if br.policy and br.policy.overall_policy_status == "Active"
-        ]
-
-        page = self.paginate_queryset(filtered)
-        if page is not None:
-            ser = self.get_serializer(page, many=True)
-            return self.get_paginated_response(ser.data)
+        Return billing records where linked policy.overall_policy_status == 'Active'.
 
-        ser = self.get_serializer(filtered, many=True)
-        return Response(ser.data)
+        Filters on the status computed in SQL (Policy.objects.with_status())
+        and pages with a keyset cursor on (contract_id, billing_month):
+        ?cursor=...&page_size=N.
+        """
+        active = (Policy.objects.with_status()
+                  .filter(annotated_overall_policy_status="Active")
+                  .values("pk"))
+        queryset = (BillingRecord.objects
+                    .filter(policy__in=active)
+                    .select_related("policy", "policy__client")
+                    .annotate(overall_status=Value("Active")))
+
+        paginator = KeysetPagination(ordering=("policy__contract_id", "billing_month"))
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        ser = ActiveBillingRecordSerializer(page, many=True)
+        return paginator.get_paginated_response(ser.data)
 
     # ---------- helpers ----------
     @staticmethod
@@ -59,97 +76,30 @@ class BillingRecordViewSet(viewsets.ReadOnlyModelViewSet):
     @staticmethod
     def _month_bounds(month_start: date):
         """Return (start, end) for the month."""
-        if month_start.month == 12:
-            next_month_start = date(month_start.year + 1, 1, 1)
-        else:
-            next_month_start = date(month_start.year, month_start.month + 1, 1)
-        return month_start, next_month_start - timedelta(days=1)
+        return month_bounds(month_start)
 
     @staticmethod
     def _parse_month_param(raw: str):
         """Accept YYYY-MM or YYYY-MM-DD; return first day of that month or None."""
-        if not raw:
-            return None
-        d = parse_date(raw)
-        if d is None:
-            try:
-                y, m = map(int, raw.split("-"))
-                d = date(y, m, 1)
-            except Exception:
-                return None
-        return date(d.year, d.month, 1)
-
-    @staticmethod
-    def _status_in_month(policy: Policy, month_start: date, month_end: date):
-        """
-        Return 'Active' or 'proposal accepted' for the target month; None to exclude.
-        Rules:
-          - Exclude if claim/cancellation effective on/before month_end.
-          - Exclude if policy starts after month_end.
-          - If it's the inception month and <1 period paid and no arrears, mark 'proposal accepted'.
-          - Otherwise mark 'Active'.
-        """
-        claim_effective = getattr(policy, "claim_effective_date", None)
-        if claim_effective and claim_effective <= month_end:
-            return None
-
-        cancel_effective = getattr(policy, "cancellation_effective_date", None)
-        if cancel_effective and cancel_effective <= month_end:
-            return None
-
-        if policy.start_date and policy.start_date > month_end:
-            return None
-
-        # inception month?
-        if policy.start_date:
-            start_m = date(policy.start_date.year, policy.start_date.month, 1)
-            if start_m == month_start:
-                try:
-                    if (policy.months_paid or 0) < 1 and (policy.months_in_arrears or 0) <= 0:
-                        return "proposal accepted"
-                except Exception:
-                    return "proposal accepted"
-
-        return "Active"
+        return parse_month(raw)
 
     # ---------- CSV builder ----------
-    def _build_csv_response(self, paypoint_label: str, month_label: str, rows: list, total: float):
+    def _build_csv_response(self, paypoint_label: str, month_label: str, rows):
         """
-        CSV layout matching your example.
+        CSV layout matching your example. `rows` may be a generator: lines
+        are streamed as they are produced and the total is written last.
         """
-        buf = StringIO()
-        w = csv.writer(buf)
-
-        w.writerow(["Pay point name", paypoint_label])
-        w.writerow(["billing Month", month_label])
-        w.writerow([])
-        w.writerow(["List of clients"])
-        w.writerow(["Contract_id", "Client_name", "Status", "Contract Premium"])
-        for r in rows:
-            w.writerow([r["contract_id"], r["client_name"], r["status"], r["contract_premium"]])
-        w.writerow([])
-        w.writerow(["Total", "", "", total])
-
-        csv_data = buf.getvalue()
-        buf.close()
-
         filename = f"billing_{paypoint_label}_{month_label}.csv".replace(" ", "_").lower()
-        response = HttpResponse(csv_data, content_type="text/csv")
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-        return response
+        return streaming_csv_response(statement_csv_lines(paypoint_label, month_label, rows), filename)
 
     # ---------- PDF builder ----------
-    def _build_pdf_response(self, paypoint_label: str, month_label: str, rows: list, total: float):
+    def _build_pdf_response(self, paypoint_label: str, month_label: str, rows: list, total: Decimal):
         """
-        Lightweight PDF using reportlab. If reportlab is missing, return 501 with guidance.
+        PDF via common.statements (reportlab). If reportlab is missing, return 501 with guidance.
         """
         try:
-            from reportlab.lib import colors
-            from reportlab.lib.pagesizes import A4
-            from reportlab.lib.styles import getSampleStyleSheet
-            from reportlab.lib.units import mm
-            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        except Exception:
+            pdf_bytes = render_statement(billing_statement(paypoint_label, month_label, rows, total))
+        except ImportError:
             return Response(
                 {
                     "detail": "PDF export requires 'reportlab'. Install: pip install reportlab",
@@ -158,46 +108,6 @@ class BillingRecordViewSet(viewsets.ReadOnlyModelViewSet):
                 status=501,
             )
 
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(
-            buffer, pagesize=A4,
-            leftMargin=16 * mm, rightMargin=16 * mm, topMargin=16 * mm, bottomMargin=16 * mm
-        )
-        styles = getSampleStyleSheet()
-        elems = []
-
-        title = Paragraph("<b>Billing Statement</b>", styles["Title"])
-        header1 = Paragraph(f"<b>Pay point name:</b> {paypoint_label}", styles["Normal"])
-        header2 = Paragraph(f"<b>Billing Month:</b> {month_label}", styles["Normal"])
-
-        elems.extend([title, Spacer(1, 6), header1, header2, Spacer(1, 10)])
-
-        # Table
-        data = [["Contract_id", "Client_name", "Status", "Contract Premium"]]
-        for r in rows:
-            data.append([r["contract_id"], r["client_name"], r["status"], r["contract_premium"]])
-        data.append(["", "", "", ""])
-        data.append(["Total", "", "", f"{total}"])
-
-        table = Table(data, hAlign="LEFT")
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#DFF0D8")),  # header bg
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("ALIGN", (3, 1), (3, -1), "RIGHT"),
-            ("BACKGROUND", (0, -1), (-1, -1), colors.HexColor("#F5F5F5")),  # total row bg
-        ]))
-
-        elems.append(Paragraph("<b>List of clients</b>", styles["Heading3"]))
-        elems.append(Spacer(1, 4))
-        elems.append(table)
-
-        doc.build(elems)
-
-        pdf_bytes = buffer.getvalue()
-        buffer.close()
-
         filename = f"billing_{paypoint_label}_{month_label}.pdf".replace(" ", "_").lower()
         response = HttpResponse(pdf_bytes, content_type="application/pdf")
         response["Content-Disposition"] = f'attachment; filename="{filename}"'
@@ -215,6 +125,9 @@ class BillingRecordViewSet(viewsets.ReadOnlyModelViewSet):
           - paypoint=<name>         (human name, partial / case-insensitive)
           - month=YYYY-MM or YYYY-MM-DD
           - export=json|csv|pdf     (default json)  <-- use 'export', not 'format'
+
+        Responses are cached (common.statement_cache) until the data of the
+        matched paypoints changes.
         """
         paypoint_id = request.query_params.get("paypoint_id")
         paypoint_code = request.query_params.get("paypoint_code")
@@ -226,8 +139,6 @@ class BillingRecordViewSet(viewsets.ReadOnlyModelViewSet):
         month_start = self._parse_month_param(month_raw)
         if not month_start:
             return Response({"detail": "Invalid or missing 'month'. Use YYYY-MM or YYYY-MM-DD."}, status=400)
-        month_start, month_end = self._month_bounds(month_start)
-        month_label = month_start.strftime("%b-%y")
 
         # Base policies queryset
         policies_qs = Policy.objects.select_related("client", "paypoint").order_by("contract_id")
@@ -254,35 +165,51 @@ class BillingRecordViewSet(viewsets.ReadOnlyModelViewSet):
         else:
             return Response({"detail": "Provide one of: 'paypoint_id', 'paypoint_code', or 'paypoint' (name)."}, status=400)
 
-        # Build rows (only Active or proposal accepted for the given month)
+        # Cached per matched paypoints + month + export, keyed by their data versions
+        paypoint_ids = list(Paypoint.objects.filter(
+            pk__in=policies_qs.order_by().values("paypoint_id")).order_by("pk").values_list("pk", flat=True))
+        return statement_cache.cached_response(
+            *self.statement_cache_entry(policies_qs, paypoint_ids, paypoint_label, month_start, export))
+
+    def statement_cache_entry(self, policies_qs, paypoint_ids, paypoint_label, month_start: date, export: str):
+        """
+        (kind, parts, scopes, build) for common.statement_cache: the statement
+        depends on the data of the paypoints in `paypoint_ids` only.
+        """
+        month_start, month_end = self._month_bounds(month_start)
+        parts = (tuple(paypoint_ids), paypoint_label, month_start.isoformat(), export)
+        scopes = [versions.scope("paypoint", pk) for pk in paypoint_ids]
+
+        def build():
+            return self._render_statement(policies_qs, paypoint_label, month_start, month_end, export)
+        return "billing", parts, scopes, build
+
+    def _render_statement(self, policies_qs, paypoint_label, month_start: date, month_end: date, export: str):
+        month_label = month_start.strftime("%b-%y")
+
+        # CSV is streamed straight from the database cursor
+        if export == "csv":
+            first_paypoint = policies_qs.values_list("paypoint__paypoint_name", flat=True).first()
+            rows = (row for _, row in statement_rows(policies_qs, month_start, month_end))
+            return self._build_csv_response(first_paypoint or paypoint_label, month_label, rows)
+
+        # Build rows (only Active or proposal accepted for the given month);
+        # claim / cancellation dates are prefetched, so the query count is fixed
         rows = []
-        total = 0.0
+        total = Decimal("0.00")
         resolved_label = None
 
-        for p in policies_qs:
+        for p, row in statement_rows(policies_qs, month_start, month_end):
             if resolved_label is None and p.paypoint_id:
                 resolved_label = str(p.paypoint)  # __str__ returns paypoint_name
 
-            status_label = self._status_in_month(p, month_start, month_end)
-            if status_label not in ("Active", "proposal accepted"):
-                continue
-
-            premium = float(p.contract_premium or 0.0)
-            total += premium
-
-            rows.append({
-                "contract_id": p.contract_id,
-                "client_name": str(p.client) if p.client_id else "",
-                "status": status_label,
-                "contract_premium": premium,  # numeric (0.5 / 1.0)
-            })
+            total += row["contract_premium"]
+            rows.append(row)
 
         # If nothing matched to resolve a pretty label, echo the input
         paypoint_label = resolved_label or paypoint_label or "(unknown)"
 
         # Return by export format (avoid DRF's built-in ?format=)
-        if export == "csv":
-            return self._build_csv_response(paypoint_label, month_label, rows, total)
         if export == "pdf":
             return self._build_pdf_response(paypoint_label, month_label, rows, total)
 
@@ -295,3 +222,145 @@ class BillingRecordViewSet(viewsets.ReadOnlyModelViewSet):
             "total_contract_premium": total,
         })
 
+
+    # ---------- month-end ZIP endpoints ----------
+    @action(detail=False, methods=["get", "post"], url_path="statements-zip")
+    def statements_zip(self, request):
+        """
+        Queue a ZIP of every paypoint's statement for the month, plus
+        manifest.csv, as a "billing.statements_zip" job (billing.jobs).
+
+        Query params:
+          - month=YYYY-MM or YYYY-MM-DD
+          - export=csv|pdf|csv,pdf  (default csv,pdf)
+          - paypoint_id=<int>       optional, repeatable
+
+        Responds 202 with the job's progress and its `download_url`, which
+        serves the archive once the job is done.
+        """
+        month_start = self._parse_month_param(request.query_params.get("month"))
+        if not month_start:
+            return Response({"detail": "Invalid or missing 'month'. Use YYYY-MM or YYYY-MM-DD."}, status=400)
+
+        formats = [f.strip() for f in (request.query_params.get("export") or ",".join(ZIP_FORMATS)).lower().split(",")]
+        if not formats or any(f not in ZIP_FORMATS for f in formats):
+            return Response({"detail": "Invalid 'export'. Use csv, pdf or csv,pdf."}, status=400)
+        if "pdf" in formats:
+            try:
+                import reportlab  # noqa: F401
+            except ImportError:
+                return Response({"detail": "PDF export requires 'reportlab'. Install: pip install reportlab",
+                                 "hint": "Or use export=csv"}, status=501)
+        try:
+            paypoint_ids = [int(pk) for pk in request.query_params.getlist("paypoint_id")]
+        except ValueError:
+            return Response({"detail": "Invalid 'paypoint_id'. Must be an integer."}, status=400)
+
+        job = enqueue("billing.statements_zip", month_job_id(month_start),
+                      formats=formats, paypoint_ids=paypoint_ids)
+        return self._statements_zip_job(request, job, status=202)
+
+    @action(detail=False, methods=["get"], url_path=r"statements-zip/(?P<job_id>\d+)")
+    def statements_zip_download(self, request, job_id=None):
+        """The archive of a statements-zip job once it is done; the job's progress until then."""
+        job = Job.objects.filter(pk=job_id, kind="billing.statements_zip").first()
+        if job is None:
+            return Response({"detail": "No statements ZIP job found."}, status=404)
+        if job.status != JobStatus.DONE:
+            return self._statements_zip_job(request, job)
+
+        filename = f"billing_statements_{job_month(job):%b-%y}.zip".lower()
+        return FileResponse(default_storage.open(job.payload["file"], "rb"), as_attachment=True,
+                            filename=filename, content_type="application/zip")
+
+    def _statements_zip_job(self, request, job, status=200):
+        data = JobProgressSerializer(job).data
+        data["download_url"] = request.build_absolute_uri(
+            reverse("billing-record-statements-zip-download", kwargs={"job_id": job.pk}))
+        return Response(data, status=status)
+
+    # ---------- reconciliation endpoint ----------
+    RECONCILIATION_COLUMNS = [
+        ("paypoint_name", "Pay point name"),
+        ("billing_month", "Month"),
+        ("billed_count", "Billed policies"),
+        ("billed_amount", "Billed amount"),
+        ("receipted_amount", "Receipted amount"),
+        ("short_paid_count", "Short paid"),
+        ("short_paid_amount", "Short paid amount"),
+        ("over_paid_count", "Over paid"),
+        ("over_paid_amount", "Over paid amount"),
+        ("unbilled_receipts_count", "Unbilled receipts"),
+        ("unbilled_receipts_amount", "Unbilled receipts amount"),
+        ("difference", "Difference"),
+    ]
+
+    def _reconciliation_csv(self, label, rows, details):
+        def lines():
+            yield ["Billing reconciliation", label]
+            yield []
+            yield [title for _, title in self.RECONCILIATION_COLUMNS]
+            for r in rows:
+                yield [r[key] for key, _ in self.RECONCILIATION_COLUMNS]
+            if details:
+                mismatched, unbilled = details
+                yield []
+                yield ["Short / over paid policies"]
+                yield ["Contract_id", "Client_name", "Billed", "Received", "Difference", "Status"]
+                for m in mismatched:
+                    yield [m["contract_id"], m["client_name"], m["billed"], m["received"], m["difference"], m["status"]]
+                yield []
+                yield ["Unbilled receipts"]
+                yield ["Receipt number", "Contract_id", "Amount", "Date received"]
+                for u in unbilled:
+                    yield [u["receipt_number"], u["contract_id"], u["amount"], u["date_received"]]
+
+        filename = f"billing_reconciliation_{label}.csv".replace(" ", "_").lower()
+        return streaming_csv_response(lines(), filename)
+
+    @action(detail=False, methods=["get"], url_path="reconciliation")
+    def reconciliation(self, request):
+        """
+        Billed (BillingRecord) versus receipted (PremiumReceipt) per paypoint
+        and month, computed with grouped aggregate queries.
+
+        Query params:
+          - month=YYYY-MM           one month, or
+          - from=YYYY-MM&to=YYYY-MM an inclusive range of months
+          - paypoint_id=<int>       optional; with a single month the
+                                    short/over-paid policies and unbilled
+                                    receipts are listed too
+          - export=json|csv         (default json)
+
+        Receipts count towards the month they are dated in.
+        """
+        params = request.query_params
+        export = (params.get("export") or "json").lower().strip()
+        month_from = self._parse_month_param(params.get("from") or params.get("month"))
+        month_to = self._parse_month_param(params.get("to") or params.get("month"))
+        if not month_from or not month_to or month_from > month_to:
+            return Response({"detail": "Provide 'month' or 'from' and 'to' as YYYY-MM (from <= to)."}, status=400)
+
+        paypoint_ids = None
+        if params.get("paypoint_id"):
+            try:
+                paypoint_ids = [int(params["paypoint_id"])]
+            except ValueError:
+                return Response({"detail": "Invalid 'paypoint_id'. Must be an integer."}, status=400)
+
+        rows = reconciliation(month_from, month_to, paypoint_ids)
+        details = None
+        if paypoint_ids and month_from == month_to:
+            details = reconciliation_details(paypoint_ids[0], month_from)
+
+        label = month_from.strftime("%b-%y")
+        if month_to != month_from:
+            label = f"{label} to {month_to.strftime('%b-%y')}"
+
+        if export == "csv":
+            return self._reconciliation_csv(label, rows, details)
+
+        data = {"period": label, "count": len(rows), "results": rows}
+        if details:
+            data["mismatched_policies"], data["unbilled_receipts"] = details
+        return Response(data)
@@ -2,6 +2,7 @@ from django.db import models
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from policies.models import Policy
+from policies.changes import notify_policies_changed
 from django.conf import settings
 
 
@@ -61,6 +62,16 @@ class CancellationRequest(models.Model):
         ).exists():
             raise ValidationError("Policy is already cancelled.")
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        notify_policies_changed([self.policy_id])
+
+    def delete(self, *args, **kwargs):
+        policy_id = self.policy_id
+        result = super().delete(*args, **kwargs)
+        notify_policies_changed([policy_id])
+        return result
+
     def approve(self, *, approver):
         if self.status != CancellationStatus.REQUESTED:
             raise ValidationError("Cancellation is not pending approval.")
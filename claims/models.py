@@ -4,6 +4,7 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 from auditlog.registry import auditlog
 from policies.models import Policy
+from policies.changes import notify_policies_changed
 
 
 class ClaimStatus(models.TextChoices):
@@ -79,6 +80,16 @@ class Claim(models.Model):
             )
 
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        notify_policies_changed([self.policy_id])
+
+    def delete(self, *args, **kwargs):
+        policy_id = self.policy_id
+        result = super().delete(*args, **kwargs)
+        notify_policies_changed([policy_id])
+        return result
+
     # -------------------------
     # WORKFLOW
     # -------------------------
@@ -2,7 +2,7 @@ from django.contrib import admin
 from .models import  Client, Upload
 from django.db import models
 from django.utils import timezone
-from .services import process_upload
+from common.jobs import enqueue
 
 
 
@@ -46,16 +46,17 @@ class UploadAdmin(admin.ModelAdmin):
             upload.approved_at = timezone.now()
             upload.save()
 
-            errors = process_upload(upload)
+            job = enqueue("clients.upload", upload.pk)
 
-            if errors:
+            # only reached with JOBS_RUN_INLINE; otherwise a worker picks it up
+            if job.errors:
                 self.message_user(
                     request,
-                    f"Upload {upload.id} imported with errors:\n" + "\n".join(errors),
+                    f"Upload {upload.id} imported with errors:\n" + "\n".join(job.errors),
                     level="warning"
                 )
 
-        self.message_user(request, "Uploads approved and processed.")
+        self.message_user(request, "Uploads approved and queued for processing.")
 
     @admin.action(description="Reject selected uploads")
     def reject_uploads(self, request, queryset):
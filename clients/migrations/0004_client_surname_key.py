@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+from common.names import normalize_name
+
+
+def fill_surname_keys(apps, schema_editor):
+    Client = apps.get_model("clients", "Client")
+    batch = []
+    for client in Client.objects.only("pk", "client_surname").iterator(chunk_size=2000):
+        client.surname_key = normalize_name(client.client_surname)
+        batch.append(client)
+        if len(batch) == 2000:
+            Client.objects.bulk_update(batch, ["surname_key"])
+            batch = []
+    Client.objects.bulk_update(batch, ["surname_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0003_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='surname_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(fill_surname_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:21
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0004_client_surname_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(django.db.models.functions.text.Upper('id_number'), name='client_id_number_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='client_email_lower_idx'),
+        ),
+    ]
@@ -1,14 +1,19 @@
 # models.py
 
 from django.db import models, transaction
+from django.db.models.functions import Lower, Upper
 from django.utils import timezone
 from .validators import id_number_validator, phone_regex
+from common.names import normalize_name
+from common.sequences import allocate
 
 
 class Client(models.Model):
     client_code = models.CharField(max_length=10, unique=True, db_index=True, editable=False)
     client_name = models.CharField(max_length=200)
     client_surname = models.CharField(max_length=200)
+    # normalize_name(client_surname): what imports look clients up by
+    surname_key = models.CharField(max_length=200, db_index=True, editable=False, default="")
     id_number = models.CharField(max_length=12, unique=True, validators=[id_number_validator])
     dob = models.DateField()
     email= models.EmailField(unique=True)
@@ -17,23 +22,37 @@ class Client(models.Model):
     location_address = models.CharField(max_length=30, null=True, blank=True)
     city_address = models.CharField(max_length=30, null=True, blank=True)
 
-       
+    class Meta:
+        # the case-insensitive lookups of clients.services._existing_clients
+        indexes = [models.Index(Upper("id_number"), name="client_id_number_upper_idx"),
+                   models.Index(Lower("email"), name="client_email_lower_idx")]
+
+    CODE_SEQUENCE = "clients.client_code"
+
+    @staticmethod
+    def _last_code_number():
+        last_code = Client.objects.order_by('-client_code').values_list('client_code', flat=True).first()
+        return int(last_code[2:]) if last_code else 0
+
+    @classmethod
+    def reserve_codes(cls, count):
+        """Reserve `count` client codes in one round trip (bulk imports)."""
+        numbers = allocate(cls.CODE_SEQUENCE, count, seed=cls._last_code_number)
+        return [f"CC{n:08d}" for n in numbers]  # CC00000001 format
 
     #generate a custom client code
     def save(self, *args, **kwargs):
         if not self.client_code:
-            last_client = Client.objects.order_by('-client_code').first()
-
-            if last_client:
-                last_number = int(last_client.client_code[2:])  # 
-                new_number = last_number + 1
-            else:
-                new_number = 1
-
-            self.client_code = f"CC{new_number:08d}"  # A000000001 format
+            self.client_code = self.reserve_codes(1)[0]
+        self.surname_key = normalize_name(self.client_surname)
 
+        renamed = not self._state.adding
         super().save(*args, **kwargs)
 
+        if renamed:  # client names appear on cached statements
+            from policies.changes import bump_policy_versions
+            bump_policy_versions(self.policies.values_list("pk", flat=True))
+
     def __str__(self):
         return f"{self.client_name} {self.client_surname}"
     
@@ -1,64 +1,171 @@
-import os
-import csv
-import openpyxl
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower, Upper
+
+from common.names import normalize_name
+from common.readers import batched, read_upload_rows
 from .models import Client
 
-def process_upload(upload):
+BATCH_SIZE = 1000   # rows held in memory / clients inserted at a time
+LOOKUP_CHUNK = 500  # values per IN (...) lookup
+
+COLUMNS = (
+    "client_name", "client_surname", "id_number", "dob", "email", "phone_number",
+    "street_address", "location_address", "city_address",
+)
+
+
+def _id_key(value):
+    return str(value or "").strip().upper()
+
+
+def _email_key(value):
+    return str(value or "").strip().lower()
+
+
+def _existing_clients(id_numbers, emails):
     """
-    Process an uploaded file (Excel or CSV) and create agents.
-    Returns a list of errors per row.
+    Existing clients whose id_number or email appears in the given sets,
+    fetched with chunked IN queries on the normalized columns (which have
+    matching expression indexes). Returns ({id key: Client}, {email key: Client}).
     """
-    errors = []
-    filename = upload.file.path
-    ext = os.path.splitext(filename)[1].lower()  # get file extension
-
-    # Track duplicates within the file
-    seen = set()
-
-    if ext in ['.xlsx', '.xls']:
-        # Excel file
-        wb = openpyxl.load_workbook(filename)
-        ws = wb.active
-        rows = list(ws.iter_rows(min_row=2, values_only=True))  # skip header
-    elif ext == '.csv':
-        # CSV file
-        with open(filename, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            rows = list(reader)[1:]  # skip header
-    else:
-        raise ValueError("Unsupported file format. Use Excel or CSV.")
-
-    for i, row in enumerate(rows, start=2):
-        try:
-            if not row or len(row) < 9:
-                raise ValueError("Not enough columns")
-            
-            client_name, client_surname, id_number, dob, email, phone_number, street_address, location_address, city_address = row[:9]
-
-            # Detect duplicates in the same file
-            key = (client_name, client_surname, id_number, dob, email, phone_number, street_address, location_address, city_address)
-            if key in seen:
-                raise ValueError("Duplicate agent in file")
-            seen.add(key)
-
-            # Check duplicates in DB
-            if Client.objects.filter(client_name=client_name,
-                                     client_surname=client_surname, id_number=id_number,
-                                     dob=dob, email=email, phone_number=phone_number,
-                                     street_address=street_address, location_address=location_address,
-                                     city_address=city_address).exists():
-                raise ValueError("Duplicate agent in database")
-
-            # create Client
-            Client.objects.create(
-                client_name=client_name,
-                client_surname=client_surname, id_number=id_number,
-                dob=dob, email=email, phone_number=phone_number,
-                street_address=street_address, location_address=location_address,
-                city_address=city_address
-            )
+    by_id, by_email = {}, {}
+    for keys, annotation in ((sorted(id_numbers), Upper("id_number")),
+                             (sorted(emails), Lower("email"))):
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            for client in Client.objects.annotate(lookup_key=annotation).filter(lookup_key__in=chunk):
+                by_id[_id_key(client.id_number)] = client
+                by_email[_email_key(client.email)] = client
+    return by_id, by_email
 
+
+def _signature(client):
+    """The nine imported columns, normalized so file and database values compare equal."""
+    values = []
+    for field in COLUMNS:
+        value = getattr(client, field)
+        if field == "id_number":
+            value = _id_key(value)
+        elif field == "email":
+            value = _email_key(value)
+        elif hasattr(value, "isoformat"):
+            value = value.isoformat()
+        else:
+            value = str(value if value is not None else "").strip()
+        values.append(value)
+    return tuple(values)
+
+
+def _insert_batch(pending, errors):
+    """
+    bulk_create the batch with codes reserved in one round trip. If the
+    insert fails (e.g. a concurrent import took an id_number), fall back
+    to row-by-row saves so the error is reported against its own row.
+    """
+    codes = Client.reserve_codes(len(pending))
+    for (_, client), code in zip(pending, codes):
+        client.client_code = code
+        client.surname_key = normalize_name(client.client_surname)
+
+    try:
+        with transaction.atomic():
+            Client.objects.bulk_create([client for _, client in pending])
+        return
+    except IntegrityError:
+        pass
+
+    for i, client in pending:
+        try:
+            with transaction.atomic():
+                client.save(force_insert=True)
         except Exception as e:
-            errors.append(f"Row {i}: {str(e)}")
+            errors.append((i, str(e)))
+
+
+def process_upload(upload, progress=None):
+    """
+    Process an uploaded file (Excel or CSV) and create clients.
+
+    Existing clients sharing an id_number or email with the batch are
+    fetched in a few chunked queries; each row is then classified in
+    memory as new, an exact duplicate, or a conflicting duplicate (same
+    id_number or email, different details), and new clients are
+    bulk-inserted. `progress(rows_done, rows_failed)` is called after
+    each batch. Returns a list of errors per row.
+    """
+    errors = []
+    dob_field = Client._meta.get_field("dob")
+
+    # Clients accepted earlier in the file: {id/email key: (row number, signature)}
+    file_ids, file_emails = {}, {}
+
+    rows = read_upload_rows(upload.file.path, COLUMNS)
+
+    rows_done = 0
+    for batch in batched(rows, BATCH_SIZE):
+        parsed = []  # (row number, unsaved Client)
+
+        for i, row in batch:
+            try:
+                if not row or len(row) < 9:
+                    raise ValueError("Not enough columns")
+
+                client_name, client_surname, id_number, dob, email, phone_number, street_address, location_address, city_address = row[:9]
+                if not _id_key(id_number) or not _email_key(email):
+                    raise ValueError("id_number and email are required")
+
+                parsed.append((i, Client(
+                    client_name=client_name,
+                    client_surname=client_surname, id_number=str(id_number or "").strip(),
+                    dob=dob_field.to_python(dob), email=str(email or "").strip(),
+                    phone_number=phone_number,
+                    street_address=street_address, location_address=location_address,
+                    city_address=city_address
+                )))
+
+            except Exception as e:
+                errors.append((i, "; ".join(getattr(e, "messages", [str(e)]))))
+
+        by_id, by_email = _existing_clients(
+            {_id_key(c.id_number) for _, c in parsed},
+            {_email_key(c.email) for _, c in parsed},
+        )
+
+        pending = []  # (row number, unsaved Client)
+        for i, client in parsed:
+            id_key, email_key = _id_key(client.id_number), _email_key(client.email)
+            signature = _signature(client)
+
+            # Duplicates within the file
+            earlier = file_ids.get(id_key) or file_emails.get(email_key)
+            if earlier:
+                row, other = earlier
+                if signature == other:
+                    errors.append((i, f"Duplicate client in file (row {row})"))
+                else:
+                    errors.append((i, f"Conflicts with row {row}: same id_number or email, different details"))
+                continue
+
+            # Duplicates in the database
+            matches = {c.pk: c for c in (by_id.get(id_key), by_email.get(email_key)) if c}
+            if matches:
+                existing = next(iter(matches.values()))
+                if len(matches) == 1 and signature == _signature(existing):
+                    errors.append((i, f"Duplicate client in database ({existing.client_code})"))
+                else:
+                    codes = ", ".join(c.client_code for c in matches.values())
+                    errors.append((i, f"Conflicts with existing client {codes}: "
+                                      f"same id_number or email, different details"))
+                continue
+
+            file_ids[id_key] = file_emails[email_key] = (i, signature)
+            pending.append((i, client))
+
+        if pending:
+            _insert_batch(pending, errors)
+
+        rows_done += len(batch)
+        if progress:
+            progress(rows_done, len(errors))
 
-    return errors
+    return [f"Row {i}: {message}" for i, message in sorted(errors)]
@@ -1,3 +1,81 @@
+import os
+import tempfile
+from datetime import date
+from types import SimpleNamespace
+from unittest import skipUnless
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from clients.models import Client
+from clients.services import process_upload
+
+HEADER = ("client_name,client_surname,id_number,dob,email,phone_number,"
+          "street_address,location_address,city_address\n")
+
+
+class ClientBulkImportTest(TestCase):
+
+    def setUp(self):
+        self.existing = Client.objects.create(
+            client_name="Rudo", client_surname="Banda", id_number="12-123456A12",
+            dob=date(1990, 1, 1), email="rudo@test.com", phone_number="0771234567",
+        )
+
+    def _upload(self, rows):
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as f:
+            f.write(HEADER + "".join(rows))
+        self.addCleanup(os.remove, path)
+        return SimpleNamespace(file=SimpleNamespace(path=path))
+
+    def test_rows_classified_as_new_duplicate_or_conflicting(self):
+        errors = process_upload(self._upload([
+            "Rudo,Banda,12-123456a12,1990-01-01,RUDO@test.com,0771234567,,,\n",
+            "Rudo,Banda,12-123456A12,1991-01-01,rudo@test.com,0771234567,,,\n",
+            "Tino,Dube,63-654321B63,1985-06-01,tino@test.com,0772222222,,,\n",
+            "Tino,Dube,63-654321B63,1985-06-01,tino@test.com,0772222222,,,\n",
+            "Tatenda,Dube,08-111111C08,1985-06-01,tino@test.com,0773333333,,,\n",
+            "Nyasha,Moyo,08-222222D08,not-a-date,nyasha@test.com,0774444444,,,\n",
+        ]))
+
+        self.assertEqual(errors, [
+            f"Row 2: Duplicate client in database ({self.existing.client_code})",
+            f"Row 3: Conflicts with existing client {self.existing.client_code}: "
+            "same id_number or email, different details",
+            "Row 5: Duplicate client in file (row 4)",
+            "Row 6: Conflicts with row 4: same id_number or email, different details",
+            "Row 7: “not-a-date” value has an invalid date format. It must be in YYYY-MM-DD format.",
+        ])
+        new = Client.objects.get(id_number="63-654321B63")
+        self.assertTrue(new.client_code)
+        self.assertNotEqual(new.client_code, self.existing.client_code)
+        self.assertEqual(Client.objects.count(), 2)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def run(prefix, rows):
+            upload = self._upload(
+                f"Client{n},{prefix},{prefix}-{n:06d}X{n % 100:02d},1990-01-01,"
+                f"{prefix}{n}@test.com,0771234567,,,\n"
+                for n in range(rows)
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(process_upload(upload), [])
+            return len(ctx.captured_queries)
+
+        self.assertEqual(run("11", 3), run("22", 30))
+        self.assertEqual(Client.objects.count(), 34)
+
+    @skipUnless(connection.vendor == "sqlite", "reads SQLite query plans")
+    def test_lookups_use_the_expression_indexes(self):
+        with CaptureQueriesContext(connection) as ctx:
+            process_upload(self._upload(["Rudo,Banda,12-123456a12,1990-01-01,RUDO@test.com,0771234567,,,\n"]))
+        lookups = [q["sql"] for q in ctx.captured_queries
+                   if q["sql"].startswith("SELECT") and " IN (" in q["sql"] and '"clients_client"' in q["sql"]]
 
-# Create your tests here.
+        self.assertEqual(len(lookups), 2)
+        with connection.cursor() as cursor:
+            for sql, index in zip(lookups, ("client_id_number_upper_idx", "client_email_lower_idx")):
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                self.assertIn(index, " ".join(str(row[-1]) for row in cursor.fetchall()))
@@ -1,6 +1,7 @@
 
 
 from django.urls import path
+from common.views import JobProgressAPIView
 from .views import (
     ClientListCreateAPIView, ClientDetailAPIView,
     UploadListCreateAPIView,
@@ -17,6 +18,8 @@ urlpatterns = [
     path('uploads/', UploadListCreateAPIView.as_view(), name='upload-list-create'),
     path('uploads/<int:pk>/', UploadRetrieveUpdateDestroyAPIView.as_view(), name='upload-detail'),
     path('uploads/<int:pk>/approve/', ApproveUploadAPIView.as_view()),
+    path('uploads/<int:pk>/progress/', JobProgressAPIView.as_view(kind='clients.upload'),
+         name='clients-upload-progress'),
     path('uploads/files/', UploadListAllAPIView.as_view(), name='uploads-all'),
 
 
@@ -1,3 +1,92 @@
+# commissions/admin.py
 from django.contrib import admin
 
-# Register your models here.
+from commissions.models import (
+    AgentCommissionMonth, CommissionRecord, CommissionSchedule, CommissionStatementDelivery,
+)
+from common import statement_cache
+from common.jobs import enqueue
+
+STATEMENT_EXPORTS = ("json", "csv", "pdf")
+
+
+@admin.register(CommissionRecord)
+class CommissionRecordAdmin(admin.ModelAdmin):
+    list_display = ("id", "commission_month", "policy", "agent", "commission_due", "created_at")
+    list_filter = ("commission_month", "agent")
+    date_hierarchy = "commission_month"
+    search_fields = ("policy__contract_id", "agent__agent_code", "agent__agent_name")
+    list_select_related = ("policy", "agent")
+    actions = ["prewarm_statements", "email_statements"]
+
+    def prewarm_statements(self, request, queryset):
+        """
+        Admin action: build and cache the JSON/CSV/PDF statements of each
+        (agent, month) among the selected records, as served by
+        /commissions/statement/ without ?save.
+        """
+        from agents.models import Agent
+        from commissions.views import CommissionRecordViewSet
+
+        pairs = list(queryset.order_by().values_list("agent_id", "commission_month").distinct())
+        agents = Agent.objects.in_bulk({agent_id for agent_id, _ in pairs})
+        view = CommissionRecordViewSet()
+        built = cached = 0
+        for agent_id, month in pairs:
+            for export in STATEMENT_EXPORTS:
+                entry = view.statement_cache_entry(agents[agent_id], month.replace(day=1), export)
+                if statement_cache.warm(*entry):
+                    built += 1
+                else:
+                    cached += 1
+
+        counts = statement_cache.stats(["commission"])["commission"]
+        self.message_user(
+            request,
+            f"Statements pre-warmed: {built} built, {cached} already cached "
+            f"(cache hits {counts['hit']}, misses {counts['miss']}).",
+        )
+
+    prewarm_statements.short_description = "Pre-warm statement cache for selected agents/months"
+
+    def email_statements(self, request, queryset):
+        """
+        Admin action: queue a job emailing every agent's statement for each
+        month among the selected records (commissions.emails). Agents
+        already emailed for the month are skipped.
+        """
+        from common.jobs import month_job_id
+
+        months = sorted(queryset.order_by().values_list("commission_month", flat=True).distinct())
+        for month in dict.fromkeys(m.replace(day=1) for m in months):
+            job = enqueue("commissions.email_statements", month_job_id(month))
+            self.message_user(request, f"Statement emails for {month:%b %Y} queued (job {job.pk}, {job.status}).")
+
+    email_statements.short_description = "Email statements to all agents for the selected months"
+
+
+@admin.register(CommissionStatementDelivery)
+class CommissionStatementDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("id", "statement_month", "agent", "status", "attempts", "sent_at", "error")
+    list_filter = ("status", "statement_month")
+    search_fields = ("agent__agent_code", "agent__agent_name")
+    list_select_related = ("agent",)
+    readonly_fields = ("agent", "statement_month", "status", "attempts", "error", "sent_at", "updated_at")
+
+
+@admin.register(AgentCommissionMonth)
+class AgentCommissionMonthAdmin(admin.ModelAdmin):
+    list_display = ("agent", "month", "policy_count", "monthly_premium", "commission_due", "updated_at")
+    list_filter = ("month",)
+    date_hierarchy = "month"
+    search_fields = ("agent__agent_code", "agent__agent_name")
+    list_select_related = ("agent",)
+    readonly_fields = ("agent", "month", "policy_count", "monthly_premium", "commission_due", "updated_at")
+
+
+@admin.register(CommissionSchedule)
+class CommissionScheduleAdmin(admin.ModelAdmin):
+    list_display = ("id", "product_name", "branch", "policy_year_from", "policy_year_to", "rate",
+                    "effective_from", "effective_to")
+    list_filter = ("product_name", "branch")
+    date_hierarchy = "effective_from"
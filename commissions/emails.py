@@ -0,0 +1,139 @@
+# commissions/emails.py
+"""
+Emailing commission statements to agents.
+
+`statement_email` builds the message for one agent (also used by the
+`export=email` statement endpoint). `send_statement_emails` emails every
+agent's statement for a month: PDFs are rendered in a process pool and the
+messages go out over one SMTP connection, `chunk_size` at a time. Each
+agent's outcome is kept in CommissionStatementDelivery, so rerunning the
+batch only sends what has not been sent yet.
+"""
+from datetime import date
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F
+from django.utils import timezone
+
+from agents.models import Agent
+from common.readers import batched
+from common.statements import iter_rendered_statements
+from .models import CommissionStatementDelivery, DeliveryStatus
+from .services import build_statement_rows, commission_statement
+
+EMAIL_CHUNK_SIZE = 50
+
+
+def statement_email(agent_name, email, agent_code, month_label, pdf, connection=None):
+    """The statement email for one agent, with the PDF attached."""
+    filename = f"commission_{agent_code}_{month_label}.pdf".replace(" ", "_").lower()
+    subject = f"Commission Statement - {month_label}"
+    body = f"Dear {agent_name},\n\nPlease find attached your commission statement for {month_label}.\n\nRegards,\nZimnat Life Assurance"
+    message = EmailMessage(subject, body, getattr(settings, "DEFAULT_FROM_EMAIL", None), [email],
+                           connection=connection)
+    message.attach(filename, pdf, "application/pdf")
+    return message
+
+
+def record_delivery(agent, month: date, status, error=""):
+    """Record the outcome of emailing one agent's statement."""
+    delivery, _ = CommissionStatementDelivery.objects.get_or_create(agent=agent, statement_month=month)
+    _mark([delivery.pk], status, error=error)
+
+
+def _mark(delivery_ids, status, error=""):
+    fields = {}
+    if status in (DeliveryStatus.SENT, DeliveryStatus.FAILED):
+        fields["attempts"] = F("attempts") + 1
+    if status == DeliveryStatus.SENT:
+        fields["sent_at"] = timezone.now()
+    CommissionStatementDelivery.objects.filter(pk__in=delivery_ids).update(
+        status=status, error=error, updated_at=timezone.now(), **fields)
+
+
+def _reconnect(connection):
+    """
+    Replace a connection a failed send may have left half-way through an
+    SMTP exchange. If the server is still unreachable, send_messages tries
+    to open it again for the next chunk.
+    """
+    try:
+        connection.close()
+        connection.open()
+    except Exception:
+        pass
+
+
+def send_statement_emails(month: date, agent_ids=None, workers=1, chunk_size=EMAIL_CHUNK_SIZE,
+                          resend=False, progress=None) -> dict:
+    """
+    Email each agent's commission statement for `month` (all agents, or
+    those in `agent_ids`). Agents whose delivery is already SENT are left
+    alone unless `resend`. Agents with no email address or no commissionable
+    policies are marked SKIPPED.
+
+    If sending a chunk fails, its agents are marked FAILED with the error
+    and the run carries on over a fresh connection; a later run retries
+    them (the whole chunk, as the SMTP backend does not report which
+    messages got through).
+    `progress(done, failed, total)` is called after every chunk.
+    Returns counts of sent, failed, skipped and already_sent agents.
+    """
+    month = month.replace(day=1)
+    month_label = month.strftime("%b-%y")
+
+    agents = Agent.objects.all()
+    if agent_ids is not None:
+        agents = agents.filter(pk__in=agent_ids)
+    CommissionStatementDelivery.objects.bulk_create(
+        [CommissionStatementDelivery(agent_id=pk, statement_month=month)
+         for pk in agents.values_list("pk", flat=True)],
+        ignore_conflicts=True,
+    )
+
+    deliveries = CommissionStatementDelivery.objects.filter(statement_month=month, agent__in=agents)
+    todo = deliveries if resend else deliveries.exclude(status=DeliveryStatus.SENT)
+    todo = list(todo.select_related("agent").order_by("agent__agent_code"))
+    counts = {"sent": 0, "failed": 0, "skipped": 0,
+              "already_sent": 0 if resend else deliveries.filter(status=DeliveryStatus.SENT).count()}
+
+    def report():
+        if progress:
+            progress(counts["sent"] + counts["skipped"], counts["failed"], len(todo))
+
+    def statements():
+        for delivery in todo:
+            agent = delivery.agent
+            rows, tot_prem, tot_comm = build_statement_rows(agent, month) if agent.email else ([], 0, 0)
+            if not rows:
+                reason = "No commissionable policies." if agent.email else "Agent has no email configured."
+                _mark([delivery.pk], DeliveryStatus.SKIPPED, error=reason)
+                counts["skipped"] += 1
+                continue
+            agent_name = f"{agent.agent_name} {agent.agent_surname}"
+            key = (delivery.pk, agent.agent_name, agent.email, agent.agent_code)
+            yield key, commission_statement(agent.agent_code, agent_name, month_label, rows, tot_prem, tot_comm)
+
+    connection = get_connection(fail_silently=False)
+    connection.open()
+    try:
+        for chunk in batched(iter_rendered_statements(statements(), workers=workers), chunk_size):
+            messages = [statement_email(name, email, code, month_label, pdf, connection=connection)
+                        for (_, name, email, code), pdf in chunk]
+            ids = [key[0] for key, _ in chunk]
+            try:
+                connection.send_messages(messages)
+            except Exception as e:
+                _mark(ids, DeliveryStatus.FAILED, error=str(e) or e.__class__.__name__)
+                counts["failed"] += len(ids)
+                _reconnect(connection)
+            else:
+                _mark(ids, DeliveryStatus.SENT)
+                counts["sent"] += len(ids)
+            report()
+    finally:
+        connection.close()
+
+    report()
+    return counts
@@ -0,0 +1,40 @@
+# commissions/jobs.py
+from django.conf import settings
+
+from common.jobs import job_handler, job_month, report_progress
+from common.models import Job
+from .emails import send_statement_emails
+from .runs import run_commissions
+
+
+@job_handler("commissions.run")
+def run_commissions_job(job):
+    """
+    Generate job.object_id's month (YYYYMM) for payload agent_ids (all
+    agents when absent), incrementally with payload incremental. Progress
+    is counted in agents; the summary counts are kept in payload["result"].
+    """
+    result = run_commissions(
+        job_month(job),
+        agent_ids=job.payload.get("agent_ids"),
+        workers=job.payload.get("workers", settings.COMMISSION_RUN_WORKERS),
+        incremental=job.payload.get("incremental", False),
+        progress=lambda done, total: report_progress(job, done, 0, total),
+    )
+    job.payload["result"] = {key: result[key] for key in
+                             ("created", "updated", "skipped", "deleted", "agents", "shards", "incremental")}
+    Job.objects.filter(pk=job.pk).update(payload=job.payload)
+    return []
+
+
+@job_handler("commissions.email_statements")
+def email_statements_job(job):
+    """Email the statements of job.object_id's month (YYYYMM)."""
+    counts = send_statement_emails(
+        job_month(job),
+        agent_ids=job.payload.get("agent_ids"),
+        workers=job.payload.get("workers", settings.STATEMENT_EMAIL_WORKERS),
+        chunk_size=job.payload.get("chunk_size", settings.STATEMENT_EMAIL_CHUNK_SIZE),
+        progress=lambda done, failed, total: report_progress(job, done, failed, total),
+    )
+    return [f"{counts['failed']} statement email(s) failed; rerun to retry them."] if counts["failed"] else []
@@ -0,0 +1,45 @@
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from commissions.emails import send_statement_emails
+
+
+class Command(BaseCommand):
+    help = ("Email every agent's commission statement for a month over one mail connection. "
+            "Agents already sent to are skipped, so a failed run can simply be rerun.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Commission month as YYYY-MM (default: this month).")
+        parser.add_argument("--agent", type=int, action="append", dest="agents",
+                            help="Only this agent id (repeatable).")
+        parser.add_argument("--workers", type=int, default=settings.STATEMENT_EMAIL_WORKERS,
+                            help="Processes rendering PDFs (default STATEMENT_EMAIL_WORKERS).")
+        parser.add_argument("--chunk-size", type=int, default=settings.STATEMENT_EMAIL_CHUNK_SIZE,
+                            help="Messages per send (default STATEMENT_EMAIL_CHUNK_SIZE).")
+        parser.add_argument("--resend", action="store_true",
+                            help="Also email agents whose statement was already sent.")
+
+    def handle(self, *args, **options):
+        month = date.today().replace(day=1)
+        if options["month"]:
+            try:
+                year, mon = map(int, options["month"].split("-")[:2])
+                month = date(year, mon, 1)
+            except ValueError:
+                raise CommandError("Invalid --month. Use YYYY-MM.")
+        if options["workers"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--workers and --chunk-size must be at least 1.")
+
+        started = time.perf_counter()
+        counts = send_statement_emails(month, agent_ids=options["agents"], workers=options["workers"],
+                                       chunk_size=options["chunk_size"], resend=options["resend"])
+
+        style = self.style.WARNING if counts["failed"] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Commission statements for {month:%b %Y}: {counts['sent']} sent, {counts['failed']} failed, "
+            f"{counts['skipped']} skipped, {counts['already_sent']} already sent, "
+            f"in {time.perf_counter() - started:.2f}s."
+        ))
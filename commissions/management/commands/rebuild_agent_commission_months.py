@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from commissions.models import CommissionRecord
+from commissions.services import refresh_agent_months
+
+
+class Command(BaseCommand):
+    help = "Recompute the AgentCommissionMonth rollup from the CommissionRecord table."
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        months = (CommissionRecord.objects.order_by("commission_month")
+                  .values_list("commission_month", flat=True).distinct())
+        total = 0
+        for month in months:
+            written = refresh_agent_months(month)
+            total += written
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"  {month:%b %Y}: {written} agents ({time.monotonic() - started:.1f}s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {total} agent commission months in {time.monotonic() - started:.1f}s."
+        ))
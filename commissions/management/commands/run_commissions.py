@@ -0,0 +1,48 @@
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from commissions.runs import run_commissions
+
+
+class Command(BaseCommand):
+    help = "Generate a month's commission records, agents split into shards over worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Commission month as YYYY-MM (default: this month).")
+        parser.add_argument("--agent", type=int, action="append", dest="agents",
+                            help="Only this agent id (repeatable).")
+        parser.add_argument("--workers", type=int, default=settings.COMMISSION_RUN_WORKERS,
+                            help="Worker processes (default COMMISSION_RUN_WORKERS).")
+        parser.add_argument("--shards", type=int,
+                            help="Agent shards to split the run into (default: one per worker).")
+        parser.add_argument("--incremental", action="store_true",
+                            help="Only recompute policies changed since the month's last full-book run "
+                                 "(falls back to a full run when there is none).")
+
+    def handle(self, *args, **options):
+        month = date.today().replace(day=1)
+        if options["month"]:
+            try:
+                year, mon = map(int, options["month"].split("-")[:2])
+                month = date(year, mon, 1)
+            except ValueError:
+                raise CommandError("Invalid --month. Use YYYY-MM.")
+        if options["workers"] < 1 or (options["shards"] is not None and options["shards"] < 1):
+            raise CommandError("--workers and --shards must be at least 1.")
+
+        def progress(done, total):
+            self.stdout.write(f"  {done}/{total} agents")
+
+        started = time.perf_counter()
+        result = run_commissions(month, agent_ids=options["agents"], workers=options["workers"],
+                                 shards=options["shards"], incremental=options["incremental"],
+                                 progress=progress)
+        scope = ("changed policies only" if result["incremental"]
+                 else f"{result['agents']} agents in {result['shards']} shards")
+        self.stdout.write(self.style.SUCCESS(
+            f"Commissions for {month:%b %Y}: {result['created']} created, {result['updated']} updated, "
+            f"{result['skipped']} skipped, {result['deleted']} deleted ({scope}), in {time.perf_counter() - started:.2f}s."
+        ))
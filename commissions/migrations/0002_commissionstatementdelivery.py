@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0004_agent_email'),
+        ('commissions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionStatementDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('statement_month', models.DateField(help_text='Use the 1st day of the commission month')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('FAILED', 'Failed'), ('SKIPPED', 'Skipped')], db_index=True, default='PENDING', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('agent', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='statement_deliveries', to='agents.agent')),
+            ],
+            options={
+                'ordering': ['statement_month', 'agent__agent_code'],
+                'unique_together': {('agent', 'statement_month')},
+            },
+        ),
+    ]
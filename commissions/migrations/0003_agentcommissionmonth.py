@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:19
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0004_agent_email'),
+        ('commissions', '0002_commissionstatementdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentCommissionMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='1st day of the commission month')),
+                ('policy_count', models.PositiveIntegerField(default=0)),
+                ('monthly_premium', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('commission_due', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('agent', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='commission_months', to='agents.agent')),
+            ],
+            options={
+                'ordering': ['agent', '-month'],
+                'unique_together': {('agent', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commissions', '0003_agentcommissionmonth'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionMonthRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='1st day of the commission month', unique=True)),
+                ('started_at', models.DateTimeField()),
+                ('global_version', models.PositiveBigIntegerField(default=0)),
+                ('incremental', models.BooleanField(default=False)),
+                ('policies', models.PositiveIntegerField(default=0, help_text='Policies recomputed')),
+            ],
+        ),
+    ]
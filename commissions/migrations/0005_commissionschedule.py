@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:28
+
+import datetime
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def seed_default_rate(apps, schema_editor):
+    """The flat 10% that was hard-coded before schedules existed."""
+    CommissionSchedule = apps.get_model("commissions", "CommissionSchedule")
+    CommissionSchedule.objects.create(rate=Decimal("0.1000"), effective_from=datetime.date(2000, 1, 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commissions', '0004_commissionmonthrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_name', models.CharField(blank=True, choices=[('AFFINITY', 'Affinity'), ('FUNERAL', 'Funeral')], help_text='Blank: any product', max_length=30)),
+                ('branch', models.CharField(blank=True, choices=[('HARARE', 'Harare'), ('MUTARE', 'Mutare'), ('KWEKWE', 'Kwekwe'), ('BULAWAYO', 'Bulawayo'), ('MASVINGO', 'Masvingo'), ('VICTORIA_FALLS', 'Victoria Falls')], help_text='Agent branch; blank: any branch', max_length=100)),
+                ('policy_year_from', models.PositiveIntegerField(default=1, help_text='First policy year (1 = first 12 months)')),
+                ('policy_year_to', models.PositiveIntegerField(blank=True, help_text='Last policy year; blank: no end', null=True)),
+                ('rate', models.DecimalField(decimal_places=4, help_text='e.g. 0.1000 for 10%', max_digits=5)),
+                ('effective_from', models.DateField()),
+                ('effective_to', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['product_name', 'branch', 'policy_year_from', '-effective_from'],
+            },
+        ),
+        migrations.RunPython(seed_default_rate, migrations.RunPython.noop),
+    ]
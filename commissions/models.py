@@ -1,5 +1,6 @@
 # commissions/models.py
 from decimal import Decimal
+from django.core.exceptions import ValidationError
 from django.db import models
 from policies.models import Policy
 from agents.models import Agent
@@ -36,9 +37,6 @@ class CommissionRecord(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
-    # Commission rate
-    COMMISSION_RATE = Decimal("0.10")
-
     class Meta:
         unique_together = ("policy", "commission_month")
         ordering = ["policy__contract_id"]
@@ -65,10 +63,157 @@ class CommissionRecord(models.Model):
 
     # ---------- Core logic ----------
     def _compute_commission_due(self) -> Decimal:
-        premium = Decimal(self.policy.contract_premium or 0)
-        return (premium * self.COMMISSION_RATE).quantize(Decimal("0.01"))
+        from commissions.schedules import rate_for
+        from commissions.services import compute_commission
+
+        policy, month = self.policy, self.commission_month.replace(day=1)
+        rate = rate_for(policy.product_name, self.agent.branch, policy.start_date, month)
+        return compute_commission(policy.contract_premium, rate, policy.frequency)
 
     def save(self, *args, **kwargs):
         self.commission_due = self._compute_commission_due()
         super().save(*args, **kwargs)
+        self._refresh_rollup()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._refresh_rollup()
+        return result
+
+    def _refresh_rollup(self):
+        from commissions.services import refresh_agent_months
+        refresh_agent_months(self.commission_month, agent_ids=[self.agent_id])
+
+
+
+class DeliveryStatus(models.TextChoices):
+    PENDING = "PENDING", "Pending"
+    SENT = "SENT", "Sent"
+    FAILED = "FAILED", "Failed"
+    SKIPPED = "SKIPPED", "Skipped"
+
+
+class CommissionStatementDelivery(models.Model):
+    """
+    Whether an agent's commission statement for a month has been emailed.
+    One row per (agent, statement_month); the batch sender
+    (commissions.emails.send_statement_emails) skips agents already SENT,
+    so a failed run resumes where it stopped.
+    """
+
+    agent = models.ForeignKey(
+        Agent,
+        on_delete=models.PROTECT,
+        related_name="statement_deliveries",
+        editable=False
+    )
+    statement_month = models.DateField(help_text="Use the 1st day of the commission month")
+
+    status = models.CharField(max_length=10, choices=DeliveryStatus.choices,
+                              default=DeliveryStatus.PENDING, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("agent", "statement_month")
+        ordering = ["statement_month", "agent__agent_code"]
+
+    def __str__(self):
+        return f"{self.agent.agent_code} - {self.statement_month:%b %Y} ({self.status})"
+
 
+class AgentCommissionMonth(models.Model):
+    """
+    Per-agent totals of one commission month: a rollup of CommissionRecord
+    kept up to date by commissions.services.refresh_agent_months whenever
+    commission rows are written, so history queries read O(months) rows.
+    """
+
+    agent = models.ForeignKey(
+        Agent,
+        on_delete=models.PROTECT,
+        related_name="commission_months",
+        editable=False
+    )
+    month = models.DateField(help_text="1st day of the commission month")
+
+    policy_count = models.PositiveIntegerField(default=0)
+    monthly_premium = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    commission_due = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("agent", "month")
+        ordering = ["agent", "-month"]
+
+    def __str__(self):
+        return f"{self.agent.agent_code} - {self.month:%b %Y}"
+
+
+class CommissionMonthRun(models.Model):
+    """
+    The last generation of a commission month over the whole book. An
+    incremental run (commissions.runs.run_commissions) recomputes only the
+    policies in the PolicyChange journal since `started_at`, provided no
+    book-wide change (GLOBAL data version) happened in between.
+    """
+
+    month = models.DateField(unique=True, help_text="1st day of the commission month")
+    started_at = models.DateTimeField()
+    global_version = models.PositiveBigIntegerField(default=0)
+    incremental = models.BooleanField(default=False)
+    policies = models.PositiveIntegerField(default=0, help_text="Policies recomputed")
+
+    def __str__(self):
+        return f"{self.month:%b %Y} @ {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class CommissionSchedule(models.Model):
+    """
+    A commission rate and the policies it applies to: a product, an agent
+    branch and a range of policy years, each left blank (or 1 onwards) to
+    match any, within effective dates. Where several match, the most
+    specific wins (product, then branch, then policy years), then the
+    latest effective_from.
+    Evaluated through commissions.schedules.
+    """
+
+    product_name = models.CharField(max_length=30, choices=Policy.product_naming.choices, blank=True,
+                                    help_text="Blank: any product")
+    branch = models.CharField(max_length=100, choices=Agent.Branch_option.choices, blank=True,
+                              help_text="Agent branch; blank: any branch")
+    policy_year_from = models.PositiveIntegerField(default=1, help_text="First policy year (1 = first 12 months)")
+    policy_year_to = models.PositiveIntegerField(null=True, blank=True, help_text="Last policy year; blank: no end")
+
+    rate = models.DecimalField(max_digits=5, decimal_places=4, help_text="e.g. 0.1000 for 10%")
+    effective_from = models.DateField()
+    effective_to = models.DateField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["product_name", "branch", "policy_year_from", "-effective_from"]
+
+    def __str__(self):
+        return (f"{self.product_name or 'Any product'} / {self.branch or 'any branch'} "
+                f"year {self.policy_year_from}+: {self.rate:.2%}")
+
+    def clean(self):
+        if self.policy_year_to is not None and self.policy_year_to < self.policy_year_from:
+            raise ValidationError("policy_year_to must not be before policy_year_from.")
+        if self.effective_to and self.effective_to < self.effective_from:
+            raise ValidationError("effective_to must not be before effective_from.")
+
+    # rates feed every commission figure and the per-process compiled table
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from commissions.schedules import schedules_changed
+        schedules_changed()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        from commissions.schedules import schedules_changed
+        schedules_changed()
+        return result
@@ -0,0 +1,149 @@
+# commissions/runs.py
+"""
+Commission run engine.
+
+`run_commissions` generates a month's CommissionRecords by splitting the
+agents into shards of roughly equal policy counts and running
+`generate_commissions_for_month` for each shard in its own process, with
+its own database connection and transaction. Every commission run (admin
+view, `manage.py run_commissions`, the "commissions.run" job) goes
+through here, for one agent or for all of them.
+
+An incremental run recomputes only the policies changed since the month's
+last book-wide run (the PolicyChange journal), which after a few
+corrections is a handful of rows instead of the whole book.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, timedelta
+
+from django.db import connection, connections
+from django.db.models import Count
+from django.utils import timezone
+
+from common import versions
+from common.workers import init_worker
+from policies.models import Policy
+from .models import CommissionMonthRun
+from .services import COMMISSION_BATCH_SIZE, generate_commissions_for_month
+
+COUNTS = ("created", "updated", "skipped", "deleted")
+
+# Journal entries stamped this long before the last run's start are read
+# again, so changes whose transaction committed after that run had read
+# the journal are not missed.
+JOURNAL_OVERLAP = timedelta(minutes=5)
+
+
+def shard_agents(agent_ids=None, shards=1):
+    """
+    Split the agents that have policies (all, or those in `agent_ids`)
+    into at most `shards` lists, largest agents first onto the lightest
+    shard, so each shard holds about the same number of policies.
+    """
+    policies = Policy.objects.all()
+    if agent_ids is not None:
+        policies = policies.filter(agent_id__in=agent_ids)
+    sizes = (policies.order_by().values("agent_id").annotate(n=Count("pk"))
+             .order_by("-n", "agent_id").values_list("agent_id", "n"))
+
+    buckets = [[0, []] for _ in range(max(shards, 1))]
+    for agent_id, n in sizes:
+        bucket = min(buckets, key=lambda b: b[0])
+        bucket[0] += n
+        bucket[1].append(agent_id)
+    return [ids for _, ids in buckets if ids]
+
+
+def _run_shard(month, agent_ids, batch_size):
+    return len(agent_ids), generate_commissions_for_month(month, agent_ids=agent_ids, batch_size=batch_size)
+
+
+def _global_version():
+    return versions.current([])[versions.GLOBAL]
+
+
+def changed_since(month: date):
+    """
+    Where an incremental run of `month` can start reading the journal, or
+    None when it needs a full run: the month was never generated for the
+    whole book, or a book-wide change (month roll) happened since.
+    """
+    last = CommissionMonthRun.objects.filter(month=month).first()
+    if last is None or last.global_version != _global_version():
+        return None
+    return last.started_at - JOURNAL_OVERLAP
+
+
+def run_commissions(month: date, agent_ids=None, workers=1, shards=None, incremental=False,
+                    batch_size=COMMISSION_BATCH_SIZE, progress=None) -> dict:
+    """
+    Generate the month's commissions for all agents, or those in
+    `agent_ids`, over `workers` processes. `shards` (default: workers)
+    sets how many pieces the agents are split into. Each shard commits on
+    its own, so an interrupted run leaves whole shards written; rerunning
+    is safe as records are upserted.
+
+    With `incremental`, only policies changed since the month's last
+    book-wide run are recomputed (in this process); it falls back to a
+    full run when changed_since() says so. A completed book-wide run (no
+    `agent_ids`) is recorded as the starting point of the next one.
+
+    Runs in this process when workers is 1, and when called inside a
+    transaction (other processes could not see its uncommitted data).
+    `progress(agents_done, agents_total)` is called as shards finish.
+    Returns the summed created/updated/skipped/deleted counts, plus the
+    month, the number of agents and shards (0 for an incremental run), and
+    whether the run was incremental.
+    """
+    month = month.replace(day=1)
+    started, global_version = timezone.now(), _global_version()
+    since = changed_since(month) if incremental else None
+
+    result = dict.fromkeys(COUNTS, 0)
+    if since is not None:
+        counts = generate_commissions_for_month(month, agent_ids=agent_ids, changed_since=since,
+                                                batch_size=batch_size)
+        result.update((key, counts[key]) for key in COUNTS)
+        plan = []  # not sharded: the changed policies are few
+    else:
+        plan = _run_shards(month, agent_ids, workers, shards, batch_size, progress, result)
+
+    if agent_ids is None:
+        CommissionMonthRun.objects.update_or_create(month=month, defaults={
+            "started_at": started, "global_version": global_version, "incremental": since is not None,
+            "policies": result["created"] + result["updated"] + result["skipped"],
+        })
+
+    result.update(month=month, agents=sum(len(ids) for ids in plan), shards=len(plan),
+                  incremental=since is not None)
+    return result
+
+
+def _run_shards(month, agent_ids, workers, shards, batch_size, progress, result):
+    """Run the month over agent shards, adding the counts to `result`; returns the shard plan."""
+    inline = workers <= 1 or connection.in_atomic_block
+    plan = shard_agents(agent_ids, shards or (1 if inline else workers))
+    total = sum(len(ids) for ids in plan)
+    done = 0
+
+    def collect(agents, counts):
+        nonlocal done
+        done += agents
+        for key in COUNTS:
+            result[key] += counts[key]
+        if progress:
+            progress(done, total)
+
+    if inline:
+        for ids in plan:
+            collect(*_run_shard(month, ids, batch_size))
+    else:
+        # children must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(workers, len(plan)) or 1, initializer=init_worker) as pool:
+            pending = {pool.submit(_run_shard, month, ids, batch_size) for ids in plan}
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(*future.result())
+    return plan
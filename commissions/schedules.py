@@ -0,0 +1,105 @@
+# commissions/schedules.py
+"""
+Commission rates from the CommissionSchedule table.
+
+The schedules are compiled into an in-memory lookup table, kept per
+process and rebuilt when the "commission_schedule" data version moves
+(bumped on every schedule save/delete, see `schedules_changed`). Checking
+the version is the only query an evaluation makes.
+
+`rates_for` evaluates a whole batch of policies at once: each distinct
+(product, branch, policy year) is resolved once, so a month's book costs
+a handful of dict lookups per row rather than a query per policy.
+"""
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+
+from common import versions
+
+SCOPE = "commission_schedule"
+NO_RATE = Decimal("0")
+
+_compiled = {"version": None, "table": None}
+
+
+@dataclass(frozen=True)
+class _Entry:
+    specificity: int
+    effective_from: date
+    effective_to: date
+    year_from: int
+    year_to: int
+    rate: Decimal
+
+    def applies(self, year, month):
+        return (self.year_from <= year and (self.year_to is None or year <= self.year_to)
+                and self.effective_from <= month
+                and (self.effective_to is None or month <= self.effective_to))
+
+
+def schedules_changed():
+    """Invalidate compiled tables (every process) and the figures built on the rates."""
+    versions.bump([SCOPE, versions.GLOBAL])
+    _compiled["version"] = None  # this process: even if the bump is later rolled back
+
+
+def policy_year(start_date: date, month: date) -> int:
+    """1 for the first twelve months from start_date, 2 for the next twelve, ..."""
+    return max((month.year - start_date.year) * 12 + month.month - start_date.month, 0) // 12 + 1
+
+
+def _compile():
+    """{(product or "", branch or ""): [_Entry, ...]} with the preferred entries first."""
+    from .models import CommissionSchedule
+
+    table = {}
+    for s in CommissionSchedule.objects.order_by():
+        entry = _Entry(
+            specificity=(bool(s.product_name) * 4 + bool(s.branch) * 2
+                         + (s.policy_year_from > 1 or s.policy_year_to is not None)),
+            effective_from=s.effective_from, effective_to=s.effective_to,
+            year_from=s.policy_year_from, year_to=s.policy_year_to, rate=s.rate,
+        )
+        table.setdefault((s.product_name, s.branch), []).append(entry)
+    for entries in table.values():
+        entries.sort(key=lambda e: (e.specificity, e.effective_from), reverse=True)
+    return table
+
+
+def _table():
+    version = versions.current([SCOPE])[SCOPE]
+    if _compiled["version"] != version:
+        _compiled["table"], _compiled["version"] = _compile(), version
+    return _compiled["table"]
+
+
+def _lookup(table, product, branch, year, month):
+    best = None
+    for key in ((product, branch), (product, ""), ("", branch), ("", "")):
+        for entry in table.get(key, ()):
+            if entry.applies(year, month):
+                if best is None or (entry.specificity, entry.effective_from) > (best.specificity, best.effective_from):
+                    best = entry
+                break  # entries are sorted: the first match is this key's best
+    return best.rate if best else NO_RATE
+
+
+def rates_for(policies, month: date):
+    """
+    Commission rates for `month`, one per (product_name, branch, start_date)
+    in `policies`, in order. Policies no schedule covers get rate 0.
+    """
+    table = _table()
+    resolved = {}
+    rates = []
+    for product, branch, start_date in policies:
+        key = (product or "", branch or "", policy_year(start_date, month))
+        if key not in resolved:
+            resolved[key] = _lookup(table, *key, month)
+        rates.append(resolved[key])
+    return rates
+
+
+def rate_for(product, branch, start_date, month: date) -> Decimal:
+    return rates_for([(product, branch, start_date)], month)[0]
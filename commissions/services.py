@@ -4,61 +4,197 @@ from decimal import Decimal, ROUND_HALF_UP
 from datetime import date
 
 from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Sum, Value, When
+from django.db.models.functions import Round
 
-from commissions.models import CommissionRecord
-from policies.models import Policy
+from commissions.models import AgentCommissionMonth, CommissionRecord
+from commissions.schedules import rates_for
+from common.exports import STREAM_CHUNK_SIZE
+from common.readers import batched
+from common.statements import Statement
+from policies.models import Policy, PolicyChange
 
-COMMISSION_RATE = Decimal("0.10")
+COMMISSION_BATCH_SIZE = 1000  # CommissionRecord rows per upsert
+MONTHS_PER_PERIOD = {"M": 1, "Q": 3, "H": 6, "Y": 12}  # policy frequency -> months
 
 
 def _first_of_month(d: date) -> date:
     return date(d.year, d.month, 1)
 
 
-def compute_commission(premium) -> Decimal:
-    prem = Decimal(premium or 0)
-    return (prem * COMMISSION_RATE).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+def monthly_premium(premium, frequency="M") -> Decimal:
+    """contract_premium is per policy frequency period; convert to monthly."""
+    months = MONTHS_PER_PERIOD.get(frequency, 1)
+    return (Decimal(premium or 0) / Decimal(months)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
 
-@transaction.atomic
-def generate_commissions_for_month(commission_month: date) -> dict:
+def compute_commission(premium, rate, frequency="M") -> Decimal:
+    """Commission for one month: the schedule rate on the monthly premium."""
+    return (monthly_premium(premium, frequency) * rate).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def commission_statement(agent_code, agent_name, month_label, rows, tot_prem, tot_comm):
+    """common.statements.Statement for the PDF of an agent's statement rows."""
+    return Statement(
+        layout="commission",
+        header=[("Agent_code", agent_code), ("Agent_name", agent_name), ("Commission Month", month_label)],
+        rows=[[r["contract_id"], r["client_name"], r["status"], r["agent_code"], r["agent_name"],
+               r["contract_premium"], r["commission_due"]] for r in rows],
+        totals={5: tot_prem, 6: tot_comm},
+    )
+
+
+def statement_rows(agent, month: date):
+    """
+    Yield an agent's statement rows for `month`, one dict per commissionable
+    policy (Policy.objects.commissionable_for), reading the policies through
+    a server-side cursor. Amounts are Decimals; nothing is written.
+    """
+    policies = (Policy.objects.commissionable_for(month)
+                .filter(agent=agent)
+                .select_related("client")
+                .order_by("contract_id"))
+    agent_name = f"{agent.agent_name} {agent.agent_surname}"
+
+    for chunk in batched(policies.iterator(chunk_size=STREAM_CHUNK_SIZE), STREAM_CHUNK_SIZE):
+        rates = rates_for([(p.product_name, agent.branch, p.start_date) for p in chunk], month)
+        for p, rate in zip(chunk, rates):
+            yield {
+                "contract_id": p.contract_id,
+                "client_name": str(p.client) if p.client_id else "",
+                "status": p.overall_policy_status,  # annotated by commissionable_for
+                "agent_code": agent.agent_code,
+                "agent_name": agent_name,
+                "contract_premium": monthly_premium(p.contract_premium, p.frequency),
+                "commission_due": compute_commission(p.contract_premium, rate, p.frequency),
+            }
+
+
+def build_statement_rows(agent, month: date):
+    """(rows, total monthly premium, total commission due) of statement_rows."""
+    rows = list(statement_rows(agent, month))
+    tot_prem = sum((r["contract_premium"] for r in rows), Decimal("0.00"))
+    tot_comm = sum((r["commission_due"] for r in rows), Decimal("0.00"))
+    return rows, tot_prem, tot_comm
+
+
+def _upsert_batch(month: date, rows) -> list:
+    """
+    Insert or update a batch of CommissionRecords; returns the agent ids
+    of the rows that already existed (one per row).
+    """
+    previous = list(CommissionRecord.objects.filter(
+        commission_month=month, policy_id__in=[r.policy_id for r in rows]
+    ).order_by().values_list("agent_id", flat=True))
+    CommissionRecord.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["policy", "commission_month"],
+        update_fields=["agent", "commission_due"],
+    )
+    return previous
+
+
+def delete_uncommissionable(month: date, policies):
     """
-    Create/Update CommissionRecord for ALL policies for the given month.
-    Returns a summary dict with counts.
-    Assumptions:
-      - Policy has fields: contract_premium, agent (FK)
-      - We include all policies; filter as needed (e.g., active only).
+    Delete the `month` CommissionRecords of `policies` (a Policy queryset)
+    that are no longer commissionable, e.g. cancelled since the last run.
+    Returns (records deleted, their agent ids).
+    """
+    stale = (CommissionRecord.objects.filter(commission_month=month, policy__in=policies.values("pk"))
+             .exclude(policy__in=policies.commissionable_for(month).values("pk")))
+    agent_ids = set(stale.values_list("agent_id", flat=True))
+    deleted = stale.delete()[0] if agent_ids else 0
+    return deleted, agent_ids
+
+
+def refresh_agent_months(commission_month: date, agent_ids=None):
+    """
+    Rebuild the AgentCommissionMonth rollup of `commission_month` from its
+    CommissionRecords, for the agents in `agent_ids` (all agents if None).
+    Agents left with no records lose their row.
     """
     month = _first_of_month(commission_month)
+    money = DecimalField(max_digits=14, decimal_places=2)
+    monthly_premium = Case(
+        *[When(policy__frequency=freq, then=Round(F("policy__contract_premium") / Value(Decimal(months)), 2))
+          for freq, months in MONTHS_PER_PERIOD.items()],
+        default=Value(Decimal("0.00")),
+        output_field=money,
+    )
+
+    records = CommissionRecord.objects.filter(commission_month=month)
+    rollups = AgentCommissionMonth.objects.filter(month=month)
+    if agent_ids is not None:
+        records = records.filter(agent_id__in=agent_ids)
+        rollups = rollups.filter(agent_id__in=agent_ids)
+
+    totals = (records.order_by().values("agent_id")
+              .annotate(count=Count("pk"), premium=Sum(monthly_premium), due=Sum("commission_due")))
+    rows = [AgentCommissionMonth(agent_id=t["agent_id"], month=month, policy_count=t["count"],
+                                 monthly_premium=t["premium"] or Decimal("0.00"),
+                                 commission_due=t["due"] or Decimal("0.00"))
+            for t in totals]
+    rollups.exclude(agent_id__in=[r.agent_id for r in rows]).delete()
+    AgentCommissionMonth.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["agent", "month"],
+        update_fields=["policy_count", "monthly_premium", "commission_due", "updated_at"],
+    )
+    return len(rows)
+
 
-    # If you only want active policies, add your status filter here.
-    # Example (adjust to your model): Policy.objects.filter(overall_policy_status="Active")
-    policies = Policy.objects.select_related("agent")
-
-    created = 0
-    updated = 0
-    skipped = 0
-
-    for p in policies:
-        # Must have an agent to pay commission—skip otherwise
-        if not getattr(p, "agent_id", None):
-            skipped += 1
-            continue
-
-        commission_due = compute_commission(p.contract_premium)
-
-        obj, was_created = CommissionRecord.objects.update_or_create(
-            policy=p,
-            commission_month=month,
-            defaults={
-                "agent": p.agent,
-                "commission_due": commission_due,
-            },
-        )
-        if was_created:
-            created += 1
-        else:
-            updated += 1
-
-    return {"created": created, "updated": updated, "skipped": skipped, "month": month}
+@transaction.atomic
+def generate_commissions_for_month(commission_month: date, agent_ids=None, changed_since=None,
+                                   batch_size=COMMISSION_BATCH_SIZE) -> dict:
+    """
+    Create/Update CommissionRecord for every commissionable policy
+    (Policy.objects.commissionable_for) for the given month, optionally
+    only for the agents in `agent_ids` and/or the policies in the
+    PolicyChange journal since `changed_since`. The records of the policies
+    in scope that are no longer commissionable (e.g. cancelled since the
+    last run) are deleted. Returns a summary dict with counts;
+    `skipped` counts the policies that are not commissionable, `deleted`
+    the records removed.
+
+    Policies are read in one query with the eligibility rules applied in
+    SQL; the rows are written with batched upserts (INSERT ... ON CONFLICT
+    UPDATE), so the run costs a few queries per batch rather than per policy.
+    """
+    month = _first_of_month(commission_month)
 
+    policies = Policy.objects.all()
+    if agent_ids is not None:
+        policies = policies.filter(agent_id__in=agent_ids)
+    if changed_since is not None:
+        policies = policies.filter(pk__in=PolicyChange.objects.filter(changed_at__gte=changed_since)
+                                   .values("policy_id"))
+    commissionable = (policies.commissionable_for(month)
+                      .order_by("pk")
+                      .values_list("pk", "agent_id", "contract_premium", "frequency",
+                                   "product_name", "agent__branch", "start_date"))
+
+    created = updated = total = 0
+    touched = set()
+    for batch in batched(commissionable.iterator(chunk_size=batch_size), batch_size):
+        rates = rates_for([row[4:] for row in batch], month)
+        previous = _upsert_batch(month, [
+            CommissionRecord(policy_id=pk, agent_id=agent_id, commission_month=month,
+                             commission_due=compute_commission(premium, rate, frequency))
+            for (pk, agent_id, premium, frequency, *_), rate in zip(batch, rates)
+        ])
+        touched.update(row[1] for row in batch)
+        touched.update(previous)
+        total += len(batch)
+        created, updated = created + len(batch) - len(previous), updated + len(previous)
+
+    deleted, owners = delete_uncommissionable(month, policies)
+    touched.update(owners)
+
+    # a full run rebuilds the whole month; otherwise only the agents whose rows changed
+    full = agent_ids is None and changed_since is None
+    refresh_agent_months(month, agent_ids=None if full else touched)
+
+    skipped = policies.count() - total
+    return {"created": created, "updated": updated, "skipped": skipped, "deleted": deleted, "month": month}
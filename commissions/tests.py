@@ -1,3 +1,561 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+
+from access.models import Administrator
+from agents.models import Agent
+from clients.models import Client
+from commissions.models import (
+    AgentCommissionMonth, CommissionRecord, CommissionSchedule, CommissionStatementDelivery, DeliveryStatus,
+)
+from paypoints.models import Paypoint
+from policies.models import Policy, PolicyChange
+from policies.changes import notify_policies_changed
+
+MONTH = date(2024, 7, 1)
+
+
+class CommissionFixtures:
+    """An agent whose policies are paid up (Active) unless asked otherwise."""
+
+    def setUp(self):
+        self.user = Administrator.objects.create_user(email="commission@test.com", password="pass123")
+        self.agent = self.make_agent("Tendai")
+        self.paypoint = Paypoint.objects.create(paypoint_code="ppscomm", paypoint_name="Commission Co",
+                                                date_joined=date(2020, 1, 1))
+        self.count = 0
+
+    def make_agent(self, name, **fields):
+        return Agent.objects.create(agent_name=name, agent_surname="Moyo", branch="HARARE",
+                                    date_joining=date(2020, 1, 1), **fields)
+
+    def make_policies(self, n, agent=None, start=date(2024, 1, 1), paid=True):
+        policies = []
+        for _ in range(n):
+            self.count += 1
+            client = Client.objects.create(
+                client_name=f"Client{self.count}", client_surname="Comm",
+                id_number=f"{self.count:02d}-{self.count:06d}C{self.count % 100:02d}",
+                dob=date(1990, 1, 1), email=f"comm{self.count}@test.com", phone_number="0771234567",
+            )
+            policies.append(Policy.objects.create(
+                product_name="FUNERAL", proposal_sign_date=date(2023, 12, 1), start_date=start,
+                agent=agent or self.agent, paypoint=self.paypoint, client=client, frequency="M",
+                cover=1000, current_month=MONTH,
+            ))
+        if paid:
+            self.pay_up(policies)
+        return policies
+
+    def pay_up(self, policies):
+        ids = [p.pk for p in policies]
+        for p in policies:
+            Policy.objects.filter(pk=p.pk).update(total_premium_received=p.contract_premium * 7)
+        notify_policies_changed(ids)  # as the receipt writers do
+
+    def cancel(self, policy):
+        from cancellations.models import CancellationRequest
+
+        CancellationRequest.objects.create(policy=policy, requested_by=self.user,
+                                           effective_date=date(2024, 6, 1), status="APPROVED")
+
+
+class GenerateCommissionsTest(CommissionFixtures, TestCase):
+
+    def test_only_commissionable_policies_are_written(self):
+        from commissions.services import compute_commission, generate_commissions_for_month
+
+        active = self.make_policies(2)
+        unpaid = self.make_policies(1, paid=False)[0]
+        cancelled = self.make_policies(1)[0]
+        self.cancel(cancelled)
+        later = self.make_policies(1, start=date(2024, 9, 1))[0]
+
+        result = generate_commissions_for_month(MONTH)
+
+        self.assertEqual((result["created"], result["updated"], result["skipped"]), (2, 0, 3))
+        expected = {p.pk for p in Policy.objects.all() if p.is_commissionable(MONTH)}
+        self.assertEqual(set(CommissionRecord.objects.values_list("policy_id", flat=True)), expected)
+        self.assertEqual(expected, {p.pk for p in active})
+        self.assertNotIn(unpaid.pk, expected)
+        self.assertNotIn(later.pk, expected)
+        record = CommissionRecord.objects.get(policy=active[0])
+        self.assertEqual(record.commission_due, compute_commission(active[0].contract_premium, Decimal("0.10")))
+
+    def test_rerun_updates_in_place(self):
+        from commissions.services import generate_commissions_for_month
+
+        policy = self.make_policies(2)[0]
+        generate_commissions_for_month(MONTH)
+        CommissionRecord.objects.filter(policy=policy).update(commission_due=Decimal("0.00"))
+
+        result = generate_commissions_for_month(MONTH)
+
+        self.assertEqual((result["created"], result["updated"]), (0, 2))
+        self.assertEqual(CommissionRecord.objects.count(), 2)
+        self.assertNotEqual(CommissionRecord.objects.get(policy=policy).commission_due, Decimal("0.00"))
+
+    def test_rerun_deletes_records_no_longer_commissionable(self):
+        from commissions.services import generate_commissions_for_month
+
+        kept, cancelled = self.make_policies(2)
+        generate_commissions_for_month(MONTH)
+        self.cancel(cancelled)
+
+        result = generate_commissions_for_month(MONTH, agent_ids=[self.agent.pk])
+
+        self.assertEqual((result["updated"], result["skipped"], result["deleted"]), (1, 1, 1))
+        self.assertEqual(list(CommissionRecord.objects.values_list("policy_id", flat=True)), [kept.pk])
+        self.assertEqual(AgentCommissionMonth.objects.get(agent=self.agent, month=MONTH).policy_count, 1)
+
+    def test_query_count_does_not_grow_with_policies(self):
+        from commissions.services import generate_commissions_for_month
+
+        def run():
+            with CaptureQueriesContext(connection) as ctx:
+                generate_commissions_for_month(MONTH)
+            return len(ctx.captured_queries)
+
+        self.make_policies(2)
+        small = run()
+        self.make_policies(20)
+        self.assertEqual(run(), small)
+        self.assertEqual(CommissionRecord.objects.count(), 22)
+
+
+class CommissionableForTest(CommissionFixtures, TestCase):
+
+    def test_matches_is_commissionable(self):
+        from cancellations.models import CancellationRequest
+        from claims.models import Claim, ClaimStatus
+
+        active = self.make_policies(1)[0]
+        self.make_policies(1, paid=False)
+        self.cancel(self.make_policies(1)[0])
+        requested = self.make_policies(1)[0]
+        CancellationRequest.objects.create(policy=requested, requested_by=self.user,
+                                           effective_date=date(2024, 8, 1))
+        dead = self.make_policies(1)[0]
+        Claim.objects.create(policy=dead, account_number="1", claim_form="c.png",
+                             status=ClaimStatus.APPROVED)
+        self.make_policies(1, start=date(2024, 9, 1))
+
+        expected = {p.pk for p in Policy.objects.all() if p.is_commissionable(MONTH)}
+        found = set(Policy.objects.commissionable_for(MONTH).values_list("pk", flat=True))
+
+        self.assertEqual(found, expected)
+        self.assertEqual(found, {active.pk, requested.pk, dead.pk})
+
+    def test_agent_filter(self):
+        from commissions.services import generate_commissions_for_month
+
+        other = self.make_agent("Rudo")
+        self.make_policies(2)
+        self.make_policies(1, paid=False)
+        self.make_policies(3, agent=other)
+
+        result = generate_commissions_for_month(MONTH, agent_ids=[self.agent.pk])
+
+        self.assertEqual((result["created"], result["skipped"]), (2, 1))
+        self.assertEqual(set(CommissionRecord.objects.values_list("agent_id", flat=True)), {self.agent.pk})
+
+
+class StatementQueryTest(CommissionFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def statement_queries(self, **params):
+        url = f"/commissions/commissions/statement/?agent_id={self.agent.pk}&month=2024-07"
+        url += "".join(f"&{k}={v}" for k, v in params.items())
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        queries = [q["sql"] for q in ctx.captured_queries
+                   if not any(s in q["sql"] for s in ("django_session", "access_administrator", "SAVEPOINT"))]
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_policies(self):
+        self.make_policies(2)
+        self.make_policies(1, paid=False)
+        response, small = self.statement_queries()
+        self.assertEqual(response.json()["count"], 2)
+
+        cache.clear()
+        self.make_policies(10)
+        response, large = self.statement_queries()
+        self.assertEqual(response.json()["count"], 12)
+        self.assertEqual(large, small)
+
+    def test_save_inserts_missing_records_once(self):
+        self.make_policies(3)
+        self.statement_queries(save="true")
+        self.statement_queries(save="true")
+        self.assertEqual(CommissionRecord.objects.filter(commission_month=MONTH).count(), 3)
+
+    def test_csv_save_writes_before_streaming(self):
+        self.make_policies(3)
+        response = self.client.get(
+            f"/commissions/commissions/statement/?agent_id={self.agent.pk}&month=2024-07&export=csv&save=true")
+
+        # the records are in place before a byte of the CSV is read
+        self.assertEqual(CommissionRecord.objects.filter(commission_month=MONTH).count(), 3)
+        self.assertEqual(AgentCommissionMonth.objects.get(agent=self.agent, month=MONTH).policy_count, 3)
+        with CaptureQueriesContext(connection) as ctx:
+            body = b"".join(response.streaming_content).decode()
+        self.assertFalse([q for q in ctx.captured_queries if q["sql"].startswith(("INSERT", "UPDATE"))])
+        self.assertEqual(body.count("Active"), 3)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class StatementEmailTest(CommissionFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.agent.email = "tendai@test.com"
+        self.agent.save()
+        self.make_policies(2)
+        self.second = self.make_agent("Rudo", email="rudo@test.com")
+        self.make_policies(1, agent=self.second)
+        self.no_email = self.make_agent("Farai")
+        self.make_policies(1, agent=self.no_email)
+        self.no_policies = self.make_agent("Chipo", email="chipo@test.com")
+
+    def statuses(self):
+        return dict(CommissionStatementDelivery.objects.values_list("agent_id", "status"))
+
+    def test_sends_each_agent_once_over_one_connection(self):
+        from commissions.emails import send_statement_emails
+
+        with patch("django.core.mail.backends.locmem.EmailBackend.open") as opened:
+            counts = send_statement_emails(MONTH, chunk_size=1)
+
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual((counts["sent"], counts["skipped"], counts["failed"]), (2, 2, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["rudo@test.com", "tendai@test.com"])
+        self.assertEqual(mail.outbox[0].attachments[0][2], "application/pdf")
+        self.assertEqual(self.statuses(), {
+            self.agent.pk: DeliveryStatus.SENT, self.second.pk: DeliveryStatus.SENT,
+            self.no_email.pk: DeliveryStatus.SKIPPED, self.no_policies.pk: DeliveryStatus.SKIPPED,
+        })
+
+        counts = send_statement_emails(MONTH)
+        self.assertEqual((counts["sent"], counts["already_sent"]), (0, 2))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_chunk_is_resumed(self):
+        from commissions.emails import send_statement_emails
+        from django.core.mail.backends.locmem import EmailBackend
+
+        real_send = EmailBackend.send_messages
+        calls = []
+
+        def flaky(backend, messages):
+            calls.append(len(messages))
+            if len(calls) == 2:
+                raise ConnectionError("mail server went away")
+            return real_send(backend, messages)
+
+        with patch.object(EmailBackend, "send_messages", flaky):
+            counts = send_statement_emails(MONTH, chunk_size=1)
+
+        self.assertEqual((counts["sent"], counts["failed"]), (1, 1))
+        failed = CommissionStatementDelivery.objects.get(status=DeliveryStatus.FAILED)
+        self.assertIn("went away", failed.error)
+
+        counts = send_statement_emails(MONTH, chunk_size=1)
+
+        self.assertEqual((counts["sent"], counts["failed"], counts["already_sent"]), (1, 0, 1))
+        self.assertEqual(len(mail.outbox), 2)
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts), (DeliveryStatus.SENT, 2))
+
+    def test_failed_chunk_reconnects_before_the_next(self):
+        from commissions.emails import send_statement_emails
+        from django.core.mail.backends.locmem import EmailBackend
+
+        real_send = EmailBackend.send_messages
+        events = []
+
+        def flaky(backend, messages):
+            events.append("send")
+            if events.count("send") == 1:
+                raise ConnectionError("connection reset")
+            return real_send(backend, messages)
+
+        with patch.object(EmailBackend, "send_messages", flaky), \
+                patch.object(EmailBackend, "open", lambda backend: events.append("open")), \
+                patch.object(EmailBackend, "close", lambda backend: events.append("close")):
+            counts = send_statement_emails(MONTH, chunk_size=1)
+
+        self.assertEqual(events, ["open", "send", "close", "open", "send", "close"])
+        self.assertEqual((counts["sent"], counts["failed"]), (1, 1))
+        self.assertEqual(self.statuses()[self.second.pk], DeliveryStatus.SENT)
+        self.assertEqual(self.statuses()[self.agent.pk], DeliveryStatus.FAILED)
+
+
+class RunCommissionsTest(CommissionFixtures, TestCase):
+
+    def test_shards_balance_policies(self):
+        from commissions.runs import shard_agents
+
+        big, small = self.make_agent("Big"), self.make_agent("Small")
+        self.make_policies(4, agent=big, paid=False)
+        self.make_policies(2, paid=False)
+        self.make_policies(1, agent=small, paid=False)
+        self.make_agent("Idle")
+
+        self.assertEqual(shard_agents(shards=2), [[big.pk], [self.agent.pk, small.pk]])
+        self.assertEqual(shard_agents(agent_ids=[small.pk], shards=2), [[small.pk]])
+
+    def test_run_sums_shards_and_reports_progress(self):
+        from commissions.runs import run_commissions
+
+        other = self.make_agent("Rudo")
+        self.make_policies(2)
+        self.make_policies(1, paid=False)
+        self.make_policies(3, agent=other)
+        seen = []
+
+        result = run_commissions(MONTH, workers=2, shards=2, progress=lambda done, total: seen.append((done, total)))
+
+        self.assertEqual((result["created"], result["updated"], result["skipped"]), (5, 0, 1))
+        self.assertEqual((result["agents"], result["shards"]), (2, 2))
+        self.assertEqual(seen, [(1, 2), (2, 2)])
+        self.assertEqual(CommissionRecord.objects.count(), 5)
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_admin_view_runs_one_agent_through_a_job(self):
+        from common.models import Job, JobStatus
+
+        other = self.make_agent("Rudo")
+        self.make_policies(2)
+        self.make_policies(1, agent=other)
+        self.client.force_login(self.user)
+
+        response = self.client.post("/commissions/run/", {"month": "2024-07", "agent_id": self.agent.pk}, follow=True)
+
+        self.assertContains(response, "2 created, 0 updated, 0 skipped")
+        self.assertEqual(set(CommissionRecord.objects.values_list("agent_id", flat=True)), {self.agent.pk})
+        job = Job.objects.get(kind="commissions.run")
+        self.assertEqual((job.status, job.object_id, job.rows_done, job.rows_total), (JobStatus.DONE, 202407, 1, 1))
+
+        self.client.post("/commissions/run/", {"month": "2024-07", "agent_id": ""})
+        self.assertEqual(CommissionRecord.objects.count(), 3)
+
+    def test_admin_view_rejects_bad_input(self):
+        from common.models import Job
+
+        self.client.force_login(self.user)
+        for data, message in (({"month": "2024-07", "agent_id": "abc"}, "Selected agent not found."),
+                              ({"month": "2024-13", "agent_id": ""}, "Invalid month format."),
+                              ({"month": "July", "agent_id": ""}, "Invalid month format.")):
+            response = self.client.post("/commissions/run/", data, follow=True)
+            self.assertContains(response, message)
+        self.assertFalse(Job.objects.exists())
+
+
+class AgentCommissionMonthTest(CommissionFixtures, TestCase):
+
+    def rollup(self, agent, month=MONTH):
+        return AgentCommissionMonth.objects.get(agent=agent, month=month)
+
+    def test_generation_maintains_rollup(self):
+        from commissions.services import generate_commissions_for_month
+
+        policies = self.make_policies(3)
+        generate_commissions_for_month(MONTH)
+
+        row = self.rollup(self.agent)
+        records = CommissionRecord.objects.filter(agent=self.agent, commission_month=MONTH)
+        self.assertEqual(row.policy_count, 3)
+        self.assertEqual(row.commission_due, sum(r.commission_due for r in records))
+        self.assertEqual(row.monthly_premium, sum(p.contract_premium for p in policies))
+
+        # moving a policy to another agent moves it in both rollups on a single-agent run
+        other = self.make_agent("Rudo")
+        Policy.objects.filter(pk=policies[0].pk).update(agent=other)
+        generate_commissions_for_month(MONTH, agent_ids=[other.pk])
+
+        self.assertEqual((self.rollup(self.agent).policy_count, self.rollup(other).policy_count), (2, 1))
+
+    def test_history_reads_only_the_rollup(self):
+        from commissions.services import generate_commissions_for_month
+
+        self.make_policies(2)
+        self.client.force_login(self.user)
+        url = f"/commissions/agents/{self.agent.pk}/history/"
+
+        def history(**params):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            sql = [q["sql"] for q in ctx.captured_queries
+                   if not any(s in q["sql"] for s in ("django_session", "access_administrator", "SAVEPOINT"))]
+            self.assertFalse(any("commissions_commissionrecord" in q for q in sql))
+            return response.json(), len(sql)
+
+        generate_commissions_for_month(MONTH)
+        one, queries = history()
+        for month in (date(2024, 5, 1), date(2024, 6, 1)):
+            generate_commissions_for_month(month)
+        three, more = history()
+
+        self.assertEqual((one["count"], three["count"], more), (1, 3, queries))
+        self.assertEqual([m["month"] for m in three["months"]], ["2024-05", "2024-06", "2024-07"])
+        self.assertEqual(three["months"][0]["policy_count"], 2)
+        rollups = AgentCommissionMonth.objects.filter(agent=self.agent).order_by("month")
+        self.assertEqual([m["commission_due"] for m in three["months"]],
+                         [str(r.commission_due) for r in rollups])
+        self.assertEqual(three["total_commission_due"], str(sum(r.commission_due for r in rollups)))
+        self.assertEqual(history(**{"from": "2024-06", "to": "2024-06"})[0]["count"], 1)
+
+
+class IncrementalRunTest(CommissionFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.active = self.make_policies(3)
+        self.unpaid = self.make_policies(2, paid=False)
+
+    def settle(self):
+        """Pretend the journal's entries so far were written an hour ago."""
+        PolicyChange.objects.update(changed_at=timezone.now() - timedelta(hours=1))
+
+    def test_changes_are_journalled(self):
+        self.settle()
+        self.pay_up([self.unpaid[0]])
+        self.cancel(self.active[0])
+
+        recent = PolicyChange.objects.filter(changed_at__gte=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(set(recent.values_list("policy_id", flat=True)), {self.unpaid[0].pk, self.active[0].pk})
+
+    def test_incremental_recomputes_only_changed_policies(self):
+        from commissions.runs import run_commissions
+
+        first = run_commissions(MONTH, incremental=True)  # never run: falls back to the full book
+        self.assertEqual((first["incremental"], first["created"], first["skipped"]), (False, 3, 2))
+        self.settle()
+
+        self.pay_up([self.unpaid[0]])
+        with CaptureQueriesContext(connection) as ctx:
+            result = run_commissions(MONTH, incremental=True)
+
+        self.assertTrue(result["incremental"])
+        self.assertEqual((result["created"], result["updated"], result["skipped"]), (1, 0, 0))
+        self.assertLess(len(ctx.captured_queries), 20)
+        self.assertEqual(CommissionRecord.objects.count(), 4)
+        self.assertEqual(AgentCommissionMonth.objects.get(agent=self.agent, month=MONTH).policy_count, 4)
+
+        # nothing changed since: nothing recomputed
+        self.settle()
+        result = run_commissions(MONTH, incremental=True)
+        self.assertEqual((result["created"], result["updated"], result["skipped"]), (0, 0, 0))
+
+    def test_incremental_deletes_cancelled_policy_records(self):
+        from commissions.runs import run_commissions
+
+        run_commissions(MONTH)
+        self.settle()
+        self.cancel(self.active[0])
+
+        result = run_commissions(MONTH, incremental=True)
+
+        self.assertTrue(result["incremental"])
+        self.assertEqual((result["updated"], result["skipped"], result["deleted"]), (0, 1, 1))
+        self.assertFalse(CommissionRecord.objects.filter(policy=self.active[0]).exists())
+        self.assertEqual(CommissionRecord.objects.count(), 2)
+        self.assertEqual(AgentCommissionMonth.objects.get(agent=self.agent, month=MONTH).policy_count, 2)
+
+    def test_branch_change_recomputes_the_agents_rates(self):
+        from commissions.runs import run_commissions
+
+        CommissionSchedule.objects.create(rate=Decimal("0.20"), branch="MUTARE",
+                                          effective_from=date(2024, 1, 1))
+        run_commissions(MONTH)
+        self.settle()
+
+        self.agent.branch = "MUTARE"
+        self.agent.save()
+        result = run_commissions(MONTH, incremental=True)
+
+        self.assertTrue(result["incremental"])
+        self.assertEqual(result["updated"], 3)
+        for policy in self.active:
+            self.assertEqual(CommissionRecord.objects.get(policy=policy).commission_due,
+                             (policy.contract_premium * Decimal("0.20")).quantize(Decimal("0.01")))
+
+    def test_month_roll_forces_a_full_run(self):
+        from commissions.runs import run_commissions
+        from common import versions
+
+        run_commissions(MONTH)
+        self.settle()
+        versions.bump([versions.GLOBAL])
+
+        result = run_commissions(MONTH, incremental=True)
+
+        self.assertFalse(result["incremental"])
+        self.assertEqual((result["updated"], result["skipped"]), (3, 2))
+
+
+class CommissionScheduleTest(CommissionFixtures, TestCase):
+
+    def schedule(self, rate, **fields):
+        fields.setdefault("effective_from", date(2024, 1, 1))
+        return CommissionSchedule.objects.create(rate=Decimal(rate), **fields)
+
+    def test_most_specific_schedule_wins(self):
+        from commissions.schedules import rate_for
+
+        self.schedule("0.15", product_name="FUNERAL")
+        self.schedule("0.20", product_name="FUNERAL", branch="HARARE")
+        self.schedule("0.05", product_name="FUNERAL", policy_year_from=2)
+        self.schedule("0.12", branch="MUTARE", effective_from=date(2024, 8, 1))
+        start = date(2024, 1, 1)
+
+        self.assertEqual(rate_for("FUNERAL", "HARARE", start, MONTH), Decimal("0.20"))
+        self.assertEqual(rate_for("FUNERAL", "KWEKWE", start, MONTH), Decimal("0.15"))
+        self.assertEqual(rate_for("FUNERAL", "KWEKWE", date(2023, 1, 1), MONTH), Decimal("0.05"))
+        self.assertEqual(rate_for("AFFINITY", "MUTARE", start, MONTH), Decimal("0.10"))  # not effective yet
+        self.assertEqual(rate_for("AFFINITY", "MUTARE", start, date(2024, 8, 1)), Decimal("0.12"))
+
+    def test_batch_evaluation_costs_one_query_and_sees_changes(self):
+        from commissions.schedules import rates_for
+
+        rows = [("FUNERAL", "HARARE", date(2024, 1, 1))] * 500 + [("AFFINITY", "MUTARE", date(2022, 3, 1))] * 500
+        rates_for(rows, MONTH)
+        with CaptureQueriesContext(connection) as ctx:
+            rates = rates_for(rows, MONTH)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(set(rates), {Decimal("0.10")})
+
+        self.schedule("0.25", product_name="AFFINITY")
+        self.assertEqual(rates_for(rows, MONTH)[-1], Decimal("0.25"))
+
+    def test_generator_and_statement_agree_on_monthly_commission(self):
+        from commissions.services import generate_commissions_for_month
+
+        self.schedule("0.20", branch="HARARE")
+        policy = self.make_policies(1)[0]
+        Policy.objects.filter(pk=policy.pk).update(frequency="Q", contract_premium=Decimal("30.00"),
+                                                   total_premium_received=Decimal("210.00"))
+        notify_policies_changed([policy.pk])
+
+        generate_commissions_for_month(MONTH)
+        self.client.force_login(self.user)
+        cache.clear()
+        row = self.client.get(f"/commissions/commissions/statement/?agent_id={self.agent.pk}&month=2024-07").json()["clients"][0]
+
+        record = CommissionRecord.objects.get(policy=policy)
+        self.assertEqual(record.commission_due, Decimal("2.00"))  # 20% of 30.00 / 3 months
+        self.assertEqual((row["contract_premium"], row["commission_due"]), (10.0, 2.0))
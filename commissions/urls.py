@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from commissions.views import CommissionRecordViewSet, run_commissions_view
+from commissions.views import AgentCommissionHistoryViewSet, CommissionRecordViewSet, run_commissions_view
 
 router = DefaultRouter()
 router.register(r'commissions', CommissionRecordViewSet, basename='commission-record')
+router.register(r'agents', AgentCommissionHistoryViewSet, basename='agent-commission')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,23 +1,22 @@
 # commissions/views.py
 from datetime import date
 from decimal import Decimal
-from io import BytesIO, StringIO
-import csv
 
-from django.core.mail import EmailMessage
-from django.conf import settings
 from django.http import HttpResponse
-from django.utils.dateparse import parse_date
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from commissions.models import CommissionRecord
-from policies.models import Policy
+from commissions.models import AgentCommissionMonth, CommissionRecord, DeliveryStatus
+from common import statement_cache, versions
+from common.dates import parse_month
+from common.exports import streaming_csv_response
+from common.statements import render_statement
 from agents.models import Agent
+from .emails import record_delivery, statement_email
 from .serializers import CommissionRecordSerializer
-
-RATE = Decimal("0.10")  # 10%
+from .services import (build_statement_rows, commission_statement, generate_commissions_for_month,
+                       statement_rows)
 
 
 class CommissionRecordViewSet(viewsets.ReadOnlyModelViewSet):
@@ -41,139 +40,41 @@ class CommissionRecordViewSet(viewsets.ReadOnlyModelViewSet):
     @staticmethod
     def _parse_month(raw: str):
         """YYYY-MM or YYYY-MM-DD -> first day of that month"""
-        if not raw:
-            return None
-        d = parse_date(raw)
-        if d is None:
-            try:
-                y, m = map(int, raw.split("-"))
-                d = date(y, m, 1)
-            except Exception:
-                return None
-        return date(d.year, d.month, 1)
+        return parse_month(raw)
 
-    @staticmethod
-    def _months_per_period(freq: str) -> int:
-        return {"M": 1, "Q": 3, "H": 6, "Y": 12}[freq]
-
-    @staticmethod
-    def _monthly_rate(policy: Policy) -> Decimal:
+    # ---- CSV/PDF builders ----
+    def _csv(self, agent_code, agent_name, month_label, rows):
         """
-        contract_premium is per policy frequency period; convert to monthly.
+        Stream the statement CSV; `rows` may be a generator. The totals are
+        accumulated while streaming and written on the last line.
         """
-        cp = Decimal(policy.contract_premium or 0)
-        months = CommissionRecordViewSet._months_per_period(policy.frequency)
-        if months <= 0:
-            return Decimal("0.00")
-        return (cp / Decimal(months)).quantize(Decimal("0.01"))
-
-    # ---- CSV/PDF builders ----
-    def _build_rows_for_agent_month(self, agent: Agent, month_start: date, save=False):
-        rows = []
-        tot_prem = Decimal("0.00")
-        tot_comm = Decimal("0.00")
-
-        # DB-level filters
-        policies = (
-            Policy.objects
-            .select_related("client", "paypoint", "agent")
-            .filter(agent=agent)
-            .filter(start_date__lte=month_start)  # started before commission month
-            .filter(cancellation_request__status__isnull=True)  # not cancelled
-            .order_by("contract_id")
-        )
-
-        # Filter commissionable policies in Python
-        commissionable_policies = [p for p in policies if p.is_commissionable(month_start)]
-
-        for p in commissionable_policies:
-            monthly = self._monthly_rate(p)
-            commission_due = (monthly * RATE).quantize(Decimal("0.01"))
-
-            rows.append({
-                "contract_id": p.contract_id,
-                "client_name": str(p.client) if p.client_id else "",
-                "status": getattr(p, "overall_policy_status", ""),
-                "agent_code": agent.agent_code,
-                "agent_name": f"{agent.agent_name} {agent.agent_surname}",
-                "contract_premium": float(monthly),
-                "commission_due": float(commission_due),
-            })
-
-            tot_prem += monthly
-            tot_comm += commission_due
-
-            if save:
-                CommissionRecord.objects.get_or_create(
-                    policy=p,
-                    agent=agent,
-                    commission_month=month_start,
-                    defaults={"commission_due": commission_due}
-                )
-
-        return rows, float(tot_prem), float(tot_comm)
-
-    def _csv(self, agent_code, agent_name, month_label, rows, tot_prem, tot_comm):
-        buf = StringIO()
-        w = csv.writer(buf)
-        w.writerow(["Agent_code", agent_code])
-        w.writerow(["Agent_name", agent_name])
-        w.writerow(["Commission Month", month_label])
-        w.writerow([])
-        w.writerow(["List of clients"])
-        w.writerow(["Contract_id", "Client_name", "Status", "Agent code", "Agent name", "Contract Premium", "Commission due"])
-        for r in rows:
-            w.writerow([r["contract_id"], r["client_name"], r["status"], r["agent_code"], r["agent_name"], r["contract_premium"], r["commission_due"]])
-        w.writerow([])
-        w.writerow(["Total", "", "", "", "", tot_prem, tot_comm])
+        def lines():
+            yield ["Agent_code", agent_code]
+            yield ["Agent_name", agent_name]
+            yield ["Commission Month", month_label]
+            yield []
+            yield ["List of clients"]
+            yield ["Contract_id", "Client_name", "Status", "Agent code", "Agent name", "Contract Premium", "Commission due"]
+            tot_prem = tot_comm = Decimal("0.00")
+            for r in rows:
+                tot_prem += r["contract_premium"]
+                tot_comm += r["commission_due"]
+                yield [r["contract_id"], r["client_name"], r["status"], r["agent_code"], r["agent_name"], r["contract_premium"], r["commission_due"]]
+            yield []
+            yield ["Total", "", "", "", "", tot_prem, tot_comm]
 
         filename = f"commission_{agent_code}_{month_label}.csv".replace(" ", "_").lower()
-        resp = HttpResponse(buf.getvalue(), content_type="text/csv")
-        resp["Content-Disposition"] = f'attachment; filename="{filename}"'
-        return resp
+        return streaming_csv_response(lines(), filename)
 
     def _pdf(self, agent_code, agent_name, month_label, rows, tot_prem, tot_comm):
         try:
-            from reportlab.lib import colors
-            from reportlab.lib.pagesizes import A4
-            from reportlab.lib.styles import getSampleStyleSheet
-            from reportlab.lib.units import mm
-            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        except Exception:
+            pdf_bytes = render_statement(
+                commission_statement(agent_code, agent_name, month_label, rows, tot_prem, tot_comm))
+        except ImportError:
             return Response({"detail": "Install 'reportlab' for PDF export", "hint": "Use export=csv"}, status=501)
 
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=16*mm, rightMargin=16*mm, topMargin=16*mm, bottomMargin=16*mm)
-        styles = getSampleStyleSheet()
-        elems = [
-            Paragraph("<b>Commission Statement</b>", styles["Title"]),
-            Spacer(1, 6),
-            Paragraph(f"<b>Agent_code:</b> {agent_code}", styles["Normal"]),
-            Paragraph(f"<b>Agent_name:</b> {agent_name}", styles["Normal"]),
-            Paragraph(f"<b>Commission Month:</b> {month_label}", styles["Normal"]),
-            Spacer(1, 10),
-            Paragraph("<b>List of clients</b>", styles["Heading3"]), Spacer(1, 4)
-        ]
-
-        data = [["Contract_id", "Client_name", "Status", "Agent code", "Agent name", "Contract Premium", "Commission due"]]
-        for r in rows:
-            data.append([r["contract_id"], r["client_name"], r["status"], r["agent_code"], r["agent_name"], r["contract_premium"], r["commission_due"]])
-        data.append(["", "", "", "", "", "", ""])
-        data.append(["Total", "", "", "", "", f"{tot_prem}", f"{tot_comm}"])
-
-        table = Table(data, hAlign="LEFT")
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#D0E9C6")),
-            ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-            ("ALIGN", (5,1), (6,-1), "RIGHT"),
-            ("BACKGROUND", (0,-1), (-1,-1), colors.HexColor("#F5F5F5")),
-        ]))
-        elems.append(table)
-        doc.build(elems)
-
         filename = f"commission_{agent_code}_{month_label}.pdf".replace(" ", "_").lower()
-        resp = HttpResponse(buffer.getvalue(), content_type="application/pdf")
+        resp = HttpResponse(pdf_bytes, content_type="application/pdf")
         resp["Content-Disposition"] = f'attachment; filename="{filename}"'
         return resp
 
@@ -204,26 +105,52 @@ class CommissionRecordViewSet(viewsets.ReadOnlyModelViewSet):
         if not agent:
             return Response({"detail": "Agent not found. Use 'agent_id', 'agent_code' or 'agent' (name)."}, status=404)
 
-        rows, tot_prem, tot_comm = self._build_rows_for_agent_month(agent, month_start, save=save)
+        if export == "email":
+            if not getattr(agent, "email", None):
+                return Response({"detail": "Agent has no email configured."}, status=400)
+            agent_label = agent.agent_code
+            if save:
+                pdf_resp = self._render_statement(agent, month_start, "pdf", save=True)
+            else:
+                pdf_resp = statement_cache.cached_response(*self.statement_cache_entry(agent, month_start, "pdf"))
+            if pdf_resp.status_code != 200:
+                return pdf_resp
+            email = statement_email(agent.agent_name, agent.email, agent_label, month_label, pdf_resp.content)
+            email.send(fail_silently=False)
+            record_delivery(agent, month_start, DeliveryStatus.SENT)
+            return Response({"detail": f"Emailed statement to {agent.email}", "agent_code": agent_label, "month": month_label})
+
+        # saving writes CommissionRecord rows, so only read-only statements are cached
+        if save:
+            return self._render_statement(agent, month_start, export, save=True)
+        return statement_cache.cached_response(*self.statement_cache_entry(agent, month_start, export))
+
+    def statement_cache_entry(self, agent: Agent, month_start: date, export: str):
+        """
+        (kind, parts, scopes, build) for common.statement_cache: an unsaved
+        statement depends on the agent's data only.
+        """
+        parts = (agent.pk, month_start.isoformat(), export)
+
+        def build():
+            return self._render_statement(agent, month_start, export)
+        return "commission", parts, [versions.scope("agent", agent.pk)], build
+
+    def _render_statement(self, agent: Agent, month_start: date, export: str, save=False):
+        month_label = month_start.strftime("%b-%y")
         agent_label = agent.agent_code
         agent_full = f"{agent.agent_name} {agent.agent_surname}"
 
+        # write the records before building the response, so the CSV stream only reads
+        if save:
+            generate_commissions_for_month(month_start, agent_ids=[agent.pk])
+
         if export == "csv":
-            return self._csv(agent_label, agent_full, month_label, rows, tot_prem, tot_comm)
+            return self._csv(agent_label, agent_full, month_label, statement_rows(agent, month_start))
+
+        rows, tot_prem, tot_comm = build_statement_rows(agent, month_start)
         if export == "pdf":
             return self._pdf(agent_label, agent_full, month_label, rows, tot_prem, tot_comm)
-        if export == "email":
-            if not getattr(agent, "email", None):
-                return Response({"detail": "Agent has no email configured."}, status=400)
-            pdf_resp = self._pdf(agent_label, agent_full, month_label, rows, tot_prem, tot_comm)
-            content = pdf_resp.content
-            filename = f"commission_{agent_label}_{month_label}.pdf".replace(" ", "_").lower()
-            subject = f"Commission Statement - {month_label}"
-            body = f"Dear {agent.agent_name},\n\nPlease find attached your commission statement for {month_label}.\n\nRegards,\nZimnat Life Assurance"
-            email = EmailMessage(subject, body, getattr(settings, "DEFAULT_FROM_EMAIL", None), [agent.email])
-            email.attach(filename, content, "application/pdf")
-            email.send(fail_silently=False)
-            return Response({"detail": f"Emailed statement to {agent.email}", "agent_code": agent_label, "month": month_label})
 
         return Response({
             "agent_code": agent_label,
@@ -237,59 +164,87 @@ class CommissionRecordViewSet(viewsets.ReadOnlyModelViewSet):
         })
 
 
+class AgentCommissionHistoryViewSet(viewsets.GenericViewSet):
+    """
+    Endpoints:
+      - /commissions/agents/<id>/history/  -> the agent's commission totals per month
+        (optional ?from=YYYY-MM&to=YYYY-MM), read from AgentCommissionMonth
+    """
+    queryset = Agent.objects.all()
+
+    @action(detail=True, methods=["get"], url_path="history")
+    def history(self, request, pk=None):
+        agent = self.get_object()
+        months = AgentCommissionMonth.objects.filter(agent=agent).order_by("month")
+
+        for param, lookup in (("from", "month__gte"), ("to", "month__lte")):
+            raw = request.query_params.get(param)
+            if raw:
+                month = CommissionRecordViewSet._parse_month(raw)
+                if not month:
+                    return Response({"detail": f"Invalid '{param}'. Use YYYY-MM or YYYY-MM-DD."}, status=400)
+                months = months.filter(**{lookup: month})
+
+        rows = [{
+            "month": m.month.strftime("%Y-%m"),
+            "policy_count": m.policy_count,
+            "monthly_premium": str(m.monthly_premium),
+            "commission_due": str(m.commission_due),
+        } for m in months]
+        return Response({
+            "agent_code": agent.agent_code,
+            "agent_name": f"{agent.agent_name} {agent.agent_surname}",
+            "months": rows,
+            "count": len(rows),
+            "total_commission_due": str(sum((m.commission_due for m in months), Decimal("0.00"))),
+        })
+
+
 # ---- Optional admin view for manual trigger ----
 from django.shortcuts import render
 from django.contrib import messages
-from commissions.services import generate_commissions_for_month, compute_commission
+from common.jobs import enqueue, month_job_id
+from common.models import JobStatus
 
 def run_commissions_view(request):
+    """
+    Queue a "commissions.run" job (commissions.runs) for one agent or all
+    agents; its progress shows under Jobs in the admin.
+    """
     agents = Agent.objects.all()
 
     if request.method == "POST":
         month_str = request.POST.get("month")
         agent_id = request.POST.get("agent_id")
 
+        month_start = parse_month(month_str)
+        agent = None
+        if agent_id and agent_id.isdigit():  # specific agent
+            agent = Agent.objects.filter(id=agent_id).first()
+
         if not month_str:
             messages.error(request, "Please select a month.")
+        elif not month_start:
+            messages.error(request, "Invalid month format.")
+        elif agent_id and not agent:
+            messages.error(request, "Selected agent not found.")
         else:
-            try:
-                year, month = map(int, month_str.split("-"))
-                month_start = date(year, month, 1)
-            except Exception:
-                messages.error(request, "Invalid month format.")
+            payload = {"agent_ids": [agent.pk]} if agent else {}
+            if request.POST.get("incremental"):
+                payload["incremental"] = True
+            job = enqueue("commissions.run", month_job_id(month_start), **payload)
+            label = agent.agent_code if agent else "All agents"
+            if job.status == JobStatus.DONE:  # JOBS_RUN_INLINE
+                result = job.payload["result"]
+                messages.success(
+                    request,
+                    f"Commissions for {label} ({month_start:%b %Y}): "
+                    f"{result['created']} created, {result['updated']} updated, {result['skipped']} skipped, "
+                    f"{result['deleted']} deleted."
+                )
+            elif job.status == JobStatus.FAILED:
+                messages.error(request, f"Commission run for {label} failed: {'; '.join(job.errors)}")
             else:
-                if agent_id:  # specific agent
-                    agent = Agent.objects.filter(id=int(agent_id)).first()
-                    if not agent:
-                        messages.error(request, "Selected agent not found.")
-                    else:
-                        created = updated = skipped = 0
-                        policies = agent.policy_set.all()
-                        for p in policies:
-                            if not p.is_commissionable(month_start):
-                                skipped += 1
-                                continue
-                            commission_due = compute_commission(p.contract_premium)
-                            obj, was_created = CommissionRecord.objects.update_or_create(
-                                policy=p,
-                                commission_month=month_start,
-                                defaults={"agent": p.agent, "commission_due": commission_due}
-                            )
-                            if was_created:
-                                created += 1
-                            else:
-                                updated += 1
-                        messages.success(
-                            request,
-                            f"Commissions for {agent.agent_code} ({month_start:%b %Y}): "
-                            f"{created} created, {updated} updated, {skipped} skipped."
-                        )
-                else:  # all agents
-                    result = generate_commissions_for_month(month_start)
-                    messages.success(
-                        request,
-                        f"All agents commissions for {month_start:%b %Y}: "
-                        f"{result['created']} created, {result['updated']} updated, {result['skipped']} skipped."
-                    )
+                messages.success(request, f"Commission run for {label} ({month_start:%b %Y}) queued as job {job.pk}.")
 
     return render(request, "admin/commissions/run_monthly_commission.html", {"agents": agents})
@@ -0,0 +1,18 @@
+# common/dates.py
+from datetime import date
+
+from django.utils.dateparse import parse_date
+
+
+def parse_month(raw):
+    """YYYY-MM or YYYY-MM-DD -> first day of that month; None if blank or invalid."""
+    if not raw:
+        return None
+    try:
+        d = parse_date(raw.strip())
+        if d is None:
+            y, m = map(int, raw.strip().split("-"))
+            d = date(y, m, 1)
+    except ValueError:
+        return None
+    return date(d.year, d.month, 1)
@@ -0,0 +1,25 @@
+# common/exports.py
+import csv
+
+from django.http import StreamingHttpResponse
+
+STREAM_CHUNK_SIZE = 2000  # rows fetched per round trip by streamed exports
+
+
+class Echo:
+    """File-like object whose write() returns the line, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def streaming_csv_response(lines, filename):
+    """
+    Stream `lines` (an iterable of CSV rows) as a downloadable CSV file.
+    Rows are encoded as they are produced, so the first bytes go out before
+    the last row is read and the document is never held in memory.
+    """
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse((writer.writerow(line) for line in lines), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
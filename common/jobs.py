@@ -0,0 +1,228 @@
+# common/jobs.py
+"""
+Database-backed job queue.
+
+Apps register handlers in their `jobs.py` module (autodiscovered when the
+`common` app loads)::
+
+    @job_handler("agents.upload")
+    def run_upload(job):
+        ...
+
+`enqueue()` records a Job; `run_workers` processes queued jobs in worker
+processes. With settings.JOBS_RUN_INLINE the job is run immediately in the
+calling process instead (used by tests and single-process setups).
+
+A claimed job is leased to its worker for JOBS_LEASE_SECONDS. While the
+handler runs, a heartbeat thread renews the lease every third of that
+(as does every `report_progress`), so a long handler keeps its job however
+rarely it reports. Jobs whose lease ran out (the worker died) are queued
+again when the next job is claimed, or failed after JOBS_MAX_ATTEMPTS runs.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job, JobStatus
+from .readers import count_upload_rows
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def job_handler(kind):
+    """Register `func(job)` as the handler for jobs of `kind`."""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, object_id, **payload):
+    if kind not in _handlers:
+        raise ValueError(f"No job handler registered for '{kind}'")
+
+    job = Job.objects.create(kind=kind, object_id=object_id, payload=payload)
+    if getattr(settings, "JOBS_RUN_INLINE", False):
+        if _start(job, "inline"):
+            run_job(job)
+    return job
+
+
+def month_job_id(month: date) -> int:
+    """Job.object_id for a month-wide job: YYYYMM."""
+    return month.year * 100 + month.month
+
+
+def job_month(job) -> date:
+    return date(job.object_id // 100, job.object_id % 100, 1)
+
+
+def latest_job(kind, object_id):
+    return Job.objects.filter(kind=kind, object_id=object_id).order_by("-pk").first()
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _start(job, worker):
+    """Mark a queued job running; False if another worker got it first."""
+    now = timezone.now()
+    started = Job.objects.filter(pk=job.pk, status=JobStatus.QUEUED).update(
+        status=JobStatus.RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+        attempts=F("attempts") + 1,
+    )
+    if started:
+        job.status, job.worker, job.started_at, job.heartbeat_at = JobStatus.RUNNING, worker, now, now
+        job.attempts += 1
+    return bool(started)
+
+
+def reclaim_expired():
+    """
+    Queue again the running jobs whose lease expired, or fail them once
+    they have had JOBS_MAX_ATTEMPTS runs. Returns the number reclaimed.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.JOBS_LEASE_SECONDS)
+    expired = Job.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=JobStatus.RUNNING,
+    )
+    failed = expired.filter(attempts__gte=settings.JOBS_MAX_ATTEMPTS).update(
+        status=JobStatus.FAILED, finished_at=now,
+        errors=["The worker stopped responding; giving up after "
+                f"{settings.JOBS_MAX_ATTEMPTS} attempts."],
+    )
+    requeued = expired.update(status=JobStatus.QUEUED, worker="")
+    if failed or requeued:
+        logger.warning("Reclaimed %s expired jobs (%s failed)", failed + requeued, failed)
+    return failed + requeued
+
+
+def claim_next(worker):
+    """
+    Take the oldest queued job, or None, after reclaiming expired leases.
+    Candidate rows are locked with SKIP LOCKED where the database supports
+    it so workers don't contend; the conditional UPDATE in _start keeps
+    claiming safe everywhere else.
+    """
+    reclaim_expired()
+    while True:
+        with transaction.atomic():
+            queued = Job.objects.filter(status=JobStatus.QUEUED).order_by("pk")
+            if connection.features.has_select_for_update_skip_locked:
+                queued = queued.select_for_update(skip_locked=True)
+            job = queued.first()
+            if job is None:
+                return None
+            if _start(job, worker):
+                return job
+
+
+def report_progress(job, rows_done, rows_failed, rows_total=None):
+    """Record progress, renewing the job's lease."""
+    job.rows_done, job.rows_failed, job.heartbeat_at = rows_done, rows_failed, timezone.now()
+    fields = ["rows_done", "rows_failed", "heartbeat_at"]
+    if rows_total is not None:
+        job.rows_total = rows_total
+        fields.append("rows_total")
+    Job.objects.filter(pk=job.pk).update(**{f: getattr(job, f) for f in fields})
+
+
+@contextmanager
+def _heartbeat(job):
+    """Renew the job's lease from a background thread while the body runs."""
+    stop = threading.Event()
+    interval = settings.JOBS_LEASE_SECONDS / 3
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    Job.objects.filter(pk=job.pk, status=JobStatus.RUNNING, started_at=job.started_at) \
+                        .update(heartbeat_at=timezone.now())
+                except Exception:
+                    logger.exception("Heartbeat of job %s failed", job.pk)
+        finally:
+            connection.close()  # this thread's own connection
+
+    thread = threading.Thread(target=beat, name=f"job-{job.pk}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its outcome; handler errors fail the job.
+    The lease is renewed while the handler runs. The outcome is not
+    recorded if the lease was lost meanwhile (the job was reclaimed and is
+    some other run's now).
+    """
+    try:
+        with _heartbeat(job):
+            errors = _handlers[job.kind](job) or []
+    except Exception as e:
+        logger.exception("Job %s failed", job.pk)
+        job.status, job.errors = JobStatus.FAILED, [str(e)]
+    else:
+        job.status, job.errors = JobStatus.DONE, list(errors)
+    job.finished_at = timezone.now()
+    recorded = Job.objects.filter(pk=job.pk, status=JobStatus.RUNNING, started_at=job.started_at).update(
+        status=job.status, errors=job.errors, finished_at=job.finished_at,
+    )
+    if not recorded:
+        logger.warning("Job %s lost its lease; outcome of this run discarded", job.pk)
+    return job
+
+
+def work(worker=None, once=False, poll=2.0):
+    """
+    Worker loop: claim and run jobs until the queue is empty (`once`) or
+    forever, sleeping `poll` seconds when idle. Returns the jobs run.
+    """
+    worker = worker or worker_name()
+    ran = 0
+    while True:
+        job = claim_next(worker)
+        if job is None:
+            if once:
+                return ran
+            time.sleep(poll)
+            continue
+        run_job(job)
+        ran += 1
+
+
+def run_upload(job, upload_model, process_upload):
+    """
+    Shared handler body for Upload processing jobs. With payload
+    reject_on_errors, an upload with row errors is marked rejected.
+    """
+    upload = upload_model.objects.get(pk=job.object_id)
+    report_progress(job, 0, 0, count_upload_rows(upload.file.path))
+
+    errors = process_upload(upload, progress=lambda done, failed: report_progress(job, done, failed))
+    # the Excel row count is an estimate; settle the total on what was read
+    report_progress(job, job.rows_done, len(errors), rows_total=job.rows_done)
+
+    if errors and job.payload.get("reject_on_errors"):
+        upload.is_rejected = True
+        upload.reject_reason = "; ".join(errors)
+        upload.save()
+    return errors
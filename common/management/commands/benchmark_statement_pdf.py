@@ -0,0 +1,106 @@
+import time
+import tracemalloc
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common.statements import LAYOUTS, Statement, render_statement, render_statements
+
+
+def _legacy_render(statement):
+    """The previous renderer: styles built per call and one Table holding every row."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    layout = LAYOUTS[statement.layout]
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=16 * mm, rightMargin=16 * mm,
+                            topMargin=16 * mm, bottomMargin=16 * mm)
+    styles = getSampleStyleSheet()
+    elems = [Paragraph(f"<b>{layout.title}</b>", styles["Title"]), Spacer(1, 6)]
+    elems += [Paragraph(f"<b>{label}:</b> {value}", styles["Normal"]) for label, value in statement.header]
+    elems += [Spacer(1, 10), Paragraph("<b>List of clients</b>", styles["Heading3"]), Spacer(1, 4)]
+
+    totals = ["Total"] + [""] * (len(layout.columns) - 1)
+    for index, value in statement.totals.items():
+        totals[index] = f"{value}"
+    data = [list(layout.columns)] + list(statement.rows) + [[""] * len(layout.columns), totals]
+    table = Table(data, hAlign="LEFT")
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(layout.header_colour)),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("BACKGROUND", (0, -1), (-1, -1), colors.HexColor("#F5F5F5")),
+    ]))
+    elems.append(table)
+    doc.build(elems)
+    return buffer.getvalue()
+
+
+def _statement(rows, long_names=False):
+    def name(i):
+        if long_names and i % 10 == 0:  # wraps onto three or four lines
+            return f"Client{i} Tatenda Nyasha Rufaro Chiedza Mukamuri-Chidzikwe Surname{i}"
+        return f"Client{i} Surname{i}"
+
+    data = [[f"ZL{i:07d}", name(i), "Active", 12.5] for i in range(rows)]
+    return Statement(layout="billing", header=[("Pay point name", "Benchmark"), ("Billing Month", "Jul-24")],
+                     rows=data, totals={3: 12.5 * rows})
+
+
+def _measure(render, statement, memory):
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    pdf = render(statement)
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if memory else None
+    if memory:
+        tracemalloc.stop()
+    return seconds, peak, len(pdf)
+
+
+class Command(BaseCommand):
+    help = "Time the statement PDF renderer against the previous single-table renderer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 50000],
+                            help="Statement sizes to render (default 1000 10000 50000).")
+        parser.add_argument("--skip-legacy", action="store_true",
+                            help="Only time the current renderer.")
+        parser.add_argument("--memory", action="store_true",
+                            help="Also report peak Python memory (tracemalloc; slows both renderers).")
+        parser.add_argument("--long-names", action="store_true",
+                            help="Make every tenth client name long enough to wrap.")
+        parser.add_argument("--batch", type=int, default=0,
+                            help="Also render this many 1000-row statements through the batch API.")
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Process pool size for --batch (default 4).")
+
+    def _line(self, label, rows, result):
+        seconds, peak, size = result
+        memory = f"  peak {peak / 1e6:8.1f} MB" if peak is not None else ""
+        self.stdout.write(f"  {label:<8} {rows:>7} rows  {seconds:8.2f}s  {size / 1e3:9.0f} kB{memory}")
+
+    def handle(self, *args, **options):
+        try:
+            import reportlab  # noqa: F401
+        except ImportError:
+            raise CommandError("reportlab is not installed.")
+
+        for rows in options["rows"]:
+            statement = _statement(rows, options["long_names"])
+            if not options["skip_legacy"]:
+                self._line("legacy", rows, _measure(_legacy_render, statement, options["memory"]))
+            self._line("current", rows, _measure(render_statement, statement, options["memory"]))
+
+        if options["batch"]:
+            statements = [_statement(1000) for _ in range(options["batch"])]
+            for workers in (1, options["workers"]):
+                started = time.perf_counter()
+                render_statements(statements, workers=workers)
+                self.stdout.write(f"  batch    {len(statements)} x 1000 rows, {workers} worker(s): "
+                                  f"{time.perf_counter() - started:.2f}s")
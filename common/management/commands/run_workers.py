@@ -0,0 +1,52 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from common.jobs import work, worker_name
+from common.workers import init_worker
+
+
+def _worker_main(once, poll):
+    init_worker()
+    work(worker_name(), once=once, poll=poll)
+
+
+class Command(BaseCommand):
+    help = "Process queued background jobs (uploads, ...) with N worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Number of worker processes (default 1).")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit when the queue is empty instead of polling.")
+        parser.add_argument("--poll", type=float, default=2.0,
+                            help="Seconds to sleep when the queue is empty (default 2).")
+
+    def handle(self, *args, **options):
+        workers, once, poll = options["workers"], options["once"], options["poll"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        if workers == 1:
+            ran = work(worker_name(), once=once, poll=poll)
+            self.stdout.write(self.style.SUCCESS(f"Processed {ran} jobs."))
+            return
+
+        # children must not share the parent's database connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=_worker_main, args=(once, poll))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {workers} workers.")
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+        self.stdout.write(self.style.SUCCESS("Workers stopped."))
@@ -0,0 +1,77 @@
+# common/models.py
+from django.db import models
+from django.utils import timezone
+
+
+class Sequence(models.Model):
+    """
+    Counter behind a business number series (contract ids, receipt numbers,
+    agent and client codes). Allocated through `common.sequences.allocate`.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_value}"
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = "queued", "Queued"
+    RUNNING = "running", "Running"
+    DONE = "done", "Done"
+    FAILED = "failed", "Failed"
+
+
+class Job(models.Model):
+    """
+    A unit of background work, e.g. processing one Upload. `kind` names the
+    handler registered in `common.jobs`; `object_id` is the record it acts
+    on. Run by the `run_workers` command (or inline, see JOBS_RUN_INLINE).
+    """
+    kind = models.CharField(max_length=50)
+    object_id = models.PositiveBigIntegerField()
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=JobStatus.choices,
+                              default=JobStatus.QUEUED, db_index=True)
+
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # last sign of life from the running worker; a stale one ends its lease
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["kind", "object_id"])]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} ({self.status})"
+
+    @property
+    def eta_seconds(self):
+        """Remaining seconds at the average rate so far; None until measurable."""
+        if self.status != JobStatus.RUNNING or not self.started_at or not self.rows_done:
+            return None
+        elapsed = (timezone.now() - self.started_at).total_seconds()
+        remaining = max(self.rows_total - self.rows_done, 0)
+        return round(elapsed / self.rows_done * remaining, 1)
+
+
+class DataVersion(models.Model):
+    """
+    Change counter for a slice of data, e.g. "paypoint:12" or "agent:7".
+    Bumped through `common.versions.bump` whenever the data changes, so
+    anything cached under the version (statement outputs) goes stale.
+    """
+    scope = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
@@ -0,0 +1,8 @@
+# common/names.py
+def normalize_name(value):
+    """
+    The key names are matched on: casefolded, with runs of whitespace
+    (non-breaking spaces included) collapsed to one space and the ends
+    trimmed, so ' John\xa0 SMITH' matches 'john smith'.
+    """
+    return " ".join(str(value).split()).casefold()
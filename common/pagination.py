@@ -0,0 +1,105 @@
+# common/pagination.py
+import base64
+import json
+from collections import OrderedDict
+from functools import reduce
+from operator import attrgetter
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset ("seek") pagination over a unique, ascending
+    ordering such as ("policy__contract_id", "billing_month").
+
+    The cursor holds the ordering values of the last row served; the next
+    page is `WHERE (a, b) > (cursor a, cursor b) ORDER BY a, b LIMIT n`, so
+    every page costs the same however deep it is (no OFFSET, no COUNT).
+    """
+    ordering = ()
+    page_size = api_settings.PAGE_SIZE or 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    cursor_query_param = "cursor"
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, values):
+        raw = json.dumps([str(v) for v in values]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound("Invalid cursor.")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound("Invalid cursor.")
+        return values
+
+    def _after(self, values):
+        """(f1, f2, ...) > (v1, v2, ...) as OR-ed equality prefixes."""
+        conditions = []
+        for i, field in enumerate(self.ordering):
+            prefix = {f: v for f, v in zip(self.ordering[:i], values[:i])}
+            conditions.append(Q(**prefix, **{f"{field}__gt": values[i]}))
+        return reduce(lambda a, b: a | b, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self._after(cursor))
+
+        rows = list(queryset[:size + 1])
+        self.has_next = len(rows) > size
+        page = rows[:size]
+
+        getters = [attrgetter(field.replace("__", ".")) for field in self.ordering]
+        self.next_cursor = (
+            self.encode_cursor([get(page[-1]) for get in getters]) if self.has_next else None
+        )
+        return page
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
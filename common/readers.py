@@ -0,0 +1,146 @@
+# common/readers.py
+"""
+Streaming readers for the Upload importers.
+
+Rows are yielded one at a time straight from the file, so memory use stays
+flat however large the upload is:
+
+- .xlsx / .xlsm are opened with openpyxl in read-only mode;
+- .csv is read with a csv.reader generator;
+- .csv.gz / .gz and .zip (first CSV member) are decompressed on the fly.
+"""
+import csv
+import gzip
+import io
+import os
+import re
+import zipfile
+from contextlib import contextmanager
+from itertools import islice
+
+import openpyxl
+
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm")
+CSV_EXTENSIONS = (".csv", ".gz", ".zip")
+
+
+def _extension(path):
+    name = os.path.basename(path).lower()
+    if name.endswith(".csv.gz"):
+        return ".gz"
+    return os.path.splitext(name)[1]
+
+
+@contextmanager
+def _open_text(path, ext):
+    if ext == ".gz":
+        with gzip.open(path, "rt", newline="", encoding="utf-8-sig") as f:
+            yield f
+    elif ext == ".zip":
+        with zipfile.ZipFile(path) as archive:
+            members = [n for n in archive.namelist() if not n.endswith("/")]
+            csv_members = [n for n in members if n.lower().endswith(".csv")] or members
+            if not csv_members:
+                raise ValueError("Zip file contains no CSV file.")
+            with archive.open(csv_members[0]) as raw:
+                yield io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield f
+
+
+def _iter_raw_rows(path, ext):
+    """All rows of the file, header included, as sequences of cell values."""
+    if ext in EXCEL_EXTENSIONS:
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+    else:
+        with _open_text(path, ext) as f:
+            yield from csv.reader(f)
+
+
+def _header_key(value):
+    return re.sub(r"[\s\-]+", "_", str(value or "").strip().casefold())
+
+
+def _column_mapping(header, columns):
+    """
+    Map each expected column to its index in the header row.
+
+    `columns` entries are a name or a tuple of accepted names. Returns None
+    (positional columns) unless every expected column is found by name.
+    """
+    if not columns:
+        return None
+    positions = {}
+    for index, value in enumerate(header):
+        positions.setdefault(_header_key(value), index)
+
+    mapping = []
+    for column in columns:
+        names = (column,) if isinstance(column, str) else column
+        index = next((positions[_header_key(n)] for n in names if _header_key(n) in positions), None)
+        if index is None:
+            return None
+        mapping.append(index)
+    return mapping
+
+
+def _is_blank(row):
+    return all(value is None or str(value).strip() == "" for value in row)
+
+
+def _iter_rows(raw_rows, columns):
+    header = next(raw_rows, None)
+    if header is None:
+        return
+    mapping = _column_mapping(header, columns)
+
+    for number, row in enumerate(raw_rows, start=2):
+        if _is_blank(row):
+            continue
+        if mapping is not None:
+            row = [row[j] if j < len(row) else None for j in mapping]
+        yield number, tuple(row)
+
+
+def read_upload_rows(path, columns=None):
+    """
+    Stream the data rows of an uploaded Excel or CSV file.
+
+    Yields (row number, row) pairs, row numbers counting the header as
+    row 1. Blank rows are skipped. When the header names every column in
+    `columns`, rows are re-ordered to match `columns`; otherwise they are
+    returned positionally, as the file has them.
+    """
+    ext = _extension(path)
+    if ext not in EXCEL_EXTENSIONS + CSV_EXTENSIONS:
+        raise ValueError("Unsupported file format. Use Excel or CSV.")
+    return _iter_rows(_iter_raw_rows(path, ext), columns)
+
+
+def count_upload_rows(path):
+    """
+    Number of data rows, for progress reporting. Uses the sheet dimensions
+    for Excel files (may include trailing blank rows); streams CSV files.
+    """
+    ext = _extension(path)
+    if ext in EXCEL_EXTENSIONS:
+        wb = openpyxl.load_workbook(path, read_only=True)
+        try:
+            max_row = wb.active.max_row
+        finally:
+            wb.close()
+        if max_row is not None:
+            return max(max_row - 1, 0)
+    return sum(1 for _ in read_upload_rows(path))
+
+
+def batched(iterable, size):
+    """Yield lists of at most `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -0,0 +1,42 @@
+# common/sequences.py
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Sequence
+
+
+def allocate(name, count=1, seed=None):
+    """
+    Reserve `count` consecutive numbers from sequence `name` and return them
+    as a range. The counter row is bumped with a single atomic UPDATE, which
+    holds its row lock until the surrounding transaction commits, so
+    concurrent callers never receive the same number.
+
+    `seed()` returns the highest number already issued and is only called
+    the first time a sequence is used (to continue existing number series).
+    Numbers reserved by a transaction that later fails are skipped.
+    """
+    if count < 1:
+        return range(0)
+
+    with transaction.atomic():
+        bumped = Sequence.objects.filter(name=name).update(last_value=F("last_value") + count)
+        if not bumped:
+            _create(name, seed)
+            Sequence.objects.filter(name=name).update(last_value=F("last_value") + count)
+        last = Sequence.objects.filter(name=name).values_list("last_value", flat=True).get()
+
+    return range(last - count + 1, last + 1)
+
+
+def next_value(name, seed=None):
+    return allocate(name, 1, seed=seed)[0]
+
+
+def _create(name, seed):
+    start = seed() if seed else 0
+    try:
+        with transaction.atomic():
+            Sequence.objects.create(name=name, last_value=start)
+    except IntegrityError:
+        pass  # another worker created it first; its seed is just as good
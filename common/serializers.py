@@ -0,0 +1,16 @@
+# common/serializers.py
+from rest_framework import serializers
+from .models import Job
+
+
+class JobProgressSerializer(serializers.ModelSerializer):
+    eta_seconds = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'object_id', 'status',
+            'rows_total', 'rows_done', 'rows_failed', 'eta_seconds',
+            'errors', 'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
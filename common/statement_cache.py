@@ -0,0 +1,140 @@
+# common/statement_cache.py
+"""
+Cache for statement outputs (JSON data, CSV and PDF files).
+
+Entries are keyed by the statement's parameters plus the current data
+versions of the scopes it reads (see common.versions), so a change to a
+paypoint's or agent's data makes its old entries unreachable; they are
+never invalidated explicitly and simply expire.
+
+Uses the "statements" cache alias when configured, else "default".
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.response import Response
+
+from . import versions
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = getattr(settings, "STATEMENT_CACHE_TIMEOUT", 60 * 60 * 24 * 7)
+MAX_FILE_BYTES = getattr(settings, "STATEMENT_CACHE_MAX_BYTES", 5 * 1024 * 1024)
+METRICS = ("hit", "miss", "store", "skip")
+
+
+def _cache():
+    return caches["statements" if "statements" in settings.CACHES else "default"]
+
+
+def _key(kind, parts, scopes):
+    current = versions.current(scopes)
+    version = ".".join(f"{s}={current[s]}" for s in sorted(current))
+    digest = hashlib.sha1(repr((parts, version)).encode()).hexdigest()
+    return f"statement:{kind}:{digest}"
+
+
+def _count(kind, metric):
+    cache = _cache()
+    key = f"statement-metrics:{kind}:{metric}"
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:  # evicted between add and incr
+        cache.set(key, 1, timeout=None)
+
+
+def stats(kinds):
+    """{kind: {"hit": n, "miss": n, "store": n, "skip": n}} since the counters were last reset."""
+    cache = _cache()
+    keys = [f"statement-metrics:{kind}:{metric}" for kind in kinds for metric in METRICS]
+    values = cache.get_many(keys)
+    return {
+        kind: {metric: values.get(f"statement-metrics:{kind}:{metric}", 0) for metric in METRICS}
+        for kind in kinds
+    }
+
+
+def _file_response(content, content_type, disposition):
+    response = HttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = disposition
+    return response
+
+
+def _restore(entry):
+    if entry[0] == "json":
+        return Response(entry[1])
+    return _file_response(*entry[1:])
+
+
+def _tee(kind, key, response):
+    """Stream the response through, storing it once complete if it is small enough."""
+    chunks, size = [], 0
+    for chunk in response.streaming_content:
+        if chunks is not None:
+            size += len(chunk)
+            if size > MAX_FILE_BYTES:
+                chunks = None
+                _count(kind, "skip")
+            else:
+                chunks.append(chunk)
+        yield chunk
+    if chunks is not None:
+        _cache().set(key, ("file", b"".join(chunks), response["Content-Type"],
+                           response["Content-Disposition"]), TIMEOUT)
+        _count(kind, "store")
+
+
+def _store(kind, key, response):
+    if response.status_code != 200:
+        return response
+
+    if isinstance(response, Response):
+        _cache().set(key, ("json", response.data), TIMEOUT)
+        _count(kind, "store")
+    elif isinstance(response, StreamingHttpResponse):
+        streamed = StreamingHttpResponse(_tee(kind, key, response),
+                                         content_type=response["Content-Type"])
+        streamed["Content-Disposition"] = response["Content-Disposition"]
+        return streamed
+    elif len(response.content) <= MAX_FILE_BYTES:
+        _cache().set(key, ("file", response.content, response["Content-Type"],
+                           response["Content-Disposition"]), TIMEOUT)
+        _count(kind, "store")
+    else:
+        _count(kind, "skip")
+    return response
+
+
+def cached_response(kind, parts, scopes, build):
+    """
+    Return the statement response for `parts` (a tuple of its parameters),
+    from the cache when the data versions of `scopes` are unchanged;
+    otherwise call `build()` and cache its output. Streaming responses are
+    cached as they are sent, unless larger than STATEMENT_CACHE_MAX_BYTES.
+    """
+    key = _key(kind, parts, scopes)
+    entry = _cache().get(key)
+    if entry is not None:
+        _count(kind, "hit")
+        logger.debug("statement cache hit %s %s", kind, parts)
+        return _restore(entry)
+
+    _count(kind, "miss")
+    logger.debug("statement cache miss %s %s", kind, parts)
+    return _store(kind, key, build())
+
+
+def warm(kind, parts, scopes, build):
+    """Build and cache a statement unless already cached. Returns True if it was built."""
+    key = _key(kind, parts, scopes)
+    if _cache().get(key) is not None:
+        return False
+    response = _store(kind, key, build())
+    if response.streaming:
+        for _ in response.streaming_content:  # drain so the tee stores it
+            pass
+    return True
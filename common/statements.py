@@ -0,0 +1,242 @@
+# common/statements.py
+"""
+PDF rendering for billing and commission statements.
+
+Rows are laid out in page-sized LongTable chunks with fixed column widths
+and row heights, so reportlab never has to measure or split a table of
+thousands of rows; each chunk repeats the column header. Cells too wide
+for their column are wrapped onto extra lines up front and the row made
+taller to match, which is what decides where a page ends. Paragraph and
+table styles are built once per process and reused.
+
+reportlab is optional: render functions raise ImportError without it.
+
+Render pools use the "spawn" start method: the callers are reading the
+database while the pool starts, and forked children would inherit their
+open connections.
+"""
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from functools import lru_cache
+from io import BytesIO
+
+ROW_HEIGHT = 16  # points; height of a one-line row
+MARGIN_MM = 16
+BODY_FONT = "Helvetica"
+CELL_PADDING = (6, 3)  # reportlab's default (left/right, top/bottom) cell padding
+WIDEST_GLYPH = 1.015  # em; Helvetica's widest character ("@")
+
+
+@dataclass(frozen=True)
+class StatementLayout:
+    title: str
+    columns: tuple
+    col_widths: tuple  # fractions of the frame width
+    right_aligned: tuple  # column indexes
+    header_colour: str
+    font_size: int = 9
+
+
+LAYOUTS = {
+    "billing": StatementLayout(
+        title="Billing Statement",
+        columns=("Contract_id", "Client_name", "Status", "Contract Premium"),
+        col_widths=(0.2, 0.4, 0.2, 0.2),
+        right_aligned=(3,),
+        header_colour="#DFF0D8",
+    ),
+    "commission": StatementLayout(
+        title="Commission Statement",
+        columns=("Contract_id", "Client_name", "Status", "Agent code", "Agent name",
+                 "Contract Premium", "Commission due"),
+        col_widths=(0.13, 0.2, 0.13, 0.1, 0.18, 0.13, 0.13),
+        right_aligned=(5, 6),
+        header_colour="#D0E9C6",
+        font_size=7,
+    ),
+}
+
+
+@dataclass
+class Statement:
+    """One PDF to render: `header` is [(label, value)], `rows` lists of cell values."""
+    layout: str
+    header: list
+    rows: list
+    totals: dict  # {column index: value}
+
+
+@lru_cache(maxsize=None)
+def _page():
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+
+    width, height = A4
+    margin = MARGIN_MM * mm
+    # SimpleDocTemplate's frame has 6pt padding on each side
+    return A4, margin, width - 2 * margin - 12, height - 2 * margin - 12
+
+
+@lru_cache(maxsize=None)
+def _paragraph_styles():
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    styles = getSampleStyleSheet()
+    return styles["Title"], styles["Normal"], styles["Heading3"]
+
+
+@lru_cache(maxsize=None)
+def _table_styles(layout_name):
+    """(body style, style for the last chunk, which ends with the totals row)."""
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    layout = LAYOUTS[layout_name]
+    commands = [
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(layout.header_colour)),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), layout.font_size),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ]
+    commands += [("ALIGN", (i, 1), (i, -1), "RIGHT") for i in layout.right_aligned]
+    last = commands + [("BACKGROUND", (0, -1), (-1, -1), colors.HexColor("#F5F5F5"))]
+    return TableStyle(commands), TableStyle(last)
+
+
+def _intro(layout, header):
+    from reportlab.platypus import Paragraph, Spacer
+
+    title, normal, heading = _paragraph_styles()
+    return ([Paragraph(f"<b>{layout.title}</b>", title), Spacer(1, 6)]
+            + [Paragraph(f"<b>{label}:</b> {value}", normal) for label, value in header]
+            + [Spacer(1, 10), Paragraph("<b>List of clients</b>", heading), Spacer(1, 4)])
+
+
+def _wrap_rows(rows, col_widths, font_size):
+    """
+    (rows, row heights): cells wider than their column are split onto
+    lines at spaces, and their row is made tall enough for the lines.
+    """
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    widths = [w - 2 * CELL_PADDING[0] for w in col_widths]
+    # cells this short fit whatever their characters, without measuring
+    safe_lengths = [int(w // (font_size * WIDEST_GLYPH)) for w in widths]
+    leading = font_size * 1.2  # reportlab's default leading
+    wrapped, heights = [], []
+    for row in rows:
+        lines = 1
+        cells = list(row)
+        for i, (cell, width, safe) in enumerate(zip(cells, widths, safe_lengths)):
+            text = "" if cell is None else str(cell)
+            if len(text) > safe and stringWidth(text, BODY_FONT, font_size) > width:
+                split = simpleSplit(text, BODY_FONT, font_size, width)
+                cells[i], lines = "\n".join(split), max(lines, len(split))
+        wrapped.append(cells)
+        heights.append(ROW_HEIGHT if lines == 1 else max(ROW_HEIGHT, lines * leading + 2 * CELL_PADDING[1]))
+    return wrapped, heights
+
+
+def _chunks(rows, heights, first, per_page):
+    """Split rows into chunks whose heights, under a header row, fit `first` then `per_page`."""
+    start, available = 0, first
+    while start < len(rows):
+        end, used = start, ROW_HEIGHT
+        while end < len(rows) and (end == start or used + heights[end] <= available):
+            used += heights[end]
+            end += 1
+        yield rows[start:end], heights[start:end]
+        start, available = end, per_page
+
+
+def statement_flowables(statement):
+    from reportlab.platypus import LongTable
+
+    layout = LAYOUTS[statement.layout]
+    _, _, frame_width, frame_height = _page()
+    col_widths = [frame_width * f for f in layout.col_widths]
+    body_style, last_style = _table_styles(statement.layout)
+
+    intro = _intro(layout, statement.header)
+    intro_height = sum(f.wrap(frame_width, frame_height)[1] + f.getSpaceBefore() + f.getSpaceAfter()
+                       for f in intro)
+
+    totals_row = ["Total"] + [""] * (len(layout.columns) - 1)
+    for index, value in statement.totals.items():
+        totals_row[index] = f"{value}"
+    rows, heights = _wrap_rows(list(statement.rows) + [[""] * len(layout.columns), totals_row],
+                               col_widths, layout.font_size)
+
+    flowables = intro
+    # the first page loses the intro (and a row's slack for spacing collapse)
+    chunks = list(_chunks(rows, heights, frame_height - intro_height - ROW_HEIGHT, frame_height))
+    for n, (chunk, chunk_heights) in enumerate(chunks):
+        data = [list(layout.columns)] + chunk
+        flowables.append(LongTable(
+            data, colWidths=col_widths, rowHeights=[ROW_HEIGHT] + chunk_heights, repeatRows=1,
+            hAlign="LEFT", style=last_style if n == len(chunks) - 1 else body_style,
+        ))
+    return flowables
+
+
+def _pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def render_statement(statement):
+    """Render one Statement to PDF bytes."""
+    from reportlab.platypus import SimpleDocTemplate
+
+    pagesize, margin, _, _ = _page()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=pagesize, leftMargin=margin, rightMargin=margin,
+                            topMargin=margin, bottomMargin=margin)
+    doc.build(statement_flowables(statement))
+    return buffer.getvalue()
+
+
+def render_statements(statements, workers=1):
+    """
+    Render many statements, in order, spreading them over a process pool
+    when workers > 1. Returns a list of PDF bytes.
+    """
+    statements = list(statements)
+    if workers <= 1 or len(statements) <= 1:
+        return [render_statement(s) for s in statements]
+    with _pool(workers) as pool:
+        return list(pool.map(render_statement, statements, chunksize=max(len(statements) // (workers * 4), 1)))
+
+
+def _render_keyed(item):
+    key, statement = item
+    return key, render_statement(statement)
+
+
+def iter_rendered_statements(items, workers=1):
+    """
+    Render (key, Statement) pairs, yielding (key, PDF bytes) as each one
+    finishes. `items` is consumed lazily and at most 2 * workers statements
+    are in flight, so large batches never sit in memory all at once.
+    """
+    if workers <= 1:
+        for key, statement in items:
+            yield key, render_statement(statement)
+        return
+
+    items = iter(items)
+    with _pool(workers) as pool:
+        pending = set()
+        while True:
+            for item in items:
+                pending.add(pool.submit(_render_keyed, item))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
@@ -0,0 +1,268 @@
+import gzip
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from datetime import date
+
+import openpyxl
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from agents.models import Agent
+from common.models import Sequence
+from common.readers import batched, read_upload_rows
+from common.sequences import allocate, next_value
+from common.statements import Statement, render_statement, render_statements
+
+
+class SequenceAllocationTest(TestCase):
+
+    def test_blocks_are_contiguous_and_disjoint(self):
+        first = allocate("test.series", 3)
+        second = allocate("test.series", 2)
+        self.assertEqual(list(first), [1, 2, 3])
+        self.assertEqual(list(second), [4, 5])
+        self.assertEqual(next_value("test.series"), 6)
+
+    def test_seed_continues_existing_numbers(self):
+        Agent.objects.bulk_create([
+            Agent(agent_code="A0041", agent_name="Old", agent_surname="Agent",
+                  branch="HARARE", date_joining=date(2020, 1, 1)),
+        ])
+        agent = Agent.objects.create(agent_name="New", agent_surname="Agent",
+                                     branch="HARARE", date_joining=date(2020, 1, 1))
+        self.assertEqual(agent.agent_code, "A0042")
+        self.assertEqual(Agent.reserve_codes(2), ["A0043", "A0044"])
+        self.assertEqual(Sequence.objects.get(name=Agent.CODE_SEQUENCE).last_value, 44)
+
+
+class UploadReaderTest(SimpleTestCase):
+
+    CSV = "Name,Amount\nalpha,1\n\n,\nbeta,2\n"
+
+    def _path(self, suffix, write):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        write(path)
+        return path
+
+    def test_csv_gzip_zip_and_xlsx_yield_the_same_rows(self):
+        def write_csv(path):
+            with open(path, "w", newline="") as f:
+                f.write(self.CSV)
+
+        def write_gzip(path):
+            with gzip.open(path, "wt", newline="") as f:
+                f.write(self.CSV)
+
+        def write_zip(path):
+            with zipfile.ZipFile(path, "w") as archive:
+                archive.writestr("receipts.csv", self.CSV)
+
+        def write_xlsx(path):
+            wb = openpyxl.Workbook()
+            for row in (["Name", "Amount"], ["alpha", "1"], [], ["beta", "2"]):
+                wb.active.append(row)
+            wb.save(path)
+
+        expected = [(2, ("alpha", "1")), (5, ("beta", "2"))]
+        for suffix, write in ((".csv", write_csv), (".csv.gz", write_gzip),
+                              (".zip", write_zip)):
+            self.assertEqual(list(read_upload_rows(self._path(suffix, write))), expected)
+
+        xlsx_rows = list(read_upload_rows(self._path(".xlsx", write_xlsx)))
+        self.assertEqual(xlsx_rows, [(2, ("alpha", "1")), (4, ("beta", "2"))])
+
+    def test_header_mapping_reorders_columns(self):
+        def write(path):
+            with open(path, "w", newline="") as f:
+                f.write("amount,Contract ID\n5.00,P00001\n")
+
+        path = self._path(".csv", write)
+        self.assertEqual(list(read_upload_rows(path, ("contract_id", ("amount_received", "amount")))),
+                         [(2, ("P00001", "5.00"))])
+        # Unknown headers fall back to positional columns
+        self.assertEqual(list(read_upload_rows(path, ("contract_id", "cover"))),
+                         [(2, ("5.00", "P00001"))])
+
+    def test_unsupported_format_and_batching(self):
+        with self.assertRaises(ValueError):
+            read_upload_rows("upload.pdf")
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+
+class ParseMonthTest(SimpleTestCase):
+
+    def test_formats_and_invalid_input(self):
+        from common.dates import parse_month
+
+        self.assertEqual(parse_month("2024-07"), date(2024, 7, 1))
+        self.assertEqual(parse_month(" 2024-07-15 "), date(2024, 7, 1))
+        for raw in (None, "", "2024-13", "2024-02-30", "July", "2024-07-01-02"):
+            self.assertIsNone(parse_month(raw), raw)
+
+
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        from access.models import Administrator
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = Administrator.objects.create_superuser(email="jobs@test.com", password="pass123")
+
+    def _agents_file(self):
+        return SimpleUploadedFile(
+            "agents.csv",
+            b"agent_name,agent_surname,branch,date_joining\n"
+            b"Rudo,Banda,HARARE,2021-03-01\n"
+            b"Rudo,Banda,HARARE,2021-03-01\n"
+            b"Tino,Dube,BULAWAYO,2022-05-01\n",
+        )
+
+    def test_queued_upload_is_processed_by_worker(self):
+        from agents.models import Upload
+        from common.jobs import enqueue, work
+        from common.models import JobStatus
+
+        upload = Upload.objects.create(uploaded_by=self.user, file=self._agents_file())
+        job = enqueue("agents.upload", upload.pk, reject_on_errors=True)
+        self.assertEqual(job.status, JobStatus.QUEUED)
+        self.assertEqual(Agent.objects.count(), 0)
+
+        self.assertEqual(work("test-worker", once=True), 1)
+        self.assertEqual(work("test-worker", once=True), 0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertEqual((job.rows_total, job.rows_done, job.rows_failed), (3, 3, 1))
+        self.assertEqual(job.errors, ["Row 3: Duplicate agent in file"])
+        self.assertEqual(Agent.objects.count(), 2)
+        upload.refresh_from_db()
+        self.assertTrue(upload.is_rejected)
+
+    @override_settings(JOBS_LEASE_SECONDS=60, JOBS_MAX_ATTEMPTS=2)
+    def test_job_of_a_dead_worker_is_reclaimed(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from agents.models import Upload
+        from common.jobs import claim_next, enqueue, work
+        from common.models import Job, JobStatus
+
+        upload = Upload.objects.create(uploaded_by=self.user, file=self._agents_file())
+        job = enqueue("agents.upload", upload.pk)
+        self.assertEqual(claim_next("dead-worker").pk, job.pk)
+
+        # within the lease the job stays with its worker
+        self.assertEqual(work("live-worker", once=True), 0)
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(work("live-worker", once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), (JobStatus.DONE, "live-worker", 2))
+        self.assertEqual(Agent.objects.count(), 2)
+
+        # out of attempts: failed rather than queued again
+        second = enqueue("agents.upload", upload.pk)
+        Job.objects.filter(pk=second.pk).update(
+            status=JobStatus.RUNNING, attempts=2, heartbeat_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(work("live-worker", once=True), 0)
+        second.refresh_from_db()
+        self.assertEqual(second.status, JobStatus.FAILED)
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_api_upload_runs_inline_and_reports_progress(self):
+        self.client.force_login(self.user)
+
+        response = self.client.post("/agents/uploads/", {"file": self._agents_file()})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["status"], "partial_failure")
+        self.assertEqual(Agent.objects.count(), 2)
+
+        progress = self.client.get(response.data["progress_url"])
+        self.assertEqual(progress.status_code, 200)
+        self.assertEqual(progress.data["status"], "done")
+        self.assertEqual(progress.data["rows_done"], 3)
+        self.assertEqual(progress.data["rows_failed"], 1)
+
+        self.assertEqual(self.client.get("/agents/uploads/999/progress/").status_code, 404)
+
+
+class JobHeartbeatTest(TransactionTestCase):
+
+    @override_settings(JOBS_LEASE_SECONDS=0.3)
+    def test_long_job_keeps_its_lease_without_progress(self):
+        import time
+        from common.jobs import enqueue, job_handler, reclaim_expired, work
+        from common.models import JobStatus
+
+        reclaimed = []
+
+        @job_handler("tests.slow")
+        def slow(job):
+            time.sleep(0.6)  # twice the lease, reporting nothing
+            reclaimed.append(reclaim_expired())
+
+        job = enqueue("tests.slow", 1)
+        self.assertEqual(work("test-worker", once=True), 1)
+
+        self.assertEqual(reclaimed, [0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JobStatus.DONE, 1))
+        self.assertGreater(job.heartbeat_at, job.started_at)
+
+
+class StatementPDFTest(SimpleTestCase):
+
+    def _statement(self, rows):
+        return Statement(
+            layout="billing",
+            header=[("Pay point name", "Test Co"), ("Billing Month", "Jul-24")],
+            rows=[[f"ZL{i:07d}", f"Client {i}", "Active", 1.0] for i in range(rows)],
+            totals={3: float(rows)},
+        )
+
+    def _pages(self, pdf):
+        return len(re.findall(rb"/Type /Page\b", pdf))
+
+    def test_rows_are_chunked_one_table_per_page(self):
+        from common.statements import statement_flowables
+        from reportlab.platypus import LongTable
+
+        tables = [f for f in statement_flowables(self._statement(500)) if isinstance(f, LongTable)]
+        pdf = render_statement(self._statement(500))
+
+        # every chunk fits its page, so no table is split across pages
+        self.assertEqual(self._pages(pdf), len(tables))
+        self.assertEqual(sum(len(t._cellvalues) - 1 for t in tables), 500 + 2)  # + blank and total rows
+        self.assertTrue(all(t._cellvalues[0][0] == "Contract_id" for t in tables))
+
+    def test_long_cells_wrap_and_still_fit_the_page(self):
+        from common.statements import ROW_HEIGHT, statement_flowables
+        from reportlab.platypus import LongTable
+
+        statement = self._statement(300)
+        for row in statement.rows[::3]:
+            row[1] = f"{row[1]} Tatenda Nyasha Rufaro Chiedza Mukamuri-Chidzikwe Zvobgo Makoni"
+        tables = [f for f in statement_flowables(statement) if isinstance(f, LongTable)]
+
+        first = tables[0]
+        self.assertIn("\n", first._cellvalues[1][1])
+        self.assertGreater(first._argH[1], ROW_HEIGHT)
+        self.assertEqual(first._argH[2], ROW_HEIGHT)
+        self.assertEqual(self._pages(render_statement(statement)), len(tables))
+        self.assertEqual(sum(len(t._cellvalues) - 1 for t in tables), 300 + 2)
+
+    def test_batch_render_keeps_order(self):
+        sizes = [1, 120, 60]
+        pdfs = render_statements([self._statement(n) for n in sizes], workers=2)
+        self.assertEqual([self._pages(pdf) for pdf in pdfs],
+                         [self._pages(render_statement(self._statement(n))) for n in sizes])
+        self.assertTrue(all(pdf.startswith(b"%PDF") for pdf in pdfs))
@@ -0,0 +1,36 @@
+# common/versions.py
+"""
+Data versions: one counter per scope ("paypoint:12", "agent:7", ...) plus a
+GLOBAL scope for changes that touch everything (e.g. the month roll).
+Cache keys built from `current()` change as soon as the data does.
+"""
+from django.db.models import F
+
+from .models import DataVersion
+
+GLOBAL = "global"
+
+
+def scope(kind, pk):
+    return f"{kind}:{pk}"
+
+
+def bump(scopes):
+    """Increment the given scopes' versions (two queries whatever the count)."""
+    scopes = set(scopes)
+    if not scopes:
+        return
+    DataVersion.objects.filter(scope__in=scopes).update(version=F("version") + 1)
+    missing = scopes - set(DataVersion.objects.filter(scope__in=scopes).values_list("scope", flat=True))
+    if missing:
+        DataVersion.objects.bulk_create(
+            [DataVersion(scope=s, version=1) for s in missing], ignore_conflicts=True
+        )
+
+
+def current(scopes):
+    """{scope: version} for the scopes and GLOBAL; unknown scopes are 0."""
+    scopes = set(scopes) | {GLOBAL}
+    versions = dict.fromkeys(scopes, 0)
+    versions.update(DataVersion.objects.filter(scope__in=scopes).values_list("scope", "version"))
+    return versions
@@ -0,0 +1,23 @@
+# common/views.py
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .jobs import latest_job
+from .serializers import JobProgressSerializer
+
+
+class JobProgressAPIView(APIView):
+    """
+    Status and progress (rows done / failed, ETA) of the latest job of
+    `kind` for the object in the URL, e.g. an Upload.
+    """
+    permission_classes = [IsAuthenticated]
+    kind = None
+
+    def get(self, request, pk):
+        job = latest_job(self.kind, pk)
+        if job is None:
+            return Response({"detail": "No processing job found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(JobProgressSerializer(job).data)
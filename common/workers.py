@@ -0,0 +1,14 @@
+# common/workers.py
+def init_worker():
+    """
+    Initializer for worker processes (process pools, run_workers). Under
+    the "spawn" start method a worker is a fresh interpreter, so Django is
+    set up again; forked workers inherit the parent's setup. Callers close
+    their database connections before starting workers, so each worker
+    opens its own.
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
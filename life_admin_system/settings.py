@@ -68,6 +68,7 @@ INSTALLED_APPS = [
     "cancellations",
     "billing",
     "commissions",
+    "common",
 ]
 
 # --------------------------------------------------
@@ -122,6 +123,9 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # worker processes (run_workers, commission runs) write concurrently:
+            # take the write lock up front and wait for it rather than fail
+            "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 30},
         }
     }
 
@@ -238,7 +242,51 @@ CONTENT_SECURITY_POLICY = {
 # --------------------------------------------------
 AUDITLOG_INCLUDE_ALL_MODELS = True
 
+# Derived tables are rebuilt from audited data; logging them is pure overhead
+AUDITLOG_EXCLUDE_TRACKING_MODELS = (
+    "policies.policysnapshot",
+    "policies.policychange",
+    "commissions.agentcommissionmonth",
+    "commissions.commissionmonthrun",
+    "common.sequence",
+    "common.job",
+    "common.dataversion",
+)
+
+# --------------------------------------------------
+# BACKGROUND JOBS
+# --------------------------------------------------
+# Background jobs are processed by `manage.py run_workers` (the "worker" process
+# in Procfile and render.yaml). Set JOBS_RUN_INLINE=1 to run jobs inside the
+# request instead (no worker process needed).
+JOBS_RUN_INLINE = os.getenv("JOBS_RUN_INLINE", "0") == "1"
+
+# A running job whose worker has stopped renewing its lease for JOBS_LEASE_SECONDS
+# (killed, restarted by a deploy) is queued again, up to JOBS_MAX_ATTEMPTS runs.
+# Workers renew the lease every JOBS_LEASE_SECONDS / 3 while a job runs.
+JOBS_LEASE_SECONDS = int(os.getenv("JOBS_LEASE_SECONDS", "900"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+
+
 
 
 
 
+# --------------------------------------------------
+# STATEMENTS
+# --------------------------------------------------
+# Processes rendering PDFs for the month-end statements ZIP
+# (the "billing.statements_zip" job queued by /billing/billing-records/statements-zip/).
+STATEMENT_ZIP_WORKERS = int(os.getenv("STATEMENT_ZIP_WORKERS", "2"))
+
+# Month-end commission statement emails (manage.py email_commission_statements):
+# processes rendering PDFs, and messages handed to the mail connection per send.
+STATEMENT_EMAIL_WORKERS = int(os.getenv("STATEMENT_EMAIL_WORKERS", "2"))
+STATEMENT_EMAIL_CHUNK_SIZE = int(os.getenv("STATEMENT_EMAIL_CHUNK_SIZE", "50"))
+
+# --------------------------------------------------
+# COMMISSIONS
+# --------------------------------------------------
+# Processes generating a month's commissions, each over its own shard of
+# agents (commissions.runs; the admin "Run commissions" job).
+COMMISSION_RUN_WORKERS = int(os.getenv("COMMISSION_RUN_WORKERS", "2"))
@@ -18,8 +18,13 @@ class Paypoint(models.Model):
     def save(self, *args, **kwargs):
         # enforce lowercase to avoid PPSZESA vs ppszesa duplicates
         self.paypoint_code = self.paypoint_code.lower()
+        renamed = not self._state.adding
         super().save(*args, **kwargs)
 
+        if renamed:  # names appear on cached billing statements
+            from common.versions import bump, scope
+            bump([scope("paypoint", self.pk)])
+
     def __str__(self):
         return f"{self.paypoint_name}"
 
@@ -1,8 +1,8 @@
 from django.contrib import admin
-from .models import Policy, Upload
+from .models import Policy, PolicySnapshot, Upload
 from django.db import models
 from django.utils import timezone
-from .services import process_upload
+from common.jobs import enqueue
 from import_export.admin import ExportMixin
 from .resources import PolicyResource
 
@@ -60,6 +60,12 @@ class PolicyAdminModel(ExportMixin, admin.ModelAdmin):
                        'cancellation_status','cancellation_effective_date','overall_policy_status',
                        'policy_status','created_date','created_by']
 
+    def get_queryset(self, request):
+        # statuses come from SQL annotations instead of per-row queries
+        return (super().get_queryset(request)
+                .with_status()
+                .select_related('agent', 'paypoint', 'client', 'created_by'))
+
     def save_model(self, request, obj, form, change):
         if not obj.pk:
             obj.created_by = request.user
@@ -70,6 +76,23 @@ class PolicyAdminModel(ExportMixin, admin.ModelAdmin):
 admin.site.register(Policy, PolicyAdminModel)
 
 
+@admin.register(PolicySnapshot)
+class PolicySnapshotAdmin(admin.ModelAdmin):
+    list_display = ['policy', 'duration', 'total_premium_due', 'total_premium_received',
+                    'total_premium_arrears', 'months_paid', 'months_in_arrears',
+                    'policy_status', 'claim_status', 'cancellation_status',
+                    'overall_policy_status', 'refreshed_at']
+    list_filter = ['overall_policy_status', 'policy_status', 'claim_status', 'cancellation_status']
+    search_fields = ['policy__contract_id']
+    list_select_related = ['policy']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 
 
 @admin.register(Upload)
@@ -98,16 +121,17 @@ class UploadAdmin(admin.ModelAdmin):
             upload.approved_at = timezone.now()
             upload.save()
 
-            errors = process_upload(upload)
+            job = enqueue("policies.upload", upload.pk)
 
-            if errors:
+            # only reached with JOBS_RUN_INLINE; otherwise a worker picks it up
+            if job.errors:
                 self.message_user(
                     request,
-                    f"Upload {upload.id} imported with errors:\n" + "\n".join(errors),
+                    f"Upload {upload.id} imported with errors:\n" + "\n".join(job.errors),
                     level="warning"
                 )
 
-        self.message_user(request, "Uploads approved and processed.")
+        self.message_user(request, "Uploads approved and queued for processing.")
 
     @admin.action(description="Reject selected uploads")
     def reject_uploads(self, request, queryset):
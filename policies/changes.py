@@ -0,0 +1,63 @@
+# policies/changes.py
+"""
+Single notification point for "something about these policies changed".
+
+Policy, PremiumReceipt, Claim and CancellationRequest call
+`notify_policies_changed` after they write, and everything derived from
+policy data is refreshed from here: the PolicySnapshot table, the data
+versions of the policies' paypoints and agents (which key cached
+statements), and the PolicyChange journal (read by incremental commission
+runs).
+"""
+
+VERSION_LOOKUP_CHUNK = 2000
+
+
+def notify_policies_changed(policy_ids):
+    policy_ids = {pid for pid in policy_ids if pid is not None}
+    if not policy_ids:
+        return
+
+    from .snapshots import refresh_policy_snapshots
+    refresh_policy_snapshots(policy_ids)
+    bump_policy_versions(policy_ids)
+    record_policy_changes(policy_ids)
+
+
+def record_policy_changes(policy_ids):
+    """Stamp the policies' PolicyChange rows with the current time."""
+    from django.utils import timezone
+    from .models import PolicyChange
+
+    now = timezone.now()
+    policy_ids = sorted(policy_ids)
+    for start in range(0, len(policy_ids), VERSION_LOOKUP_CHUNK):
+        PolicyChange.objects.bulk_create(
+            [PolicyChange(policy_id=pk, changed_at=now) for pk in policy_ids[start:start + VERSION_LOOKUP_CHUNK]],
+            update_conflicts=True,
+            unique_fields=["policy_id"],
+            update_fields=["changed_at"],
+        )
+
+
+def owner_scopes(paypoint_ids=(), agent_ids=()):
+    from common.versions import scope
+
+    return ({scope("paypoint", pk) for pk in paypoint_ids if pk is not None}
+            | {scope("agent", pk) for pk in agent_ids if pk is not None})
+
+
+def bump_policy_versions(policy_ids):
+    """Bump the data versions of the paypoints and agents owning the policies."""
+    from common.versions import bump
+    from .models import Policy
+
+    policy_ids = sorted(policy_ids)
+    paypoint_ids, agent_ids = set(), set()
+    for start in range(0, len(policy_ids), VERSION_LOOKUP_CHUNK):
+        chunk = policy_ids[start:start + VERSION_LOOKUP_CHUNK]
+        for paypoint_id, agent_id in (Policy.objects.filter(pk__in=chunk)
+                                      .values_list("paypoint_id", "agent_id").distinct()):
+            paypoint_ids.add(paypoint_id)
+            agent_ids.add(agent_id)
+    bump(owner_scopes(paypoint_ids, agent_ids))
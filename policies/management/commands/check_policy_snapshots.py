@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from policies.snapshots import DEFAULT_CHUNK_SIZE, diff_policy_snapshots, refresh_policy_snapshots
+
+
+class Command(BaseCommand):
+    help = "Compare PolicySnapshot rows with the live status computation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument("--fix", action="store_true",
+                            help="Refresh the snapshots that differ.")
+        parser.add_argument("--limit", type=int, default=50,
+                            help="Maximum differences to print (default %(default)s).")
+
+    def handle(self, *args, **options):
+        differences = diff_policy_snapshots(chunk_size=options["chunk_size"])
+        if not differences:
+            self.stdout.write(self.style.SUCCESS("Policy snapshots are consistent."))
+            return
+
+        for policy_id, field, stored, live in differences[:options["limit"]]:
+            self.stdout.write(f"policy {policy_id}: {field} stored={stored!r} live={live!r}")
+
+        stale = {policy_id for policy_id, *_ in differences}
+        if options["fix"]:
+            refresh_policy_snapshots(stale)
+            self.stdout.write(self.style.SUCCESS(f"Refreshed {len(stale)} stale snapshots."))
+            return
+
+        raise CommandError(f"{len(differences)} differences across {len(stale)} policies.")
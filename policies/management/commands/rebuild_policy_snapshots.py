@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from policies.snapshots import DEFAULT_CHUNK_SIZE, rebuild_policy_snapshots
+
+
+class Command(BaseCommand):
+    help = "Recompute the PolicySnapshot table for every policy."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Policies recomputed per query (default %(default)s).")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(done):
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"  {done} snapshots written ({time.monotonic() - started:.1f}s)")
+
+        total = rebuild_policy_snapshots(chunk_size=options["chunk_size"], on_chunk=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {total} policy snapshots in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from policies.services import roll_policy_month
+
+
+class Command(BaseCommand):
+    help = "Recompute current_month, duration and total_premium_due for every policy."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Target month as YYYY-MM (default: this month).")
+        parser.add_argument("--skip-snapshots", action="store_true",
+                            help="Do not refresh PolicySnapshot rows of rolled policies.")
+
+    def handle(self, *args, **options):
+        month = None
+        if options["month"]:
+            try:
+                year, mon = map(int, options["month"].split("-")[:2])
+                month = date(year, mon, 1)
+            except ValueError:
+                raise CommandError("Invalid --month. Use YYYY-MM.")
+
+        def report(start_date, groups, rows, seconds):
+            self.stdout.write(
+                f"  start {start_date:%Y-%m}: {groups} groups, {rows} policies rolled in {seconds:.3f}s"
+            )
+
+        result = roll_policy_month(
+            month, refresh_snapshots=not options["skip_snapshots"], on_chunk=report
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled to {result['month']:%Y-%m}: {result['updated']} policies updated "
+            f"across {result['groups']} groups in {result['seconds']:.2f}s."
+        ))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:17
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0006_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolicySnapshot',
+            fields=[
+                ('policy', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='policies.policy')),
+                ('duration', models.PositiveIntegerField(null=True)),
+                ('total_premium_due', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('total_premium_received', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_premium_arrears', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('months_paid', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('months_in_arrears', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('policy_status', models.CharField(db_index=True, max_length=30)),
+                ('claim_status', models.CharField(db_index=True, max_length=20)),
+                ('claim_effective_date', models.DateField(blank=True, null=True)),
+                ('cancellation_status', models.CharField(db_index=True, max_length=20)),
+                ('cancellation_effective_date', models.DateField(blank=True, null=True)),
+                ('overall_policy_status', models.CharField(db_index=True, max_length=30)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0007_policysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolicyChange',
+            fields=[
+                ('policy_id', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('changed_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
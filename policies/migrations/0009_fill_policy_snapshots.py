@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def fill_policy_snapshots(apps, schema_editor):
+    # The status rules live in Policy.objects.with_status(), which historical
+    # models don't have, so the rebuild runs on the current models; the
+    # dependencies below cover every table it reads.
+    from policies.snapshots import rebuild_policy_snapshots
+
+    rebuild_policy_snapshots()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0008_policychange'),
+        ('claims', '0004_claim_reject_reason'),
+        ('cancellations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_policy_snapshots, migrations.RunPython.noop),
+    ]
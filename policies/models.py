@@ -1,9 +1,16 @@
 # models.py
-from decimal import Decimal
+from decimal import ROUND_HALF_UP, Decimal
 from datetime import date
 from django.db import models, transaction
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import (
+    Case, DecimalField, Exists, F, IntegerField, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models import CharField as CharOutput
+from django.db.models.functions import Cast, Round, TruncDate
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual, LessThan, LessThanOrEqual
+from django.apps import apps
+from common.sequences import allocate
 from .validators import proposal_sign_date, validate_first_day
 from agents.models import Agent
 from clients.models import Client
@@ -18,6 +25,138 @@ from django.core.exceptions import ObjectDoesNotExist
 
 
 
+def premium_ratio(amount, premium):
+    """`amount / premium` to two places, halves away from zero (what `with_status()` computes)."""
+    return (amount / premium).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def _cents(expression):
+    return Cast(Round(expression * Value(100)), IntegerField())
+
+
+def _ratio_hundredths(amount, premium):
+    """
+    SQL for `premium_ratio(amount, premium) * 100`, in integer arithmetic.
+    ROUND on a float quotient (SQLite) rounds x.xx5 either way depending on
+    its binary representation; integer division of cents cannot.
+    """
+    amount, premium = _cents(amount), _cents(premium)
+
+    def half_up(cents):
+        return (cents * Value(200) + premium) / (premium * Value(2))
+
+    return Case(
+        When(GreaterThanOrEqual(amount, 0), then=half_up(amount)),
+        default=-half_up(-amount),
+        output_field=IntegerField(),
+    )
+
+
+class PolicyQuerySet(models.QuerySet):
+    """
+    Database-side versions of the Policy status properties.
+
+    `with_status()` computes the same values as `months_paid`,
+    `months_in_arrears`, `policy_status`, `claim_status`,
+    `cancellation_status` and `overall_policy_status` as SQL annotations
+    (prefixed with `annotated_`), so callers can filter, sort and group by
+    status in a single query. The properties reuse these values when present.
+    """
+
+    LIFECYCLE_STATUSES = ["Policy Lapsed", "Policy Accepted", "NTU Non Payment"]
+
+    def with_status(self):
+        Claim = apps.get_model("claims", "Claim")
+        money = DecimalField(max_digits=12, decimal_places=2)
+
+        approved_claims = Claim.objects.filter(policy=OuterRef("pk"), status="APPROVED")
+        pending_claims = Claim.objects.filter(policy=OuterRef("pk"), status="REQUESTED")
+
+        # property semantics: a NULL or zero amount counts as "not set"
+        has_premium = Q(contract_premium__isnull=False) & ~Q(contract_premium=0)
+        has_received = Q(total_premium_received__isnull=False) & ~Q(total_premium_received=0)
+        has_due = Q(total_premium_due__isnull=False) & ~Q(total_premium_due=0)
+
+        # months in hundredths; the status thresholds compare these exactly
+        paid = Case(
+            When(has_premium & has_received,
+                 then=_ratio_hundredths(F("total_premium_received"), F("contract_premium"))),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        arrears = Case(
+            When(has_premium & has_due & has_received,
+                 then=_ratio_hundredths(F("total_premium_due") - F("total_premium_received"),
+                                        F("contract_premium"))),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+
+        return self.annotate(
+            annotated_has_approved_claim=Exists(approved_claims),
+            annotated_has_pending_claim=Exists(pending_claims),
+            # the local date, as `claim_effective_date` takes it in Python
+            annotated_claim_effective_date=TruncDate(
+                Subquery(approved_claims.order_by("pk").values("approved_at")[:1]),
+                tzinfo=timezone.get_current_timezone(),
+            ),
+            annotated_cancellation_request_status=F("cancellation_request__status"),
+            annotated_cancellation_effective_date=F("cancellation_request__effective_date"),
+            annotated_total_premium_arrears=Case(
+                When(has_due & has_received,
+                     then=F("total_premium_due") - F("total_premium_received")),
+                default=Value(Decimal("0.00")),
+                output_field=money,
+            ),
+            annotated_months_paid=paid * Value(Decimal("0.01"), output_field=money),
+            annotated_months_in_arrears=arrears * Value(Decimal("0.01"), output_field=money),
+        ).annotate(
+            annotated_policy_status=Case(
+                When(GreaterThan(arrears, 200) & GreaterThanOrEqual(paid, 100),
+                     then=Value("Policy Lapsed")),
+                When(LessThanOrEqual(arrears, 200) & GreaterThanOrEqual(paid, 100),
+                     then=Value("Policy Active")),
+                When(GreaterThan(arrears, 0) & LessThan(paid, 100),
+                     then=Value("NTU Non Payment")),
+                default=Value("Policy Accepted"),
+                output_field=CharOutput(),
+            ),
+            annotated_claim_status=Case(
+                When(annotated_has_approved_claim=True, then=Value("Death")),
+                When(annotated_has_pending_claim=True, then=Value("Pending")),
+                default=Value("Active"),
+                output_field=CharOutput(),
+            ),
+            annotated_cancellation_status=Case(
+                When(annotated_cancellation_request_status__isnull=True, then=Value("Active")),
+                When(annotated_cancellation_request_status="APPROVED", then=Value("Cancelled")),
+                When(annotated_cancellation_request_status="REQUESTED", then=Value("Pending Approval")),
+                default=F("annotated_cancellation_request_status"),
+                output_field=CharOutput(),
+            ),
+        ).annotate(
+            annotated_overall_policy_status=Case(
+                When(annotated_has_approved_claim=True, then=Value("Death")),
+                When(annotated_cancellation_request_status="APPROVED", then=Value("Cancelled")),
+                When(annotated_policy_status__in=self.LIFECYCLE_STATUSES,
+                     then=F("annotated_policy_status")),
+                default=Value("Active"),
+                output_field=CharOutput(),
+            ),
+        )
+
+    def commissionable_for(self, month):
+        """
+        Policies eligible for commission in `month`: the rules of
+        `Policy.is_commissionable` (agent set, started by the month, not
+        cancelled, overall status Active or Death) as one SQL filter.
+        """
+        return (self.filter(agent__isnull=False, start_date__lte=month)
+                .exclude(cancellation_request__status="APPROVED")
+                .with_status()
+                .filter(annotated_overall_policy_status__in=["Active", "Death"]))
+
+
 class Policy(models.Model):
     contract_id = models.CharField(max_length=10, unique=True, db_index=True, editable=False)
 
@@ -56,11 +195,15 @@ class Policy(models.Model):
                                            editable=False, null=True)
     # Remove months_paid, months_in_arrears, policy_status from DB fields
 
-    # Dynamic properties:
+    objects = PolicyQuerySet.as_manager()
+
+    # Dynamic properties (use the `with_status()` annotations when loaded):
 
     
     @property
     def total_premium_arrears(self):
+        if hasattr(self, "annotated_total_premium_arrears"):
+            return self.annotated_total_premium_arrears
         if self.total_premium_due and self.total_premium_received:
             return self.total_premium_due - self.total_premium_received
         return Decimal('0.00')
@@ -68,19 +211,25 @@ class Policy(models.Model):
 
     @property
     def months_paid(self):
+        if hasattr(self, "annotated_months_paid"):
+            return self.annotated_months_paid
         if self.contract_premium and self.total_premium_received:
-            return round(self.total_premium_received / self.contract_premium, 2)
+            return premium_ratio(self.total_premium_received, self.contract_premium)
         return 0
 
     @property
     def months_in_arrears(self):
+        if hasattr(self, "annotated_months_in_arrears"):
+            return self.annotated_months_in_arrears
         if self.contract_premium and self.total_premium_due and self.total_premium_received:
             arrears = self.total_premium_due - self.total_premium_received
-            return round(arrears / self.contract_premium, 2)
+            return premium_ratio(arrears, self.contract_premium)
         return 0
 
     @property
     def policy_status(self):
+        if hasattr(self, "annotated_policy_status"):
+            return self.annotated_policy_status
         if self.months_in_arrears > 2 and self.months_paid >= 1:
             return "Policy Lapsed"
         elif self.months_in_arrears <= 2 and self.months_paid >= 1:
@@ -118,6 +267,8 @@ class Policy(models.Model):
 
     @property
     def cancellation_status(self):
+        if hasattr(self, "annotated_cancellation_status"):
+            return self.annotated_cancellation_status
         try:
             cr = self.cancellation_request
             if cr.status == "APPROVED":
@@ -131,6 +282,8 @@ class Policy(models.Model):
 
     @property
     def cancellation_effective_date(self):
+        if hasattr(self, "annotated_cancellation_effective_date"):
+            return self.annotated_cancellation_effective_date
         try:
             return self.cancellation_request.effective_date
         except ObjectDoesNotExist:
@@ -143,6 +296,8 @@ class Policy(models.Model):
     @property
     def claim_status(self):
         """Return claim status: 'Death', 'Pending', or 'Active'"""
+        if hasattr(self, "annotated_claim_status"):
+            return self.annotated_claim_status
         approved_claim = self.claims.filter(status="APPROVED").first()
         if approved_claim:
             return "Death"
@@ -157,9 +312,11 @@ class Policy(models.Model):
     @property
     def claim_effective_date(self):
         """Return the approved claim's date if exists"""
+        if hasattr(self, "annotated_claim_effective_date"):
+            return self.annotated_claim_effective_date
         approved_claim = self.claims.filter(status="APPROVED").first()
         if approved_claim and approved_claim.approved_at:
-            return approved_claim.approved_at.date()
+            return timezone.localdate(approved_claim.approved_at)
         return None
 
 
@@ -175,6 +332,9 @@ class Policy(models.Model):
         3️⃣ Policy lifecycle
         4️⃣ Default Active
         """
+        if hasattr(self, "annotated_overall_policy_status"):
+            return self.annotated_overall_policy_status
+
         # 1️⃣ Check claims
         if self.claims.filter(status="APPROVED").exists():
             return "Death"
@@ -199,6 +359,7 @@ class Policy(models.Model):
         """
         Returns True if this policy is eligible for commission in the given month.
         Only Active or Death policies count. Cancelled, NTU, Lapsed, or Accepted do not.
+        Keep in step with PolicyQuerySet.commissionable_for (the same rules in SQL).
         """
         # 1️⃣ Must have an agent
         if not self.agent_id:
@@ -239,62 +400,75 @@ class Policy(models.Model):
     def _first_of_month(d: date) -> date:
         return date(d.year, d.month, 1)
 
+    # Premium per month by cover, and months per premium period
+    COVER_MONTHLY_RATE = {
+        500: Decimal('0.50'),
+        1000: Decimal('1.00'),
+        2000: Decimal('2.00'),
+    }
+    FREQUENCY_MONTHS = {'M': 1, 'Q': 3, 'H': 6, 'Y': 12}
 
-    def save(self, *args, **kwargs):
-        # Normalize dates to day 1
-        if self.start_date:
-            self.start_date = self._first_of_month(self.start_date)
-
-        cm = self.current_month or timezone.localdate()
-        self.current_month = self._first_of_month(cm)
-
+    @classmethod
+    def premium_schedule(cls, start_date, current_month, cover, frequency):
+        """
+        Return (duration, contract_premium, total_premium_due) for a policy
+        as of `current_month`. Shared by save() and the bulk month roll.
+        """
         # Months elapsed (non-negative)
-        if self.start_date and self.current_month:
-            months = (self.current_month.year - self.start_date.year) * 12 + \
-                     (self.current_month.month - self.start_date.month)
-            self.duration = max(months, 0)
+        if start_date and current_month:
+            months = (current_month.year - start_date.year) * 12 + \
+                     (current_month.month - start_date.month)
+            duration = max(months, 0)
         else:
-            self.duration = 0
-
-        # Premium per month by cover (use Decimal)
-        cover_to_monthly = {
-            self.Cover.BASIC:   Decimal('0.50'),
-            self.Cover.STANDARD: Decimal('1.00'),
-            self.Cover.PREMIA:  Decimal('2.00'),
-        }
-        monthly_rate = cover_to_monthly.get(self.cover)
+            duration = 0
+
+        monthly_rate = cls.COVER_MONTHLY_RATE.get(cover)
         if monthly_rate is None:
             raise ValidationError({"cover": "Invalid cover amount."})
 
         # Period length and premium per period
-        freq_to_months = {'M': 1, 'Q': 3, 'H': 6, 'Y': 12}
-        period_len = freq_to_months[self.frequency]
-        self.contract_premium = (monthly_rate * Decimal(str(period_len))).quantize(Decimal('0.01'))
+        period_len = cls.FREQUENCY_MONTHS[frequency]
+        contract_premium = (monthly_rate * Decimal(str(period_len))).quantize(Decimal('0.01'))
 
-        # Completed periods elapsed
-        periods_elapsed = (self.duration // period_len)
+        # Completed periods elapsed -> total premium due up to current_month
+        periods_elapsed = (duration // period_len)
+        total_premium_due = (contract_premium * Decimal(str(periods_elapsed))).quantize(Decimal('0.01'))
 
-        # Total premium due up to current_month
-        self.total_premium_due = (self.contract_premium * Decimal(str(periods_elapsed))).quantize(Decimal('0.01'))
+        return duration, contract_premium, total_premium_due
 
-       
 
-        # generate policy number
-  
-        if not self.contract_id:
-            last_contract = Policy.objects.order_by('-contract_id').first()
+    CONTRACT_SEQUENCE = "policies.contract_id"
 
-            if last_contract:
-                last_number = int(last_contract.contract_id[1:])  # remove 'P'
-                new_number = last_number + 1
-            else:
-                new_number = 1
+    @staticmethod
+    def _last_contract_number():
+        last_contract = (Policy.objects.order_by('-contract_id')
+                         .values_list('contract_id', flat=True).first())
+        return int(last_contract[1:]) if last_contract else 0  # remove 'P'
 
-            self.contract_id = f"P{new_number:05d}"  # A0001 format
+    @classmethod
+    def reserve_contract_ids(cls, count):
+        """Reserve `count` contract ids in one round trip (bulk imports)."""
+        numbers = allocate(cls.CONTRACT_SEQUENCE, count, seed=cls._last_contract_number)
+        return [f"P{n:05d}" for n in numbers]  # P00001 format
 
 
+    def apply_derived_fields(self):
+        """
+        Normalize dates and set the premium schedule and product code.
+        No database access, so bulk importers can prepare unsaved policies.
+        """
+        # Normalize dates to day 1
+        if self.start_date:
+            self.start_date = self._first_of_month(self.start_date)
 
-      #product code validations
+        cm = self.current_month or timezone.localdate()
+        self.current_month = self._first_of_month(cm)
+
+        self.duration, self.contract_premium, self.total_premium_due = self.premium_schedule(
+            self.start_date, self.current_month, self.cover, self.frequency
+        )
+
+        # product code validations
         if self.product_name == self.product_naming.AFFINITY:
             self.product_code = "200"
         elif self.product_name == self.product_naming.FUNERAL:
@@ -302,19 +476,87 @@ class Policy(models.Model):
         else:
             raise ValidationError("Invalid product selected")
 
-    
-
 
-           
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so a move to another paypoint/agent also invalidates the old one
+        instance._loaded_owners = (instance.__dict__.get("paypoint_id"),
+                                   instance.__dict__.get("agent_id"))
+        return instance
 
+    def save(self, *args, **kwargs):
+        self.apply_derived_fields()
 
+        # generate policy number
+        if not self.contract_id:
+            self.contract_id = self.reserve_contract_ids(1)[0]
 
         super().save(*args, **kwargs)
 
+        from .changes import notify_policies_changed, owner_scopes
+        notify_policies_changed([self.pk])
+
+        loaded = getattr(self, "_loaded_owners", None)
+        if loaded and loaded != (self.paypoint_id, self.agent_id):
+            from common.versions import bump
+            bump(owner_scopes([loaded[0]], [loaded[1]]))
+        self._loaded_owners = (self.paypoint_id, self.agent_id)
+
     def __str__(self):
         return self.contract_id
+
+
+class PolicySnapshot(models.Model):
+    """
+    Denormalized status and financials, one row per Policy.
+
+    Refreshed by `policies.changes.notify_policies_changed` whenever a
+    policy, receipt, claim or cancellation changes, so reports can filter
+    with a plain indexed WHERE. Rebuild with `manage.py rebuild_policy_snapshots`
+    and verify with `manage.py check_policy_snapshots`.
+    """
+    policy = models.OneToOneField(Policy, on_delete=models.CASCADE,
+                                  primary_key=True, related_name='snapshot')
+
+    duration = models.PositiveIntegerField(null=True)
+    total_premium_due = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    total_premium_received = models.DecimalField(max_digits=12, decimal_places=2,
+                                                 default=Decimal('0.00'))
+    total_premium_arrears = models.DecimalField(max_digits=12, decimal_places=2,
+                                                default=Decimal('0.00'))
+    months_paid = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    months_in_arrears = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    policy_status = models.CharField(max_length=30, db_index=True)
+    claim_status = models.CharField(max_length=20, db_index=True)
+    claim_effective_date = models.DateField(null=True, blank=True)
+    cancellation_status = models.CharField(max_length=20, db_index=True)
+    cancellation_effective_date = models.DateField(null=True, blank=True)
+    overall_policy_status = models.CharField(max_length=30, db_index=True)
+
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.policy_id} • {self.overall_policy_status}"
     
 
+class PolicyChange(models.Model):
+    """
+    Change journal: when each policy last changed (the policy itself, or
+    its receipts, claims or cancellation). Stamped by
+    `policies.changes.notify_policies_changed`, so incremental jobs (the
+    commission generator) can pick out the policies changed since their
+    last run. Changes that touch the whole book (the month roll) bump the
+    GLOBAL data version instead.
+    """
+    policy_id = models.PositiveBigIntegerField(primary_key=True)
+    changed_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.policy_id} @ {self.changed_at:%Y-%m-%d %H:%M:%S}"
+
+
 from django.conf import settings
 
 class Upload(models.Model):
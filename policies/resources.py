@@ -33,3 +33,8 @@ class PolicyResource(resources.ModelResource):
             'created_date',
         )
 
+
+    def get_queryset(self):
+        return (super().get_queryset()
+                .with_status()
+                .select_related('agent', 'paypoint', 'client'))
@@ -1,177 +1,302 @@
-import os
-import csv
-import openpyxl
-from django.core.exceptions import ObjectDoesNotExist
+import time
+from django.db import transaction
+from django.utils import timezone
 from .models import Policy
+from .changes import notify_policies_changed
+from .snapshots import refresh_snapshots_for
+from common import versions
+from common.names import normalize_name as _normalize
+from common.readers import batched, read_upload_rows
 from agents.models import Agent
 from paypoints.models import Paypoint
 from clients.models import Client
 
 
-def process_upload(upload):
+BATCH_SIZE = 1000   # rows parsed and policies inserted per transaction
+LOOKUP_CHUNK = 500  # values per IN (...) lookup
+
+COLUMNS = (
+    "product_name", "start_date", "proposal_sign_date", "beneficiary_name", "beneficiary_id",
+    ("agent_full_name", "agent"), ("paypoint_name", "paypoint"), ("client_full_name", "client"),
+    "frequency", "cover",
+)
+
+FREQUENCY_MAP = {
+    "monthly": "M",
+    "quarterly": "Q",
+    "half-yearly": "H",
+    "half yearly": "H",
+    "yearly": "Y",
+    "annual": "Y",
+}
+
+DUPLICATE_KEY_FIELDS = (
+    "product_name", "start_date", "proposal_sign_date", "beneficiary_id",
+    "agent_id", "paypoint_id", "client_id", "frequency", "cover",
+)
+
+
+def _split_full_name(full_name, label):
+    parts = str(full_name).strip().split()
+    if len(parts) < 2:
+        raise ValueError(f"{label} must have name and surname")
+    return _normalize(parts[0]), _normalize(" ".join(parts[1:]))
+
+
+class _NameIndex:
+    """In-memory lookup of normalized keys -> pk; keys seen twice are ambiguous."""
+
+    def __init__(self, pairs):
+        self._ids = {}
+        self._ambiguous = set()
+        for key, pk in pairs:
+            if key in self._ids:
+                self._ambiguous.add(key)
+            self._ids[key] = pk
+
+    def get(self, key, label, raw):
+        if key in self._ambiguous:
+            raise ValueError(f"{label} '{raw}' matches more than one record")
+        try:
+            return self._ids[key]
+        except KeyError:
+            raise ValueError(f"{label} '{raw}' not found")
+
+
+def _person_index(model, name_field, surname_field, surnames):
+    """
+    Index (name, surname) -> pk for the people whose surname appears in the
+    file, fetched with chunked IN queries on the stored `surname_key`, which
+    is normalized exactly as the file's names are.
+    """
+    surnames = sorted(surnames)
+    pairs = []
+    for start in range(0, len(surnames), LOOKUP_CHUNK):
+        chunk = surnames[start:start + LOOKUP_CHUNK]
+        rows = (model.objects
+                .filter(surname_key__in=chunk)
+                .values_list(name_field, surname_field, "pk"))
+        pairs.extend(((_normalize(name), _normalize(surname)), pk) for name, surname, pk in rows)
+    return _NameIndex(pairs)
+
+
+def _existing_duplicate_keys(start_dates):
+    """Duplicate-check keys of existing policies in the file's start date range."""
+    if not start_dates:
+        return set()
+    return set(
+        Policy.objects
+        .filter(start_date__range=(min(start_dates), max(start_dates)))
+        .values_list(*DUPLICATE_KEY_FIELDS)
+    )
+
+
+def _insert_batch(policies):
+    with transaction.atomic():
+        contract_ids = Policy.reserve_contract_ids(len(policies))
+        for policy, contract_id in zip(policies, contract_ids):
+            policy.contract_id = contract_id
+        created = Policy.objects.bulk_create(policies)
+
+        policy_ids = [p.pk for p in created]
+        if None in policy_ids:  # backends that don't return ids (MySQL)
+            policy_ids = Policy.objects.filter(contract_id__in=contract_ids).values_list("pk", flat=True)
+        notify_policies_changed(policy_ids)
+
+
+def _parse_row(row, date_field):
+    """Validate one file row without touching the database."""
+    if not row or len(row) < 10:
+        raise ValueError("Not enough columns")
+
+    (
+        product_name,
+        start_date,
+        proposal_sign_date,
+        beneficiary_name,
+        beneficiary_id,
+        agent_full_name,
+        paypoint_name,
+        client_full_name,
+        frequency,
+        cover,
+    ) = row[:10]
+
+    frequency_code = FREQUENCY_MAP.get(str(frequency).lower().strip())
+    if not frequency_code:
+        raise ValueError(f"Invalid frequency '{frequency}'")
+
+    cover = int(cover)
+    if cover not in [500, 1000, 2000]:
+        raise ValueError("Invalid cover amount")
+
+    start_date = date_field.to_python(start_date)
+    proposal_sign_date = date_field.to_python(proposal_sign_date)
+    if start_date is None or proposal_sign_date is None:
+        raise ValueError("Start date and proposal sign date are required")
+
+    raw = {"Agent": agent_full_name, "Paypoint": paypoint_name, "Client": client_full_name}
+    return raw, {
+        "product_name": str(product_name).upper(),
+        "start_date": Policy._first_of_month(start_date),
+        "proposal_sign_date": proposal_sign_date,
+        "beneficiary_name": beneficiary_name,
+        "beneficiary_id": str(beneficiary_id).strip() or None if beneficiary_id is not None else None,
+        "agent": _split_full_name(agent_full_name, "Agent"),
+        "paypoint": _normalize(paypoint_name),
+        "client": _split_full_name(client_full_name, "Client"),
+        "frequency": frequency_code,
+        "cover": cover,
+    }
+
+
+def process_upload(upload, progress=None):
     """
     Process an uploaded file (Excel or CSV) and create policies.
+
+    The file is streamed in batches of BATCH_SIZE rows. Agents and paypoints
+    are resolved through in-memory indexes loaded once per file, clients and
+    database duplicates with a few queries per batch, and each batch's
+    policies are bulk-inserted.
+    `progress(rows_done, rows_failed)` is called after each batch.
     Returns a list of errors per row.
     """
     errors = []
-    filename = upload.file.path
-    ext = os.path.splitext(filename)[1].lower()
+    rows = read_upload_rows(upload.file.path, COLUMNS)
+    date_field = Policy._meta.get_field("start_date")
 
+    agents = _NameIndex(
+        ((_normalize(name), _normalize(surname)), pk)
+        for name, surname, pk in Agent.objects.values_list("agent_name", "agent_surname", "pk")
+    )
+    paypoints = _NameIndex(
+        (_normalize(name), pk) for name, pk in Paypoint.objects.values_list("paypoint_name", "pk")
+    )
     seen = set()  # Track duplicates within the file
 
-    # -------------------------------------------------
-    # Read file
-    # -------------------------------------------------
-    if ext in ['.xlsx', '.xls']:
-        wb = openpyxl.load_workbook(filename)
-        ws = wb.active
-        rows = list(ws.iter_rows(min_row=2, values_only=True))
-    elif ext == '.csv':
-        with open(filename, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            rows = list(reader)[1:]
-    else:
-        raise ValueError("Unsupported file format. Use Excel or CSV.")
-
-    for i, row in enumerate(rows, start=2):
-        try:
-            if not row or len(row) < 10:
-                raise ValueError("Not enough columns")
-
-            (
-                product_name,
-                start_date,
-                proposal_sign_date,
-                beneficiary_name,
-                beneficiary_id,
-                agent_full_name,
-                paypoint_name,
-                client_full_name,
-                frequency,
-                cover,
-            ) = row[:10]
-
-            # =================================================
-            # AGENT (agent_name + agent_surname)
-            # =================================================
-            agent_parts = str(agent_full_name).strip().split()
-            if len(agent_parts) < 2:
-                raise ValueError("Agent must have name and surname")
-
-            agent_name = agent_parts[0]
-            agent_surname = " ".join(agent_parts[1:])
-
+    rows_done = 0
+    for batch in batched(rows, BATCH_SIZE):
+        # -------------------------------------------------
+        # Parse rows (no queries)
+        # -------------------------------------------------
+        parsed = []  # (row number, raw names, values dict)
+        for i, row in batch:
             try:
-                agent = Agent.objects.get(
-                    agent_name__iexact=agent_name,
-                    agent_surname__iexact=agent_surname
-                )
-            except ObjectDoesNotExist:
-                raise ValueError(f"Agent '{agent_full_name}' not found")
+                parsed.append((i, *_parse_row(row, date_field)))
+            except Exception as e:
+                errors.append((i, e))
+
+        clients = _person_index(Client, "client_name", "client_surname",
+                                {values["client"][1] for *_, values in parsed})
+        existing = _existing_duplicate_keys([values["start_date"] for *_, values in parsed])
 
-            # =================================================
-            # PAYPOINT (paypoint_name)
-            # =================================================
+        # -------------------------------------------------
+        # Resolve, de-duplicate and build policies
+        # -------------------------------------------------
+        pending = []  # (row number, unsaved Policy), file order
+        for i, raw, values in parsed:
             try:
-                paypoint = Paypoint.objects.get(
-                    paypoint_name__iexact=str(paypoint_name).strip()
-                )
-            except ObjectDoesNotExist:
-                raise ValueError(f"Paypoint '{paypoint_name}' not found")
+                agent_id = agents.get(values.pop("agent"), "Agent", raw["Agent"])
+                paypoint_id = paypoints.get(values.pop("paypoint"), "Paypoint", raw["Paypoint"])
+                client_id = clients.get(values.pop("client"), "Client", raw["Client"])
 
-            # =================================================
-            # CLIENT (client_name + client_surname)
-            # =================================================
-            client_parts = str(client_full_name).strip().split()
-            if len(client_parts) < 2:
-                raise ValueError("Client must have name and surname")
+                policy = Policy(agent_id=agent_id, paypoint_id=paypoint_id, client_id=client_id, **values)
+                policy.apply_derived_fields()
 
-            client_name = client_parts[0]
-            client_surname = " ".join(client_parts[1:])
+                key = tuple(getattr(policy, field) for field in DUPLICATE_KEY_FIELDS)
+                if key in seen:
+                    raise ValueError("Duplicate policy in file")
+                seen.add(key)
 
+                if key in existing:
+                    raise ValueError("Duplicate policy in database")
+
+                pending.append((i, policy))
+
+            except Exception as e:
+                errors.append((i, e))
+
+        # -------------------------------------------------
+        # CREATE POLICIES (bulk, contract ids reserved per batch)
+        # -------------------------------------------------
+        if pending:
             try:
-                client = Client.objects.get(
-                    client_name__iexact=client_name,
-                    client_surname__iexact=client_surname
+                _insert_batch([policy for _, policy in pending])
+            except Exception as e:
+                errors.extend((i, e) for i, _ in pending)
+
+        rows_done += len(batch)
+        if progress:
+            progress(rows_done, len(errors))
+
+    return [f"Row {i}: {e}" for i, e in sorted(errors, key=lambda err: err[0])]
+
+
+# -------------------------------------------------
+# Month roll
+# -------------------------------------------------
+def roll_policy_month(month=None, refresh_snapshots=True, on_chunk=None):
+    """
+    Advance current_month, duration, contract_premium and total_premium_due
+    for the whole book without calling Policy.save().
+
+    The schedule only depends on (start_date, frequency, cover), so each
+    distinct combination is rolled with one UPDATE. Policies already rolled
+    to `month` are excluded, which makes reruns for the same month no-ops.
+
+    A chunk is one start month; `on_chunk(start_date, groups, rows, seconds)`
+    is called after each. Returns {"month", "groups", "updated", "seconds"}.
+    """
+    month = Policy._first_of_month(month or timezone.localdate())
+    started = time.monotonic()
+
+    combos = (Policy.objects
+              .values_list("start_date", "frequency", "cover")
+              .distinct()
+              .order_by("start_date", "frequency", "cover"))
+
+    by_start = {}
+    for start_date, frequency, cover in combos:
+        by_start.setdefault(start_date, []).append((frequency, cover))
+
+    total_groups = total_updated = 0
+    for start_date, groups in by_start.items():
+        chunk_started = time.monotonic()
+        chunk_updated = 0
+
+        with transaction.atomic():
+            for frequency, cover in groups:
+                duration, contract_premium, total_due = Policy.premium_schedule(
+                    start_date, month, cover, frequency
+                )
+                group = Policy.objects.filter(start_date=start_date, frequency=frequency, cover=cover)
+                updated = group.exclude(
+                    current_month=month,
+                    duration=duration,
+                    contract_premium=contract_premium,
+                    total_premium_due=total_due,
+                ).update(
+                    current_month=month,
+                    duration=duration,
+                    contract_premium=contract_premium,
+                    total_premium_due=total_due,
                 )
-            except ObjectDoesNotExist:
-                raise ValueError(f"Client '{client_full_name}' not found")
-
-            # =================================================
-            # FREQUENCY
-            # =================================================
-            frequency_map = {
-                "monthly": "M",
-                "quarterly": "Q",
-                "half-yearly": "H",
-                "half yearly": "H",
-                "yearly": "Y",
-                "annual": "Y",
-            }
-
-            frequency = frequency_map.get(str(frequency).lower().strip())
-            if not frequency:
-                raise ValueError(f"Invalid frequency '{frequency}'")
-
-            # =================================================
-            # COVER
-            # =================================================
-            cover = int(cover)
-            if cover not in [500, 1000, 2000]:
-                raise ValueError("Invalid cover amount")
-
-            # =================================================
-            # DUPLICATE CHECK (file)
-            # =================================================
-            file_key = (
-                product_name,
-                start_date,
-                proposal_sign_date,
-                beneficiary_id,
-                agent.id,
-                paypoint.id,
-                client.id,
-                frequency,
-                cover,
-            )
-
-            if file_key in seen:
-                raise ValueError("Duplicate policy in file")
-            seen.add(file_key)
-
-            # =================================================
-            # DUPLICATE CHECK (database)
-            # =================================================
-            if Policy.objects.filter(
-                product_name=str(product_name).upper(),
-                start_date=start_date,
-                proposal_sign_date=proposal_sign_date,
-                beneficiary_id=beneficiary_id,
-                agent=agent,
-                paypoint=paypoint,
-                client=client,
-                frequency=frequency,
-                cover=cover,
-            ).exists():
-                raise ValueError("Duplicate policy in database")
-
-            # =================================================
-            # CREATE POLICY
-            # =================================================
-            Policy.objects.create(
-                product_name=str(product_name).upper(),
-                start_date=start_date,
-                proposal_sign_date=proposal_sign_date,
-                beneficiary_name=beneficiary_name,
-                beneficiary_id=beneficiary_id,
-                agent=agent,
-                paypoint=paypoint,
-                client=client,
-                frequency=frequency,
-                cover=cover,
-            )
-
-        except Exception as e:
-            errors.append(f"Row {i}: {e}")
-
-    return errors
+                if updated and refresh_snapshots:
+                    refresh_snapshots_for(group)
+                chunk_updated += updated
+
+        total_groups += len(groups)
+        total_updated += chunk_updated
+        if on_chunk:
+            on_chunk(start_date, len(groups), chunk_updated, time.monotonic() - chunk_started)
+
+    if total_updated:
+        # every statement's figures may have moved
+        versions.bump([versions.GLOBAL])
+
+    return {
+        "month": month,
+        "groups": total_groups,
+        "updated": total_updated,
+        "seconds": time.monotonic() - started,
+    }
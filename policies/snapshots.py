@@ -0,0 +1,110 @@
+# policies/snapshots.py
+from django.utils import timezone
+
+from .models import Policy, PolicySnapshot
+
+# snapshot field -> value selected from Policy.objects.with_status()
+SNAPSHOT_SOURCES = {
+    "duration": "duration",
+    "total_premium_due": "total_premium_due",
+    "total_premium_received": "total_premium_received",
+    "total_premium_arrears": "annotated_total_premium_arrears",
+    "months_paid": "annotated_months_paid",
+    "months_in_arrears": "annotated_months_in_arrears",
+    "policy_status": "annotated_policy_status",
+    "claim_status": "annotated_claim_status",
+    "claim_effective_date": "annotated_claim_effective_date",
+    "cancellation_status": "annotated_cancellation_status",
+    "cancellation_effective_date": "annotated_cancellation_effective_date",
+    "overall_policy_status": "annotated_overall_policy_status",
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def _live_values(queryset):
+    """Yield (policy_id, {snapshot_field: value}) computed in SQL."""
+    sources = list(SNAPSHOT_SOURCES.values())
+    rows = queryset.with_status().order_by().values_list("pk", *sources)
+    for pk, *values in rows:
+        yield pk, dict(zip(SNAPSHOT_SOURCES, values))
+
+
+def _upsert(queryset):
+    """Recompute and upsert the snapshots of `queryset` (one SELECT + one INSERT)."""
+    now = timezone.now()
+    snapshots = [
+        PolicySnapshot(policy_id=pk, refreshed_at=now, **values)
+        for pk, values in _live_values(queryset)
+    ]
+    if snapshots:
+        PolicySnapshot.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=["policy"],
+            update_fields=[*SNAPSHOT_SOURCES, "refreshed_at"],
+        )
+    return len(snapshots)
+
+
+def _id_chunks(chunk_size, queryset=None):
+    queryset = Policy.objects.all() if queryset is None else queryset
+    ids = queryset.order_by("pk").values_list("pk", flat=True)
+    chunk = []
+    for pk in ids.iterator(chunk_size=chunk_size):
+        chunk.append(pk)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def refresh_policy_snapshots(policy_ids):
+    """Recompute the snapshot rows of the given policies (one query + one upsert)."""
+    return _upsert(Policy.objects.filter(pk__in=list(policy_ids)))
+
+
+def refresh_snapshots_for(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Recompute the snapshots of every policy in `queryset`, chunk by chunk."""
+    return sum(refresh_policy_snapshots(chunk) for chunk in _id_chunks(chunk_size, queryset))
+
+
+def rebuild_policy_snapshots(chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None):
+    """
+    Recompute every snapshot row in chunks of `chunk_size` policies.
+    `on_chunk(done)` is called after each chunk. Returns the number of rows written.
+    """
+    done = 0
+    for chunk in _id_chunks(chunk_size):
+        done += refresh_policy_snapshots(chunk)
+        if on_chunk:
+            on_chunk(done)
+    # policies are never hard-deleted while protected rows exist, but keep the table exact
+    PolicySnapshot.objects.exclude(policy__in=Policy.objects.all()).delete()
+    return done
+
+
+def diff_policy_snapshots(chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Compare stored snapshots with the live computation.
+    Returns a list of (policy_id, field, stored, live); a missing snapshot is
+    reported with field "<missing>".
+    """
+    differences = []
+    fields = list(SNAPSHOT_SOURCES)
+    for chunk in _id_chunks(chunk_size):
+        stored = {
+            pk: dict(zip(fields, values))
+            for pk, *values in PolicySnapshot.objects.filter(policy_id__in=chunk)
+            .values_list("policy_id", *fields)
+        }
+        for pk, live in _live_values(Policy.objects.filter(pk__in=chunk)):
+            snap = stored.get(pk)
+            if snap is None:
+                differences.append((pk, "<missing>", None, None))
+                continue
+            for field in fields:
+                if snap[field] != live[field]:
+                    differences.append((pk, field, snap[field], live[field]))
+    return differences
@@ -51,3 +51,231 @@ class PolicyModelTest(TestCase):
 
     def test_string_representation(self):
         self.assertTrue(str(self.policy))
+
+
+class PolicyStatusFixtures:
+    """One policy per lifecycle / claim / cancellation outcome."""
+
+    def setUp(self):
+        from datetime import date
+        from claims.models import Claim, ClaimStatus
+        from cancellations.models import CancellationRequest, CancellationStatus
+
+        self.user = Administrator.objects.create_user(email="status@test.com", password="pass123")
+        agent = Agent.objects.create(agent_name="Tendai", agent_surname="Moyo",
+                                     branch="HARARE", date_joining=date(2020, 1, 1))
+        paypoint = Paypoint.objects.create(paypoint_code="ppsmain", paypoint_name="Main",
+                                           date_joined=date(2020, 1, 1))
+
+        def make_policy(n, received, start=date(2024, 1, 1)):
+            client = Client.objects.create(
+                client_name=f"Client{n}", client_surname="Test", id_number=f"12-12345{n}A12",
+                dob=date(1990, 1, 1), email=f"client{n}@test.com", phone_number="0771234567",
+            )
+            policy = Policy.objects.create(
+                product_name="FUNERAL", proposal_sign_date=date(2023, 12, 1), start_date=start,
+                agent=agent, paypoint=paypoint, client=client, frequency="M", cover=1000,
+                current_month=date(2024, 7, 1),
+            )
+            Policy.objects.filter(pk=policy.pk).update(total_premium_received=Decimal(received))
+            return policy
+
+        self.active = make_policy(1, "5.00")
+        self.lapsed = make_policy(2, "1.00")
+        self.unpaid = make_policy(3, "0.00")
+        self.ntu = make_policy(4, "0.50")
+        self.dead = make_policy(5, "6.00")
+        self.cancelled = make_policy(6, "6.00")
+        self.pending_cancel = make_policy(7, "6.00")
+
+        Claim.objects.create(policy=self.dead, account_number="1", claim_form="c.png",
+                             status=ClaimStatus.APPROVED)
+        CancellationRequest.objects.create(policy=self.cancelled, requested_by=self.user,
+                                           effective_date=date(2024, 8, 1),
+                                           status=CancellationStatus.APPROVED)
+        CancellationRequest.objects.create(policy=self.pending_cancel, requested_by=self.user,
+                                           effective_date=date(2024, 8, 1))
+
+
+
+class PolicyStatusAnnotationTest(PolicyStatusFixtures, TestCase):
+    """`Policy.objects.with_status()` must agree with the Python properties."""
+
+    def test_annotations_match_properties(self):
+        fields = ["months_paid", "months_in_arrears", "policy_status", "claim_status",
+                  "claim_effective_date", "cancellation_status", "cancellation_effective_date",
+                  "total_premium_arrears", "overall_policy_status"]
+        annotated = {p.pk: p for p in Policy.objects.with_status()}
+        for plain in Policy.objects.all():
+            for field in fields:
+                self.assertEqual(getattr(annotated[plain.pk], field), getattr(plain, field),
+                                 f"{plain.contract_id}.{field}")
+
+    def test_half_cent_ratios_round_alike(self):
+        # 1.99 / 2 = 0.995 months paid, 4.01 / 2 = 2.005 months in arrears
+        Policy.objects.filter(pk=self.active.pk).update(
+            contract_premium=Decimal("2.00"), total_premium_due=Decimal("6.00"),
+            total_premium_received=Decimal("1.99"))
+        plain = Policy.objects.get(pk=self.active.pk)
+        annotated = Policy.objects.with_status().get(pk=self.active.pk)
+        for policy in (plain, annotated):
+            self.assertEqual(policy.months_paid, Decimal("1.00"))
+            self.assertEqual(policy.months_in_arrears, Decimal("2.01"))
+            self.assertEqual(policy.policy_status, "Policy Lapsed")
+
+    def test_claim_date_is_local(self):
+        from datetime import date, datetime, timezone as dt_timezone
+
+        self.dead.claims.update(approved_at=datetime(2024, 7, 31, 23, 30, tzinfo=dt_timezone.utc))
+        with timezone.override("Africa/Harare"):
+            plain = Policy.objects.get(pk=self.dead.pk)
+            annotated = Policy.objects.with_status().get(pk=self.dead.pk)
+            self.assertEqual(plain.claim_effective_date, date(2024, 8, 1))
+            self.assertEqual(annotated.claim_effective_date, date(2024, 8, 1))
+
+    def test_filter_by_overall_status(self):
+        statuses = dict(Policy.objects.with_status()
+                        .values_list("contract_id", "annotated_overall_policy_status"))
+        self.assertEqual(statuses[self.active.contract_id], "Active")
+        self.assertEqual(statuses[self.lapsed.contract_id], "Policy Lapsed")
+        self.assertEqual(statuses[self.unpaid.contract_id], "Policy Accepted")
+        self.assertEqual(statuses[self.ntu.contract_id], "NTU Non Payment")
+        self.assertEqual(statuses[self.dead.contract_id], "Death")
+        self.assertEqual(statuses[self.cancelled.contract_id], "Cancelled")
+        self.assertEqual(
+            Policy.objects.with_status().filter(annotated_overall_policy_status="Death").count(), 1
+        )
+
+
+class PolicySnapshotTest(PolicyStatusFixtures, TestCase):
+    """Snapshots follow receipts, claims and cancellations without a rebuild."""
+
+    def test_snapshot_refreshed_by_receipts_and_claims(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from claims.models import Claim
+        from policies.models import PolicySnapshot
+        from policies.snapshots import diff_policy_snapshots
+        from receipts.models import PremiumReceipt
+
+        # the fixture writes totals with .update(), so start from a rebuild
+        call_command("rebuild_policy_snapshots", stdout=StringIO())
+        self.assertEqual(diff_policy_snapshots(), [])
+
+        PremiumReceipt.objects.create(policy=self.unpaid, amount_received=Decimal("6.00"))
+        self.assertEqual(PolicySnapshot.objects.get(policy=self.unpaid).overall_policy_status, "Active")
+
+        claim = Claim.objects.create(policy=self.active, account_number="2", claim_form="c.png")
+        self.assertEqual(PolicySnapshot.objects.get(policy=self.active).claim_status, "Pending")
+        claim.approve(approver=self.user)
+        self.assertEqual(PolicySnapshot.objects.get(policy=self.active).overall_policy_status, "Death")
+
+        self.assertEqual(diff_policy_snapshots(), [])
+        call_command("check_policy_snapshots", stdout=StringIO())
+
+    def test_migration_fills_existing_policies(self):
+        from importlib import import_module
+        from django.apps import apps
+        from policies.models import PolicySnapshot
+        from policies.snapshots import diff_policy_snapshots
+
+        PolicySnapshot.objects.all().delete()  # a database upgraded past 0007
+        migration = import_module("policies.migrations.0009_fill_policy_snapshots")
+        migration.fill_policy_snapshots(apps, None)
+
+        self.assertEqual(PolicySnapshot.objects.count(), Policy.objects.count())
+        self.assertEqual(diff_policy_snapshots(), [])
+
+
+class RollPolicyMonthTest(PolicyStatusFixtures, TestCase):
+
+    def test_roll_matches_save_and_is_idempotent(self):
+        from datetime import date
+        from policies.models import PolicySnapshot
+        from policies.services import roll_policy_month
+
+        result = roll_policy_month(date(2024, 10, 15))
+        self.assertEqual(result["updated"], Policy.objects.count())
+
+        for policy in Policy.objects.all():
+            self.assertEqual(policy.current_month, date(2024, 10, 1))
+            self.assertEqual(policy.duration, 9)
+            self.assertEqual(policy.total_premium_due, Decimal("9.00"))
+        self.assertEqual(PolicySnapshot.objects.get(policy=self.active).duration, 9)
+
+        self.assertEqual(roll_policy_month(date(2024, 10, 1))["updated"], 0)
+
+
+class PolicyBulkImportTest(PolicyStatusFixtures, TestCase):
+
+    def _upload(self, rows):
+        import os
+        import tempfile
+        from types import SimpleNamespace
+
+        header = ("product_name,start_date,proposal_sign_date,beneficiary_name,beneficiary_id,"
+                  "agent_full_name,paypoint_name,client_full_name,frequency,cover\n")
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as f:
+            f.write(header + "".join(rows))
+        self.addCleanup(os.remove, path)
+        return SimpleNamespace(file=SimpleNamespace(path=path))
+
+    def test_import_resolves_names_and_flags_duplicates(self):
+        from policies.models import PolicySnapshot
+        from policies.services import process_upload
+
+        before = Policy.objects.count()
+        errors = process_upload(self._upload([
+            "funeral,2024-03-15,2024-02-01,Jane,,  tendai  MOYO ,main,client1 test,Monthly,500\n",
+            "funeral,2024-03-15,2024-02-01,Jane,,  tendai  MOYO ,main,client1 test,Monthly,500\n",
+            "FUNERAL,2024-01-01,2023-12-01,,,Tendai Moyo,Main,Client2 Test,monthly,1000\n",
+            "FUNERAL,2024-01-01,2023-12-01,,,Nobody Here,Main,Client3 Test,monthly,1000\n",
+            "FUNERAL,2024-01-01,2023-12-01,,,Tendai Moyo,Main,Client3 Test,weekly,1000\n",
+        ]))
+
+        self.assertEqual(errors, [
+            "Row 3: Duplicate policy in file",
+            "Row 4: Duplicate policy in database",
+            "Row 5: Agent 'Nobody Here' not found",
+            "Row 6: Invalid frequency 'weekly'",
+        ])
+        self.assertEqual(Policy.objects.count(), before + 1)
+
+        policy = Policy.objects.latest("pk")
+        self.assertEqual(policy.client, Client.objects.get(client_name="Client1"))
+        self.assertEqual(policy.start_date.day, 1)
+        self.assertTrue(policy.contract_id)
+        self.assertEqual(policy.product_code, Policy.objects.get(pk=self.active.pk).product_code)
+        self.assertTrue(PolicySnapshot.objects.filter(policy=policy).exists())
+
+    def test_import_matches_mixed_case_surnames(self):
+        from policies.services import process_upload
+
+        client = Client.objects.get(client_name="Client1")
+        client.client_surname = "van  der MERWE"
+        client.save()
+
+        errors = process_upload(self._upload([
+            "FUNERAL,2024-05-01,2024-04-01,,,Tendai Moyo,Main,client1 VAN DER Merwe,monthly,500\n",
+        ]))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Policy.objects.latest("pk").client, client)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from policies.services import process_upload
+
+        def run(cover_offset, rows):
+            upload = self._upload(
+                f"FUNERAL,2025-{month:02d}-01,2024-12-01,,{cover_offset}{month},"
+                f"Tendai Moyo,Main,Client{1 + month % 7} Test,monthly,500\n"
+                for month in range(1, rows + 1)
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(process_upload(upload), [])
+            return len(ctx.captured_queries)
+
+        self.assertEqual(run("a", 3), run("b", 12))
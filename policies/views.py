@@ -135,7 +135,8 @@ class PolicyExportCSVAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        queryset = Policy.objects.all()
+        queryset = (Policy.objects.with_status()
+                    .select_related("agent", "paypoint", "client"))
 
         # Optional filters
         agent = request.GET.get("agent")
@@ -192,7 +193,8 @@ class PolicyExportExcelAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        queryset = Policy.objects.all()
+        queryset = (Policy.objects.with_status()
+                    .select_related("agent", "paypoint", "client"))
 
         # Optional filters
         agent = request.GET.get("agent")
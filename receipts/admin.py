@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import PremiumReceipt, Upload
 from django.utils import timezone
-from .services import process_upload
+from common.jobs import enqueue
 from import_export.admin import ExportMixin
 from .resources import PremiumReceiptResource
 
@@ -52,16 +52,17 @@ class UploadAdmin(admin.ModelAdmin):
             upload.approved_at = timezone.now()
             upload.save()
 
-            errors = process_upload(upload)
+            job = enqueue("receipts.upload", upload.pk)
 
-            if errors:
+            # only reached with JOBS_RUN_INLINE; otherwise a worker picks it up
+            if job.errors:
                 self.message_user(
                     request,
-                    f"Upload {upload.id} imported with errors:\n" + "\n".join(errors),
+                    f"Upload {upload.id} imported with errors:\n" + "\n".join(job.errors),
                     level="warning"
                 )
 
-        self.message_user(request, "Uploads approved and processed.")
+        self.message_user(request, "Uploads approved and queued for processing.")
 
     @admin.action(description="Reject selected uploads")
     def reject_uploads(self, request, queryset):
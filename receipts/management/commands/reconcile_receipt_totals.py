@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from receipts.services import fix_receipt_totals, receipt_total_mismatches
+
+
+class Command(BaseCommand):
+    help = "Verify Policy.total_premium_received against the SUM of each policy's receipts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true",
+                            help="Overwrite mismatched totals with the receipted SUM.")
+
+    def handle(self, *args, **options):
+        mismatches = receipt_total_mismatches()
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("All policy receipt totals reconcile."))
+            return
+
+        for _, contract_id, stored, receipted in mismatches:
+            self.stdout.write(f"{contract_id}: stored={stored} receipted={receipted}")
+
+        if options["fix"]:
+            with transaction.atomic():
+                fixed = fix_receipt_totals(mismatches)
+            self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} policy totals."))
+            return
+
+        raise CommandError(f"{len(mismatches)} policies do not reconcile.")
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0007_policysnapshot'),
+        ('receipts', '0007_upload'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='premiumreceipt',
+            index=models.Index(fields=['date_received'], name='receipts_pr_date_re_112e3d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumreceipt',
+            index=models.Index(fields=['policy', 'date_received'], name='receipts_pr_policy__151f3e_idx'),
+        ),
+    ]
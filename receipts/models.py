@@ -4,8 +4,10 @@ from django.db import models, transaction
 from django.utils import timezone
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
+from django.db.models import F
 from policies.models import Policy
+from policies.changes import notify_policies_changed
+from common.sequences import allocate
 from access.models import Administrator
 from django.conf import settings
 from auditlog.registry import auditlog
@@ -24,50 +26,124 @@ class PremiumReceipt(models.Model):
     total_received = models.DecimalField(max_digits=10, decimal_places=2,
                                          default=Decimal('0.00'), editable=False)
 
+    class Meta:
+        # month range scans (reconciliation) and per-policy receipt lookups
+        indexes = [models.Index(fields=['date_received']),
+                   models.Index(fields=['policy', 'date_received'])]
+
+    NUMBER_SEQUENCE = "receipts.receipt_number"
+
+    @staticmethod
+    def _last_receipt_number():
+        last_receipt = (PremiumReceipt.objects.order_by('-receipt_number')
+                        .values_list('receipt_number', flat=True).first())
+        return int(last_receipt.replace('Rec', '')) if last_receipt else 0
+
+    @classmethod
+    def reserve_receipt_numbers(cls, count):
+        """Reserve `count` receipt numbers in one round trip (bulk imports)."""
+        numbers = allocate(cls.NUMBER_SEQUENCE, count, seed=cls._last_receipt_number)
+        return [f"Rec{n:06d}" for n in numbers]
+
+    @staticmethod
+    def _lock_policy_total(policy_id):
+        """Lock the policy row and return its running total (serializes receipting per policy)."""
+        return (Policy.objects.select_for_update()
+                .values_list('total_premium_received', flat=True)
+                .get(pk=policy_id)) or Decimal('0.00')
+
+    def _lock_previous(self):
+        """
+        Lock the policies this save touches (the one the receipt is stored
+        on and the one it is saved to), then read the stored receipt under
+        lock, so a concurrent edit cannot change it in between. Returns its
+        policy_id, amount_received and total_received; None for a new receipt.
+        """
+        locked = set()
+        while True:
+            stored = (PremiumReceipt.objects.filter(pk=self.pk)
+                      .values_list('policy_id', flat=True).first())
+            if stored is None:
+                return None
+            for policy_id in sorted({stored, self.policy_id} - locked):
+                self._lock_policy_total(policy_id)
+                locked.add(policy_id)
+            previous = (PremiumReceipt.objects.select_for_update()
+                        .filter(pk=self.pk)
+                        .values('policy_id', 'amount_received', 'total_received')
+                        .first())
+            # moved to another policy before we got the lock: lock that one too
+            if previous is None or previous['policy_id'] in locked:
+                return previous
+
+    @staticmethod
+    def _shift_policy_total(policy_id, delta, after_receipt_id=None):
+        """
+        Add `delta` to the policy total, and to the running totals of receipts
+        captured after `after_receipt_id` (only needed on edits and deletes).
+        """
+        if not delta:
+            return
+        Policy.objects.filter(pk=policy_id).update(
+            total_premium_received=F('total_premium_received') + delta
+        )
+        if after_receipt_id is not None:
+            PremiumReceipt.objects.filter(policy_id=policy_id, pk__gt=after_receipt_id).update(
+                total_received=F('total_received') + delta
+            )
+
     def save(self, *args, **kwargs):
         with transaction.atomic():
 
             # 🔹 AUTO-GENERATE RECEIPT NUMBER
             if not self.receipt_number:
-                last_receipt = PremiumReceipt.objects.order_by('-receipt_number').first()
-                if last_receipt:
-                    last_number = int(last_receipt.receipt_number.replace('Rec', ''))
-                    new_number = last_number + 1
-                else:
-                    new_number = 1
-
-                self.receipt_number = f"Rec{new_number:06d}"
-
-            # compute cumulative BEFORE insert so NOT NULL is satisfied
-            prev_total = (
-                PremiumReceipt.objects
-                .filter(policy_id=self.policy_id)
-                .aggregate(total=Sum('amount_received'))['total']
-                or Decimal('0.00')
-            )
-
-            self.total_received = prev_total + (self.amount_received or Decimal('0.00'))
-
-            # insert/update this receipt
-            super().save(*args, **kwargs)
-
-            # update policy running total WITHOUT invoking Policy.save()
-            Policy.objects.filter(pk=self.policy_id).update(
-                total_premium_received=self.total_received
-            )
+                self.receipt_number = self.reserve_receipt_numbers(1)[0]
+
+            amount = self.amount_received or Decimal('0.00')
+            previous = None if self._state.adding else self._lock_previous()
+
+            if previous is None:
+                # new receipt: running total = locked policy total + this amount
+                self.total_received = self._lock_policy_total(self.policy_id) + amount
+                super().save(*args, **kwargs)
+                self._shift_policy_total(self.policy_id, amount)
+                changed = [self.policy_id]
+
+            elif previous['policy_id'] == self.policy_id:
+                # edit: adjust by the difference only
+                delta = amount - previous['amount_received']
+                self.total_received = previous['total_received'] + delta
+                super().save(*args, **kwargs)
+                self._shift_policy_total(self.policy_id, delta, after_receipt_id=self.pk)
+                changed = [self.policy_id]
+
+            else:
+                # moved to another policy: take it off the old one, append to the new one
+                old_policy_id = previous['policy_id']
+                self._shift_policy_total(old_policy_id, -previous['amount_received'],
+                                         after_receipt_id=self.pk)
+                self.total_received = (Policy.objects.values_list('total_premium_received', flat=True)
+                                       .get(pk=self.policy_id)) + amount
+                super().save(*args, **kwargs)
+                self._shift_policy_total(self.policy_id, amount)
+                changed = [old_policy_id, self.policy_id]
+
+            notify_policies_changed(changed)
     
 
 
     def delete(self, *args, **kwargs):
         policy_id = self.policy_id
         with transaction.atomic():
-            super().delete(*args, **kwargs)
-            new_total = (PremiumReceipt.objects
-                         .filter(policy_id=policy_id)
-                         .aggregate(total=Sum('amount_received'))['total'] or Decimal('0.00'))
-            Policy.objects.filter(pk=policy_id).update(
-                total_premium_received=new_total
-            )
+            self._lock_policy_total(policy_id)
+            amount = (PremiumReceipt.objects.filter(pk=self.pk)
+                      .values_list('amount_received', flat=True).first())
+            receipt_id = self.pk
+            result = super().delete(*args, **kwargs)
+            if amount is not None:
+                self._shift_policy_total(policy_id, -amount, after_receipt_id=receipt_id)
+            notify_policies_changed([policy_id])
+        return result
 
     def __str__(self):
         return f"{self.receipt_number} • {self.total_received}"
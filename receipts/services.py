@@ -1,48 +1,171 @@
 from decimal import Decimal
-from django.core.exceptions import ObjectDoesNotExist
-import os
-import csv
-import openpyxl
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
 from .models import PremiumReceipt
 from policies.models import Policy
+from policies.changes import notify_policies_changed
+from common.readers import batched, read_upload_rows
 
-def process_upload(upload):
+BATCH_SIZE = 2000   # receipts inserted per transaction
+LOOKUP_CHUNK = 500  # contract ids per IN (...) lookup
+
+COLUMNS = (("contract_id", "policy_code"), ("amount_received", "amount"))
+
+
+def _resolve_contract_ids(contract_ids):
+    """Map upper-cased contract_id -> policy pk with a few chunked IN queries."""
+    contract_ids = sorted(contract_ids)
+    resolved = {}
+    for start in range(0, len(contract_ids), LOOKUP_CHUNK):
+        chunk = contract_ids[start:start + LOOKUP_CHUNK]
+        resolved.update(
+            (contract_id.upper(), pk)
+            for contract_id, pk in Policy.objects.filter(contract_id__in=chunk)
+            .values_list('contract_id', 'pk')
+        )
+    return resolved
+
+
+def _insert_batch(batch, numbers=None):
+    """
+    Insert one batch of (row number, policy_id, amount) in file order:
+    lock the batch's policies, compute each receipt's running total in
+    memory, bulk_create the receipts and apply one UPDATE per policy.
+    Receipt numbers are reserved here unless `numbers` are given.
+    """
+    policy_ids = {policy_id for _, policy_id, _ in batch}
+
+    with transaction.atomic():
+        running = dict(
+            Policy.objects.select_for_update()
+            .filter(pk__in=policy_ids)
+            .order_by('pk')
+            .values_list('pk', 'total_premium_received')
+        )
+        opening = dict(running)
+
+        numbers = numbers or PremiumReceipt.reserve_receipt_numbers(len(batch))
+        receipts = []
+        for (_, policy_id, amount), number in zip(batch, numbers):
+            running[policy_id] = (running[policy_id] or Decimal('0.00')) + amount
+            receipts.append(PremiumReceipt(
+                policy_id=policy_id,
+                receipt_number=number,
+                amount_received=amount,
+                total_received=running[policy_id],
+            ))
+        PremiumReceipt.objects.bulk_create(receipts)
+
+        for policy_id in policy_ids:
+            delta = running[policy_id] - (opening[policy_id] or Decimal('0.00'))
+            Policy.objects.filter(pk=policy_id).update(
+                total_premium_received=F('total_premium_received') + delta
+            )
+
+        notify_policies_changed(policy_ids)
+
+
+def _insert_rows(batch):
+    """
+    Insert a batch row by row, each in its own savepoint, after the batch
+    failed as a whole. Returns (row number, error) for the rows that fail.
+    Numbers are reserved up front, outside the savepoints, so a row that
+    fails on its receipt number does not hand the same number to the next.
+    """
     errors = []
-    filename = upload.file.path
-    ext = os.path.splitext(filename)[1].lower()
-
-    # Read file
-    if ext in ['.xlsx', '.xls']:
-        wb = openpyxl.load_workbook(filename)
-        ws = wb.active
-        rows = list(ws.iter_rows(min_row=2, values_only=True))
-    elif ext == '.csv':
-        with open(filename, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            rows = list(reader)[1:]
-    else:
-        raise ValueError("Unsupported file format. Use Excel or CSV.")
-
-    for i, row in enumerate(rows, start=2):
+    numbers = PremiumReceipt.reserve_receipt_numbers(len(batch))
+    for row, number in zip(batch, numbers):
         try:
-            if not row or len(row) < 2:
-                raise ValueError("Not enough columns")
+            _insert_batch([row], numbers=[number])
+        except Exception as e:
+            errors.append((row[0], e))
+    return errors
+
+
+def process_upload(upload, progress=None):
+    """
+    Import premium receipts (contract_id, amount) from an Excel or CSV file.
 
-            policy_code, amount_received = row[:2]
+    Rows are streamed in batches of BATCH_SIZE: contract ids are resolved
+    in bulk, receipts are bulk-inserted with pre-allocated numbers, and each
+    policy's running total is updated once per batch. A batch that hits an
+    IntegrityError is retried row by row, so only the offending rows fail.
+    `progress(rows_done, rows_failed)` is called after each batch.
+    Returns a list of errors per row.
+    """
+    errors = []
+    amount_field = PremiumReceipt._meta.get_field('amount_received')
+
+    rows_done = 0
+    for batch in batched(read_upload_rows(upload.file.path, COLUMNS), BATCH_SIZE):
+        parsed = []  # (row number, contract_id, amount)
 
-            # Find the existing policy
+        for i, row in batch:
             try:
-                policy = Policy.objects.get(contract_id__iexact=str(policy_code).strip())
-            except ObjectDoesNotExist:
-                raise ValueError(f"Policy '{policy_code}' not found")
-
-            # Create PremiumReceipt
-            PremiumReceipt.objects.create(
-                policy=policy,
-                amount_received=Decimal(amount_received),
-            )
+                if not row or len(row) < 2:
+                    raise ValueError("Not enough columns")
 
-        except Exception as e:
-            errors.append(f"Row {i}: {e}")
+                policy_code, amount_received = row[:2]
+                try:
+                    amount = amount_field.clean(amount_received, None)
+                except ValidationError as e:
+                    raise ValueError("; ".join(e.messages))
 
-    return errors
+                parsed.append((i, str(policy_code).strip().upper(), amount))
+
+            except Exception as e:
+                errors.append((i, e))
+
+        # Find the existing policies in bulk
+        policies = _resolve_contract_ids({contract_id for _, contract_id, _ in parsed})
+
+        pending = []  # (row number, policy_id, amount), file order
+        for i, contract_id, amount in parsed:
+            if contract_id not in policies:
+                errors.append((i, ValueError(f"Policy '{contract_id}' not found")))
+                continue
+            pending.append((i, policies[contract_id], amount))
+
+        if pending:
+            try:
+                _insert_batch(pending)
+            except IntegrityError:
+                errors.extend(_insert_rows(pending))
+            except Exception as e:
+                errors.extend((i, e) for i, _, _ in pending)
+
+        rows_done += len(batch)
+        if progress:
+            progress(rows_done, len(errors))
+
+    return [f"Row {i}: {e}" for i, e in sorted(errors, key=lambda err: err[0])]
+
+
+# -------------------------------------------------
+# Running-total reconciliation
+# -------------------------------------------------
+def receipt_total_mismatches():
+    """
+    Policies whose running `total_premium_received` differs from the full
+    SUM of their receipts, as (policy_id, contract_id, stored, receipted)
+    tuples. One grouped query over the receipts table.
+    """
+    money = DecimalField(max_digits=12, decimal_places=2)
+    return list(
+        Policy.objects
+        .annotate(receipted=Coalesce(Sum('receipts__amount_received'), Value(Decimal('0.00')),
+                                     output_field=money))
+        .exclude(total_premium_received=F('receipted'))
+        .order_by('contract_id')
+        .values_list('pk', 'contract_id', 'total_premium_received', 'receipted')
+    )
+
+
+def fix_receipt_totals(mismatches):
+    """Overwrite the stored totals reported by `receipt_total_mismatches()`."""
+    for policy_id, _, _, receipted in mismatches:
+        Policy.objects.filter(pk=policy_id).update(total_premium_received=receipted)
+    notify_policies_changed([policy_id for policy_id, *_ in mismatches])
+    return len(mismatches)
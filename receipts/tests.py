@@ -67,3 +67,139 @@ class ReceiptAggregationTest(TestCase):
         self.policy.refresh_from_db()
         self.assertEqual(self.policy.total_received, Decimal("350.00"))
 
+
+
+class ReceiptFixtures:
+    """A single monthly policy to receipt against."""
+
+    def setUp(self):
+        from datetime import date
+        agent = Agent.objects.create(agent_name="Rudo", agent_surname="Ncube",
+                                     branch="BULAWAYO", date_joining=date(2020, 1, 1))
+        paypoint = Paypoint.objects.create(paypoint_code="ppsrail", paypoint_name="Rail",
+                                           date_joined=date(2020, 1, 1))
+        client = Client.objects.create(client_name="Jane", client_surname="Doe",
+                                       id_number="63-999999Z63", dob=date(1990, 1, 1),
+                                       email="jane@test.com", phone_number="0771234567")
+        self.policy = Policy.objects.create(
+            product_name="FUNERAL", proposal_sign_date=date(2023, 12, 1),
+            start_date=date(2024, 1, 1), agent=agent, paypoint=paypoint, client=client,
+            frequency="M", cover=1000,
+        )
+
+    def _policy_total(self):
+        self.policy.refresh_from_db()
+        return self.policy.total_premium_received
+
+
+class ReceiptRunningTotalTest(ReceiptFixtures, TestCase):
+    """Running totals are maintained by deltas and reconcile with the full SUM."""
+
+    def test_create_edit_delete(self):
+        first = PremiumReceipt.objects.create(policy=self.policy, amount_received=Decimal("2.00"))
+        second = PremiumReceipt.objects.create(policy=self.policy, amount_received=Decimal("3.00"))
+        self.assertEqual(second.total_received, Decimal("5.00"))
+        self.assertEqual(self._policy_total(), Decimal("5.00"))
+
+        first.amount_received = Decimal("4.00")
+        first.save()
+        second.refresh_from_db()
+        self.assertEqual(first.total_received, Decimal("4.00"))
+        self.assertEqual(second.total_received, Decimal("7.00"))
+        self.assertEqual(self._policy_total(), Decimal("7.00"))
+
+        first.delete()
+        second.refresh_from_db()
+        self.assertEqual(second.total_received, Decimal("3.00"))
+        self.assertEqual(self._policy_total(), Decimal("3.00"))
+
+    def test_edit_from_stale_copy(self):
+        receipt = PremiumReceipt.objects.create(policy=self.policy, amount_received=Decimal("2.00"))
+        stale = PremiumReceipt.objects.get(pk=receipt.pk)
+
+        receipt.amount_received = Decimal("5.00")
+        receipt.save()
+        stale.amount_received = Decimal("3.00")
+        stale.save()  # the delta is taken from the stored 5.00, not the 2.00 it loaded
+        self.assertEqual(stale.total_received, Decimal("3.00"))
+        self.assertEqual(self._policy_total(), Decimal("3.00"))
+
+    def test_reconciliation(self):
+        from receipts.services import fix_receipt_totals, receipt_total_mismatches
+
+        PremiumReceipt.objects.create(policy=self.policy, amount_received=Decimal("2.00"))
+        self.assertEqual(receipt_total_mismatches(), [])
+
+        Policy.objects.filter(pk=self.policy.pk).update(total_premium_received=Decimal("9.00"))
+        mismatches = receipt_total_mismatches()
+        self.assertEqual([m[0] for m in mismatches], [self.policy.pk])
+        fix_receipt_totals(mismatches)
+        self.assertEqual(self._policy_total(), Decimal("2.00"))
+
+
+class ReceiptBulkImportTest(ReceiptFixtures, TestCase):
+    """process_upload inserts in bulk and keeps per-row errors."""
+
+    def _upload(self, text):
+        import os
+        import tempfile
+        from types import SimpleNamespace
+
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return SimpleNamespace(file=SimpleNamespace(path=path))
+
+    def test_import_running_totals_and_errors(self):
+        from receipts.services import process_upload
+
+        contract_id = self.policy.contract_id.lower()
+        upload = self._upload(
+            "contract_id,amount\n"
+            f"{contract_id},1.00\n"
+            "P99999,1.00\n"
+            f"{contract_id},abc\n"
+            f"{contract_id},2.50\n"
+        )
+        errors = process_upload(upload)
+
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(errors[0].startswith("Row 3: Policy 'P99999' not found"))
+        self.assertTrue(errors[1].startswith("Row 4:"))
+
+        totals = list(PremiumReceipt.objects.order_by("receipt_number")
+                      .values_list("amount_received", "total_received"))
+        self.assertEqual(totals, [(Decimal("1.00"), Decimal("1.00")), (Decimal("2.50"), Decimal("3.50"))])
+        self.assertEqual(self._policy_total(), Decimal("3.50"))
+
+    def test_integrity_error_fails_only_the_offending_row(self):
+        from receipts.services import process_upload
+
+        PremiumReceipt.objects.create(policy=self.policy, amount_received=Decimal("1.00"))  # Rec000001
+        # a receipt number the sequence has not issued yet: the batch's second row collides
+        PremiumReceipt.objects.bulk_create([PremiumReceipt(
+            policy=self.policy, receipt_number="Rec000003", amount_received=Decimal("0.00"))])
+
+        upload = self._upload("contract_id,amount\n" + f"{self.policy.contract_id},1.00\n" * 3)
+        errors = process_upload(upload)
+
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith("Row 3:"))
+        self.assertEqual(PremiumReceipt.objects.count(), 4)
+        self.assertEqual(self._policy_total(), Decimal("3.00"))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from receipts.services import process_upload
+
+        def run(rows):
+            upload = self._upload("contract_id,amount\n" + f"{self.policy.contract_id},1.00\n" * rows)
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(process_upload(upload), [])
+            return len(ctx.captured_queries)
+
+        run(1)  # seeds the receipt number sequence
+        self.assertEqual(run(3), run(30))
+        self.assertEqual(self._policy_total(), Decimal("34.00"))
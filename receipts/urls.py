@@ -1,4 +1,5 @@
 from django.urls import path
+from common.views import JobProgressAPIView
 from .views import (
     PremiumReceiptListCreateAPIView,
     PremiumReceiptRetrieveUpdateDestroyAPIView,
@@ -16,6 +17,8 @@ urlpatterns = [
     path('uploads/', UploadListCreateAPIView.as_view(), name='upload-list-create'),
     path('uploads/<int:pk>/', UploadRetrieveUpdateDestroyAPIView.as_view(), name='upload-detail'),
     path('uploads/<int:pk>/approve/', ApproveUploadAPIView.as_view()),
+    path('uploads/<int:pk>/progress/', JobProgressAPIView.as_view(kind='receipts.upload'),
+         name='receipts-upload-progress'),
     path('uploads/files/', UploadListAllAPIView.as_view(), name='uploads-all'),
 
 